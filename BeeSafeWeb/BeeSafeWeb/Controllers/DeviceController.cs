@@ -113,4 +113,54 @@ public class DeviceController : Controller
 
         return Ok();
     }
+
+    /// <summary>
+    /// Stores several detection events in one request. Data must contain an
+    /// "events" array whose items have the same fields as the data of a
+    /// single detection event.
+    /// </summary>
+    [HttpPost("DetectionEvents")]
+    public async Task<IActionResult> DetectionEvents(RequestMessage requestMessage)
+    {
+        var result = await MessageIsValid(requestMessage);
+
+        if (result is not OkObjectResult okResult)
+        {
+            return result;
+        }
+
+        var device = (Device)okResult.Value;
+
+        if (requestMessage.MessageType != MessageType.DetectionEvent || requestMessage.Data is null)
+        {
+            return BadRequest();
+        }
+
+        List<DetectionEvent> detectionEvents = new();
+        try
+        {
+            JsonElement data = requestMessage.Data;
+            foreach (JsonElement item in data.GetProperty("events").EnumerateArray())
+            {
+                double timestamp = item.GetProperty("timestamp").GetDouble();
+                float hornetDirection = item.GetProperty("hornet_direction").GetSingle();
+
+                detectionEvents.Add(new DetectionEvent
+                {
+                    Timestamp = DateTimeOffset.FromUnixTimeMilliseconds((long)(timestamp * 1000)).DateTime,
+                    HornetDirection = hornetDirection,
+                    Device = device
+                });
+            }
+        }
+        catch (Exception)
+        {
+            return BadRequest("Invalid data format.");
+        }
+
+        // one SaveChanges, so the batch is stored in one transaction
+        await _detectionRepository.AddRangeAsync(detectionEvents);
+
+        return Ok(new { Count = detectionEvents.Count });
+    }
 }
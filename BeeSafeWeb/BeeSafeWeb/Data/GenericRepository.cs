@@ -33,6 +33,12 @@ public class GenericRepository<T> : IRepository<T> where T : class
         await _context.SaveChangesAsync();
     }
 
+    public async Task AddRangeAsync(IEnumerable<T> entities)
+    {
+        await _table.AddRangeAsync(entities);
+        await _context.SaveChangesAsync();
+    }
+
     public async Task UpdateAsync(T entity)
     {
         _table.Attach(entity);
@@ -10,6 +10,7 @@ public interface IRepository<T>
     Task<List<T>> GetAllAsync();
     Task<T?> GetByIdAsync(Guid id);
     Task AddAsync(T entity);
+    Task AddRangeAsync(IEnumerable<T> entities);
     Task UpdateAsync(T entity);
     Task DeleteAsync(Guid id);
     IQueryable<T> GetQueryable();
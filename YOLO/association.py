@@ -0,0 +1,226 @@
+"""
+Gated, sparse detection-to-track association for SORT.
+
+Instead of building the dense detections x trackers IoU matrix, candidate
+pairs are found with a uniform grid over the predicted track boxes. Only
+overlapping pairs become edges; the edges are split into connected
+components and each component is solved on its own small cost matrix.
+Most components at a hive entrance are a single detection/track pair and
+never reach the assignment solver.
+"""
+import numpy as np
+
+try:
+    import lap
+
+    def _solve(cost_matrix):
+        _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
+        return np.array([[y[i], i] for i in x if i >= 0], dtype=int).reshape(-1, 2)
+except ImportError:
+    _linear_sum_assignment = None
+
+    def _solve(cost_matrix):
+        # scipy.optimize is slow to import, so only load it the first time a
+        # frame actually needs the solver
+        global _linear_sum_assignment
+        if _linear_sum_assignment is None:
+            from scipy.optimize import linear_sum_assignment as _linear_sum_assignment
+        x, y = _linear_sum_assignment(cost_matrix)
+        return np.stack((x, y), axis=1).astype(int)
+
+# Below this many detection/track pairs the dense IoU matrix is cheaper than
+# building the grid.
+DENSE_PAIR_LIMIT = 4096
+
+
+def linear_assignment(cost_matrix):
+    """
+    Solves the assignment problem for ``cost_matrix`` and returns the
+    (row, column) pairs as a (K,2) int array. The solver (lap if installed,
+    scipy otherwise) is picked once, not on every call.
+    """
+    return _solve(cost_matrix)
+
+
+def iou_batch(bb_test, bb_gt):
+    """
+    From SORT: Computes IOU between two bboxes in the form [x1,y1,x2,y2]
+    """
+    bb_gt = np.expand_dims(bb_gt, 0)
+    bb_test = np.expand_dims(bb_test, 1)
+
+    xx1 = np.maximum(bb_test[..., 0], bb_gt[..., 0])
+    yy1 = np.maximum(bb_test[..., 1], bb_gt[..., 1])
+    xx2 = np.minimum(bb_test[..., 2], bb_gt[..., 2])
+    yy2 = np.minimum(bb_test[..., 3], bb_gt[..., 3])
+    w = np.maximum(0., xx2 - xx1)
+    h = np.maximum(0., yy2 - yy1)
+    wh = w * h
+    o = wh / ((bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1])
+        + (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1]) - wh)
+    return(o)
+
+
+def iou_pairs(bb_test, bb_gt):
+    """
+    IOU of the row-aligned box pairs bb_test[i], bb_gt[i].
+    """
+    xx1 = np.maximum(bb_test[:, 0], bb_gt[:, 0])
+    yy1 = np.maximum(bb_test[:, 1], bb_gt[:, 1])
+    xx2 = np.minimum(bb_test[:, 2], bb_gt[:, 2])
+    yy2 = np.minimum(bb_test[:, 3], bb_gt[:, 3])
+    wh = np.maximum(0., xx2 - xx1) * np.maximum(0., yy2 - yy1)
+    return wh / ((bb_test[:, 2] - bb_test[:, 0]) * (bb_test[:, 3] - bb_test[:, 1])
+        + (bb_gt[:, 2] - bb_gt[:, 0]) * (bb_gt[:, 3] - bb_gt[:, 1]) - wh)
+
+
+def _box_cells(boxes, cell, origin):
+    """
+    Returns (owner, key) arrays listing every grid cell each box covers.
+    """
+    lo = np.floor((boxes[:, :2] - origin) / cell).astype(np.int64)
+    hi = np.floor((boxes[:, 2:4] - origin) / cell).astype(np.int64)
+    hi = np.maximum(hi, lo)
+    nx = hi[:, 0] - lo[:, 0] + 1
+    ny = hi[:, 1] - lo[:, 1] + 1
+    counts = nx * ny
+    owner = np.repeat(np.arange(len(boxes)), counts)
+    # position of each entry within its box's block of cells
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = lo[owner, 0] + offset % nx[owner]
+    cy = lo[owner, 1] + offset // nx[owner]
+    return owner, (cx << 32) + cy
+
+
+def candidate_pairs(detections, trackers):
+    """
+    Returns the (det, trk) index pairs whose boxes share at least one grid
+    cell, i.e. every pair that can have a non-zero IoU.
+    """
+    n, m = len(detections), len(trackers)
+    if n * m <= DENSE_PAIR_LIMIT:
+        d, t = np.meshgrid(np.arange(n), np.arange(m), indexing='ij')
+        return d.ravel(), t.ravel()
+
+    sides = np.maximum(trackers[:, 2] - trackers[:, 0], trackers[:, 3] - trackers[:, 1])
+    cell = max(2. * float(np.median(sides)), 1.)
+    origin = np.minimum(detections[:, :2].min(0), trackers[:, :2].min(0))
+
+    trk_owner, trk_key = _box_cells(trackers, cell, origin)
+    det_owner, det_key = _box_cells(detections, cell, origin)
+
+    order = np.argsort(trk_key, kind='stable')
+    trk_owner, trk_key = trk_owner[order], trk_key[order]
+    start = np.searchsorted(trk_key, det_key, side='left')
+    stop = np.searchsorted(trk_key, det_key, side='right')
+    counts = stop - start
+    det_idx = np.repeat(det_owner, counts)
+    pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+    trk_idx = trk_owner[pos]
+
+    # a pair sharing several cells shows up several times
+    pair = np.unique(det_idx * m + trk_idx)
+    return pair // m, pair % m
+
+
+def connected_components(n, m, det_idx, trk_idx):
+    """
+    Labels the components of the bipartite graph with n detection nodes,
+    m tracker nodes and edges (det_idx[k], trk_idx[k]). Returns the label of
+    every edge.
+    """
+    label = np.arange(n + m)
+    u = det_idx
+    v = trk_idx + n
+    while True:
+        low = np.minimum(label[u], label[v])
+        new = label.copy()
+        np.minimum.at(new, u, low)
+        np.minimum.at(new, v, low)
+        new = new[new]
+        if np.array_equal(new, label):
+            return label[u]
+        label = new
+
+
+def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3, det_features=None,
+                                     trk_features=None, appearance_weight=0.):
+    """
+    Assigns detections to tracked object (both represented as bounding boxes)
+
+    With appearance features (unit-length rows, e.g. colour histograms) for
+    the detections and the trackers and an ``appearance_weight`` above 0,
+    the pairs that overlap by at least ``iou_threshold`` are scored by
+    (1 - weight) * IoU + weight * feature similarity, so where boxes are
+    ambiguous the one that looks alike wins. The overlap still decides which
+    pairs can match at all.
+
+    Returns 3 lists of matches, unmatched_detections and unmatched_trackers
+    """
+    n, m = len(detections), len(trackers)
+    if(m==0):
+        return np.empty((0,2),dtype=int), np.arange(n), np.empty((0,5),dtype=int)
+
+    det_idx, trk_idx = candidate_pairs(detections, trackers)
+    iou = iou_pairs(detections[det_idx], trackers[trk_idx])
+    edge = iou > 0.
+    det_idx, trk_idx, iou = det_idx[edge], trk_idx[edge], iou[edge]
+    score = iou
+    if det_features is not None and trk_features is not None and appearance_weight > 0:
+        gate = iou >= iou_threshold
+        det_idx, trk_idx, iou = det_idx[gate], trk_idx[gate], iou[gate]
+        similarity = np.einsum('ij,ij->i', det_features[det_idx], trk_features[trk_idx])
+        score = (1. - appearance_weight) * iou + appearance_weight * similarity
+
+    above = iou > iou_threshold
+    one_to_one = (above.any()
+                  and np.bincount(det_idx[above], minlength=n).max() == 1
+                  and np.bincount(trk_idx[above], minlength=m).max() == 1)
+    if one_to_one:
+        matched = np.stack((det_idx[above], trk_idx[above]), axis=1)
+    else:
+        matched = _solve_components(n, m, det_idx, trk_idx, score)
+
+    if len(matched):
+        matched = matched[np.argsort(matched[:, 0], kind='stable')]
+        # the solver may pair up non-overlapping boxes, those have IoU 0
+        key = det_idx * m + trk_idx
+        order = np.argsort(key)
+        key, edge_iou = key[order], iou[order]
+        query = matched[:, 0] * m + matched[:, 1]
+        where = np.minimum(np.searchsorted(key, query), max(len(key) - 1, 0))
+        pair_iou = np.where((len(key) > 0) & (key[where] == query), edge_iou[where], 0.)
+        # filter out matched with low IOU
+        matched = matched[pair_iou >= iou_threshold]
+
+    matches = matched.reshape(-1, 2).astype(int)
+    unmatched_detections = np.setdiff1d(np.arange(n), matches[:, 0])
+    unmatched_trackers = np.setdiff1d(np.arange(m), matches[:, 1])
+    return matches, unmatched_detections, unmatched_trackers
+
+
+def _solve_components(n, m, det_idx, trk_idx, score):
+    """
+    Maximises the total score (the IoU, or its blend with appearance)
+    separately within each connected component.
+    """
+    if len(score) == 0:
+        return np.empty((0, 2), dtype=int)
+    comp = connected_components(n, m, det_idx, trk_idx)
+    order = np.argsort(comp, kind='stable')
+    comp, det_idx, trk_idx, score = comp[order], det_idx[order], trk_idx[order], score[order]
+    bounds = np.flatnonzero(np.diff(comp)) + 1
+    starts = np.concatenate(([0], bounds))
+    stops = np.concatenate((bounds, [len(comp)]))
+
+    # a component with a single edge is a lone det/track pair
+    single = (stops - starts) == 1
+    matched = [np.stack((det_idx[starts[single]], trk_idx[starts[single]]), axis=1)]
+    for s, e in zip(starts[~single], stops[~single]):
+        dets, d_local = np.unique(det_idx[s:e], return_inverse=True)
+        trks, t_local = np.unique(trk_idx[s:e], return_inverse=True)
+        cost = np.zeros((len(dets), len(trks)))
+        cost[d_local, t_local] = -score[s:e]
+        block = linear_assignment(cost)
+        matched.append(np.stack((dets[block[:, 0]], trks[block[:, 1]]), axis=1))
+    return np.concatenate(matched, axis=0)
@@ -0,0 +1,181 @@
+# Estimates the direction a hornet flies off in from the whole of its
+# track, instead of from its position in a single frame. All live tracks
+# are handled at once with array operations, so the cost per frame does
+# not depend on a Python loop over tracks.
+import warnings
+
+import numpy as np
+
+# Scale of the median absolute deviation to a normal standard deviation
+MAD_SCALE = 1.4826
+
+
+def kalman_velocities(tracker, ids):
+    """
+    Returns the Kalman velocity (pixels per frame of the box centre) of the
+    tracks with output IDs ``ids`` as an (m,2) array, and its variance as an
+    (m,) array. Works for Sort and BatchSort; the tracks must be alive.
+    """
+    ids = np.asarray(ids, dtype=int) - 1
+    if hasattr(tracker, 'bank'):
+        bank = tracker.bank
+        # the bank keeps tracks in creation order, so its ids are sorted
+        rows = np.searchsorted(bank.ids[:len(bank)], ids)
+        x = bank.x[rows]
+        P = bank.P[rows]
+    else:
+        by_id = {trk.id: trk for trk in tracker.trackers}
+        x = np.array([by_id[i].kf.x[:, 0] for i in ids]).reshape(-1, 7)
+        P = np.array([by_id[i].kf.P for i in ids]).reshape(-1, 7, 7)
+    return x[:, 4:6], (P[:, 4, 4] + P[:, 5, 5]) / 2.
+
+
+def compass_bearing(bearing, camera_direction):
+    """
+    Converts an image bearing (degrees counterclockwise from the image's
+    x axis, with up positive) to a compass bearing, for a camera looking
+    down with the top of the image facing ``camera_direction`` degrees.
+    """
+    return (camera_direction + 90. - np.asarray(bearing)) % 360.
+
+
+class BearingEstimator(object):
+    """
+    Keeps the last ``history`` box centres of every track seen in the
+    tracker output and the latest Kalman velocity, in stacked arrays, and
+    turns them into one flight bearing per track.
+
+    The bearing blends a Theil-Sen fit of the recent centres (the median of
+    the velocities between all pairs of them, so a few bad boxes do not
+    move it) with the Kalman velocity, each weighted by its inverse
+    variance. The confidence in [0, 1] is how consistently the pairs point
+    the same way, times how far the hornet moved compared to its size.
+    """
+    def __init__(self, tracker, history=10, capacity=64):
+        """
+        :param tracker: The Sort or BatchSort instance whose output is observed.
+        :param int history: The number of recent centres kept per track.
+        :param int capacity: Initial number of track rows to allocate.
+        """
+        self.tracker = tracker
+        self.history = history
+        # frames since the start, from the steps given to the tracker
+        self.frame = 0.
+        self.rows = {}
+        self._free = []
+        self._pairs = np.triu_indices(history, 1)
+        self.capacity = 0
+        self._allocate(max(int(capacity), 1))
+
+    def _allocate(self, capacity):
+        old = self.capacity
+        arrays = {
+            'centres': np.zeros((capacity, self.history, 2)),
+            'frames': np.zeros((capacity, self.history)),
+            'count': np.zeros(capacity, dtype=np.int64),
+            'size_sum': np.zeros(capacity),
+            'kalman_v': np.zeros((capacity, 2)),
+            'kalman_var': np.zeros(capacity),
+        }
+        for name, arr in arrays.items():
+            if old:
+                arr[:old] = getattr(self, name)
+            setattr(self, name, arr)
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def _rows_for(self, ids):
+        rows = np.empty(len(ids), dtype=np.int64)
+        for k, track_id in enumerate(ids):
+            row = self.rows.get(track_id)
+            if row is None:
+                if not self._free:
+                    self._allocate(self.capacity * 2)
+                row = self.rows[track_id] = self._free.pop()
+                self.count[row] = 0
+                self.size_sum[row] = 0.
+            rows[k] = row
+        return rows
+
+    def observe(self, tracked, dt=1.):
+        """
+        Records one frame of tracker output [[x1,y1,x2,y2,id],...]. Call it
+        right after every tracker update, with empty output too, and with
+        the same ``dt``, so the slopes are in pixels per frame like the
+        Kalman velocities.
+        """
+        self.advance(dt)
+        if len(tracked) == 0:
+            return
+        ids = tracked[:, 4].astype(int)
+        rows = self._rows_for(ids)
+        slots = self.count[rows] % self.history
+        self.centres[rows, slots] = (tracked[:, 0:2] + tracked[:, 2:4]) / 2.
+        self.frames[rows, slots] = self.frame
+        self.count[rows] += 1
+        self.size_sum[rows] += np.hypot(tracked[:, 2] - tracked[:, 0], tracked[:, 3] - tracked[:, 1])
+        self.kalman_v[rows], self.kalman_var[rows] = kalman_velocities(self.tracker, ids)
+
+    def advance(self, dt=1.):
+        """
+        Counts ``dt`` frames the tracker only predicted over (Sort.predict).
+        """
+        self.frame += dt
+
+    def estimate(self, track_ids):
+        """
+        Returns the bearing in degrees (see compass_bearing) and the
+        confidence of each of ``track_ids``, as two (m,) arrays. Tracks
+        never observed get NaN and 0.
+        """
+        m = len(track_ids)
+        bearing = np.full(m, np.nan)
+        confidence = np.zeros(m)
+        known = np.array([i in self.rows for i in track_ids], dtype=bool)
+        if not known.any():
+            return bearing, confidence
+        rows = np.array([self.rows[i] for i in np.asarray(track_ids)[known]], dtype=np.int64)
+
+        velocity = self.kalman_v[rows].copy()
+        agreement = np.zeros(len(rows))
+        travel = np.zeros(len(rows))
+        count = np.minimum(self.count[rows], self.history)
+        fit = count >= 2
+        if fit.any():
+            r = rows[fit]
+            i, j = self._pairs
+            valid = (i < count[fit, None]) & (j < count[fit, None])
+            dt = self.frames[r][:, j] - self.frames[r][:, i]
+            dt[~valid] = np.nan
+            slopes = (self.centres[r][:, j] - self.centres[r][:, i]) / dt[:, :, None]
+            history_v = np.nanmedian(slopes, axis=1)
+            spread = MAD_SCALE * np.nanmedian(np.abs(slopes - history_v[:, None, :]), axis=1)
+            history_var = np.maximum((spread ** 2).mean(axis=1) / count[fit], 1e-6)
+            kalman_var = np.maximum(self.kalman_var[r], 1e-6)
+            w = kalman_var / (kalman_var + history_var)
+            velocity[fit] = w[:, None] * history_v + (1. - w[:, None]) * velocity[fit]
+
+            # how consistently all pairs point the same way
+            speed = np.hypot(slopes[:, :, 0], slopes[:, :, 1])
+            units = slopes / np.where(speed > 0, speed, np.nan)[:, :, None]
+            with warnings.catch_warnings():
+                # a hornet that did not move at all has no direction
+                warnings.simplefilter('ignore', RuntimeWarning)
+                agreement[fit] = np.hypot(*np.nanmean(units, axis=1).T)
+            frames = np.where(np.arange(self.history) < count[fit, None], self.frames[r], -1)
+            first = np.where(frames >= 0, frames, np.inf).min(axis=1)
+            travel[fit] = np.hypot(*velocity[fit].T) * (frames.max(axis=1) - first)
+
+        size = self.size_sum[rows] / np.maximum(self.count[rows], 1)
+        bearing[known] = np.degrees(np.arctan2(-velocity[:, 1], velocity[:, 0])) % 360.
+        confidence[known] = np.nan_to_num(agreement) * travel / (travel + size)
+        return bearing, confidence
+
+    def release(self, track_ids):
+        """
+        Drops the state of tracks that ended.
+        """
+        for track_id in track_ids:
+            row = self.rows.pop(track_id, None)
+            if row is not None:
+                self._free.append(row)
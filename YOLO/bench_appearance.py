@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+#
+# Measures what appearance features buy the tracker, on synthetic flights
+# where every hornet has a colour histogram of its own:
+#   - each hornet's colour mixes one colour all hornets share with a colour
+#     of its own, --distinct of the way (0: all look the same)
+#   - each detection's feature is the histogram of --pixels pixels drawn
+#     from its hornet's colour, like the 16x16 patches of color_reid; false
+#     positives draw from a random colour
+# Every --weights appearance weight runs over the same detections; weight 0
+# is plain IoU association. Reports MOTA, IDF1, ID switches and the tracker
+# time per frame.
+#
+# The defaults are a crowded entrance (25 hornets in 640x384) with 4 px box
+# noise, where boxes often overlap more than one track and appearance has
+# something to decide; with few hornets or exact boxes IoU alone never
+# switches and every weight gives the same result. BatchSort, seed 0:
+#   weight  MOTA   IDF1   ID switches
+#   0       0.645  0.764  164
+#   0.5     0.650  0.771  133
+#   0.7     0.651  0.776  110
+#
+# usage: bench_appearance.py [--frames 1500] [--density 25] [--distinct 0.5] [--weights 0 0.3 0.5 0.7]
+#                            [--width 640 --height 384] [--noise 4] [--tracker batch]
+
+import argparse
+import time
+
+import numpy as np
+
+from association import iou_batch
+from mot_bench import synthetic_sequence, FrameIndex, mot_to_xyxy, clear_mot, TRACKERS
+
+
+def detection_features(det, gt, dim, distinct, pixels, rng):
+    """
+    Returns a feature row per detection row: the square root of the
+    normalised histogram of ``pixels`` draws from the colour of the hornet
+    it overlaps most, or from a random colour for false positives.
+    """
+    common = rng.dirichlet(np.full(dim, 0.3))
+    colours = {}
+    det_index, gt_index = FrameIndex(det), FrameIndex(gt)
+    features = np.empty((len(det), dim))
+    start = 0
+    for frame in range(1, int(det[:, 0].max()) + 1):
+        rows, truth = det_index[frame], gt_index[frame]
+        owner = np.full(len(rows), -1)
+        if len(rows) and len(truth):
+            iou = iou_batch(mot_to_xyxy(rows), mot_to_xyxy(truth))
+            best = iou.argmax(axis=1)
+            owner = np.where(iou[np.arange(len(rows)), best] > 0.3, truth[best, 1].astype(int), -1)
+        for k, hornet in enumerate(owner):
+            if hornet < 0:
+                colour = rng.dirichlet(np.full(dim, 0.3))
+            else:
+                if hornet not in colours:
+                    colours[hornet] = (1 - distinct) * common + distinct * rng.dirichlet(np.full(dim, 0.3))
+                colour = colours[hornet]
+            features[start + k] = np.sqrt(rng.multinomial(pixels, colour) / pixels)
+        start += len(rows)
+    return features
+
+
+def run(tracker, det, features):
+    """
+    Tracks the sequence and returns the output as MOT rows and the tracker
+    seconds per frame.
+    """
+    # synthetic detections come in frame order, as do their features
+    index = FrameIndex(det)
+    out_rows = []
+    seconds = 0.
+    start_row = 0
+    n_frames = int(det[:, 0].max())
+    for frame in range(1, n_frames + 1):
+        rows = index[frame]
+        boxes = np.empty((len(rows), 5))
+        boxes[:, :4] = mot_to_xyxy(rows)
+        boxes[:, 4] = rows[:, 6]
+        frame_features = None if features is None else features[start_row:start_row + len(rows)]
+        start_row += len(rows)
+        start = time.perf_counter()
+        tracks = tracker.update(boxes, features=frame_features)
+        seconds += time.perf_counter() - start
+        if len(tracks):
+            wh = tracks[:, 2:4] - tracks[:, 0:2]
+            out_rows.append(np.column_stack([np.full(len(tracks), frame), tracks[:, 4], tracks[:, 0:2], wh]))
+    return (np.concatenate(out_rows) if out_rows else np.empty((0, 6))), seconds / n_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Appearance association benchmark")
+    parser.add_argument("--frames", type=int, default=1500)
+    parser.add_argument("--density", type=float, default=25)
+    parser.add_argument("--speed", type=float, default=12, help="Mean hornet speed in pixels per frame.")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=384)
+    parser.add_argument("--noise", type=float, default=4)
+    parser.add_argument("--miss-rate", type=float, default=0.1)
+    parser.add_argument("--false-positives", type=float, default=0.5)
+    parser.add_argument("--distinct", type=float, default=0.5, help="How far the hornets' colours differ, 0-1.")
+    parser.add_argument("--pixels", type=int, default=256, help="Pixels per detection histogram.")
+    parser.add_argument("--dim", type=int, default=48, help="Histogram bins.")
+    parser.add_argument("--weights", type=float, nargs="+", default=[0, 0.3, 0.5, 0.7])
+    parser.add_argument("--tracker", choices=sorted(TRACKERS), default='batch')
+    parser.add_argument("--max-age", type=int, default=10)
+    parser.add_argument("--min-hits", type=int, default=3)
+    parser.add_argument("--iou-threshold", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    det, gt = synthetic_sequence(args.frames, args.density, args.width, args.height, miss_rate=args.miss_rate,
+                                 false_positives=args.false_positives, noise=args.noise, seed=args.seed,
+                                 mean_speed=args.speed)
+    features = detection_features(det, gt, args.dim, args.distinct, args.pixels, rng)
+    gt_index = FrameIndex(gt)
+
+    print(f"{args.frames} frames, {len(gt)} hornet boxes, {len(np.unique(gt[:, 1]))} hornets, "
+          f"distinct {args.distinct:g}, tracker {args.tracker}")
+    print(f"{'weight':>6} {'MOTA':>7} {'IDF1':>7} {'ID sw':>6} {'track ms':>9}")
+    # untimed: the first run also pays for importing the assignment solver
+    run(TRACKERS[args.tracker](max_age=args.max_age, min_hits=args.min_hits), det, None)
+    for weight in args.weights:
+        tracker = TRACKERS[args.tracker](max_age=args.max_age, min_hits=args.min_hits,
+                                         iou_threshold=args.iou_threshold, appearance_weight=weight)
+        hyp, seconds = run(tracker, det, features if weight > 0 else None)
+        metrics = clear_mot(gt_index, FrameIndex(hyp))
+        print(f"{weight:6.2f} {metrics['mota']:7.3f} {metrics['idf1']:7.3f} {metrics['id_switches']:6d} "
+              f"{seconds * 1000:9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the departure bearing of tracks on synthetic flights, against
+# the true direction the hornet flew in over its last frames. Compares the
+# BearingEstimator with the last Kalman velocity alone and with the line
+# from the first to the last box, and reports the cost per frame.
+#
+# usage: bench_bearing.py [--frames 3000] [--density 5] [--noise 2] [--miss-rate 0.1]
+
+import argparse
+import time
+
+import numpy as np
+
+from mot_bench import synthetic_sequence, FrameIndex, mot_to_xyxy
+from sort_core import BatchSort
+from track_lifecycle import TrackLifecycle, EXIT
+from association import iou_batch
+
+
+def angle_error(a, b):
+    return np.abs((np.asarray(a) - np.asarray(b) + 180.) % 360. - 180.)
+
+
+def image_bearing(dx, dy):
+    return np.degrees(np.arctan2(-dy, dx)) % 360.
+
+
+def true_bearings(gt, events, window):
+    """
+    Matches every exit to the ground truth hornet it covered at its last
+    frame and returns that hornet's direction over its last ``window``
+    frames of the track.
+    """
+    frames = FrameIndex(gt)
+    truth = np.full(len(events), np.nan)
+    for k, event in enumerate(events):
+        summary = event['summary']
+        last = int(summary['last_seen'])
+        rows = frames[last]
+        if len(rows) == 0:
+            continue
+        iou = iou_batch(np.array([summary['last_box']]), mot_to_xyxy(rows)[:, :4])[0]
+        if iou.max() < 0.3:
+            continue
+        hornet = gt[gt[:, 1] == rows[iou.argmax(), 1]]
+        path = hornet[(hornet[:, 0] <= last) & (hornet[:, 0] > last - window)]
+        if len(path) < 2:
+            continue
+        centres = path[:, 2:4] + path[:, 4:6] / 2.
+        dx, dy = centres[-1] - centres[0]
+        truth[k] = image_bearing(dx, dy)
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Departure bearing benchmark")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--density", type=float, default=5)
+    parser.add_argument("--noise", type=float, default=2., help="Box noise in pixels.")
+    parser.add_argument("--miss-rate", type=float, default=0.1)
+    parser.add_argument("--window", type=int, default=10, help="Frames the true direction is measured over.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    det, gt = synthetic_sequence(args.frames, args.density, miss_rate=args.miss_rate,
+                                 noise=args.noise, seed=args.seed)
+    frames = FrameIndex(det)
+    lifecycle = TrackLifecycle(BatchSort(max_age=10, min_hits=3, iou_threshold=0.3), bearings=True)
+    estimator = lifecycle.bearings
+    estimate = estimator.estimate
+
+    kalman, cost = {}, []
+
+    def recording_estimate(track_ids):
+        # the Kalman velocity alone, as it was at the last frame of the track
+        for track_id in track_ids:
+            kalman[track_id] = image_bearing(*estimator.kalman_v[estimator.rows[track_id]])
+        return estimate(track_ids)
+
+    estimator.estimate = recording_estimate
+
+    exits = []
+    for frame in range(1, len(frames) + 1):
+        t0 = time.perf_counter()
+        tracked, events = lifecycle.update(mot_to_xyxy(frames[frame]), float(frame))
+        cost.append(time.perf_counter() - t0)
+        exits += [e for e in events if e['type'] == EXIT]
+    exits += lifecycle.close()
+
+    truth = true_bearings(gt, exits, args.window)
+    matched = ~np.isnan(truth)
+    summaries = [e['summary'] for e in exits]
+    estimated = np.array([s['bearing'] for s in summaries])
+    confidence = np.array([s['bearing_confidence'] for s in summaries])
+    last_kalman = np.array([kalman[e['track_id']] for e in exits])
+    first_last = np.array([image_bearing(s['last_box'][0] + s['last_box'][2] - s['first_box'][0] - s['first_box'][2],
+                                         s['last_box'][1] + s['last_box'][3] - s['first_box'][1] - s['first_box'][3])
+                           for s in summaries])
+
+    print(f"{args.frames} frames, {len(exits)} tracks, {matched.sum()} matched to a hornet")
+    print(f"{'method':22} {'median err':>11} {'p90 err':>9}")
+    confident = matched & (confidence >= 0.5)
+    for name, values, mask in (('first to last box', first_last, matched),
+                               ('last Kalman velocity', last_kalman, matched),
+                               ('estimator', estimated, matched),
+                               ('estimator, conf>=0.5', estimated, confident)):
+        err = angle_error(values[mask], truth[mask])
+        print(f"{name:22} {np.median(err):10.1f}° {np.percentile(err, 90):8.1f}°  ({mask.sum()} tracks)")
+    print(f"tracker+lifecycle+bearing per frame: p50 {np.median(cost) * 1000:.3f} ms, "
+          f"p99 {np.percentile(cost, 99) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#
+# Benchmarks saving detection events against a local SQLite stand-in for
+# Azure SQL, with a simulated network round trip per call:
+#   - direct: what save_to_database did, a new connection for a random
+#             KnownHornet lookup and another for the INSERT, per event
+#   - writer: DetectionWriter, one connection, cached KnownHornet ids and
+#             batched inserts from a background thread
+# Reports inserts per second and the time the frame loop spends saving
+# (p50/p99 per frame).
+#
+# usage: bench_db_writer.py [--frames 300] [--hornets 2] [--latency-ms 20] [--connect-ms 150]
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from detection_writer import DetectionWriter, INSERT_QUERY
+
+
+class SlowCursor:
+    """A cursor that waits one round trip per call to the server."""
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self.latency = latency
+        self.fast_executemany = False
+
+    def execute(self, query, params=()):
+        time.sleep(self.latency)
+        self._cursor.execute(query, params)
+
+    def executemany(self, query, rows):
+        # one round trip with fast_executemany, one per row without
+        time.sleep(self.latency if self.fast_executemany else self.latency * len(rows))
+        self._cursor.executemany(query, rows)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+
+class SlowConnection:
+    """A sqlite3 connection with the dbo schema and simulated latency."""
+    def __init__(self, path, latency, connect_latency):
+        time.sleep(connect_latency)
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._conn.execute("ATTACH DATABASE ? AS dbo", (path,))
+        self.latency = latency
+
+    def cursor(self):
+        return SlowCursor(self._conn.cursor(), self.latency)
+
+    def commit(self):
+        time.sleep(self.latency)
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def create_database(path, known_hornets):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ? AS dbo", (path,))
+    conn.execute("CREATE TABLE dbo.KnownHornet (Id TEXT PRIMARY KEY)")
+    conn.execute("""
+        CREATE TABLE dbo.DetectionEvent (
+            Id TEXT PRIMARY KEY, Timestamp TEXT, HornetDirection REAL, FirstDetection TEXT,
+            SecondDetection TEXT, IsManual INTEGER, HornetCount INTEGER, DeviceId TEXT,
+            KnownHornetId TEXT)""")
+    conn.executemany("INSERT INTO dbo.KnownHornet VALUES (?)", [(str(uuid.uuid4()),) for _ in range(known_hornets)])
+    conn.commit()
+    conn.close()
+
+
+def count_events(path):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM DetectionEvent").fetchone()[0]
+    conn.close()
+    return count
+
+
+def save_direct(connect, device_id, timestamp, direction, hornet_count):
+    # the old get_known_hornet_id() and save_to_database(), SQLite syntax
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Id FROM dbo.KnownHornet ORDER BY RANDOM() LIMIT 1")
+    known_hornet_id = cursor.fetchone()[0]
+    conn.close()
+
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(INSERT_QUERY, (str(uuid.uuid4()), timestamp, direction, timestamp, None,
+                                  False, hornet_count, device_id, known_hornet_id))
+    conn.commit()
+    conn.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection event database writer benchmark")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--hornets", type=float, default=2, help="Mean events saved per frame.")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated round trip per call.")
+    parser.add_argument("--connect-ms", type=float, default=150, help="Simulated connection setup.")
+    parser.add_argument("--known-hornets", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    counts = [min(10, int(rng.expovariate(1 / args.hornets))) for _ in range(args.frames)]
+    events = sum(counts)
+    latency, connect_latency = args.latency_ms / 1000, args.connect_ms / 1000
+
+    print(f"{args.frames} frames, {events} events, {args.latency_ms:g} ms round trip, "
+          f"{args.connect_ms:g} ms connect")
+    print(f"{'mode':8} {'inserts/s':>10} {'frame p50 ms':>13} {'frame p99 ms':>13} {'total s':>8}")
+    for mode in ('direct', 'writer'):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "beesafe.db")
+            create_database(path, args.known_hornets)
+
+            def connect():
+                return SlowConnection(path, latency, connect_latency)
+
+            writer = DetectionWriter(connect, "bench", batch_size=args.batch_size) if mode == 'writer' else None
+            frame_times = []
+            start = time.perf_counter()
+            for count in counts:
+                t0 = time.perf_counter()
+                for _ in range(count):
+                    timestamp = datetime.now().isoformat()
+                    if writer is None:
+                        save_direct(connect, "bench", timestamp, 90.0, count)
+                    else:
+                        writer.save(timestamp, timestamp, None, 90.0, count)
+                frame_times.append(time.perf_counter() - t0)
+            if writer is not None:
+                writer.close()
+            elapsed = time.perf_counter() - start
+
+            saved = count_events(path)
+            assert saved == events, f"{mode}: {saved} of {events} events saved"
+            print(f"{mode:8} {saved / elapsed:10.1f} {percentile(frame_times, 50) * 1000:13.3f} "
+                  f"{percentile(frame_times, 99) * 1000:13.3f} {elapsed:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Import-time and RSS regression check for the tracker core.
+
+Every module is imported in a fresh interpreter, a few times, and the median
+cost on top of a bare ``import numpy`` is compared with a budget. The script
+exits with status 1 when sort_core goes over budget or pulls in one of the
+heavy modules the device should never load just to track.
+
+Usage: python bench_import.py [--budget-ms 100] [--budget-mb 10] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# modules that must not be loaded by importing the tracker core
+FORBIDDEN = ['matplotlib', 'skimage', 'filterpy', 'scipy.stats', 'torch', 'cv2', 'ultralytics']
+
+CHILD = '''
+import json, resource, sys, time
+sys.path.insert(0, {here!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'rss_kb': rss,
+                   'loaded': [m for m in {forbidden!r} if m in sys.modules]}}))
+'''
+
+
+def measure(module, repeat):
+    runs = []
+    for _ in range(repeat):
+        code = CHILD.format(here=HERE, module=module, forbidden=FORBIDDEN)
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout
+        runs.append(json.loads(out))
+    return {
+        'seconds': statistics.median(r['seconds'] for r in runs),
+        'rss_mb': statistics.median(r['rss_kb'] for r in runs) / 1024.,
+        'loaded': runs[0]['loaded'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tracker import budget')
+    parser.add_argument('--budget-ms', type=float, default=100.,
+                        help='Allowed import time of sort_core on top of numpy.')
+    parser.add_argument('--budget-mb', type=float, default=10.,
+                        help='Allowed peak RSS of sort_core on top of numpy.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modules', nargs='+', default=['sort_core', 'sort'],
+                        help='Modules to report next to the numpy baseline.')
+    args = parser.parse_args()
+
+    base = measure('numpy', args.repeat)
+    print('%-12s %10s %10s  %s' % ('module', '+ms', '+RSS MB', 'heavy modules loaded'))
+    print('%-12s %10.1f %10.1f' % ('numpy', base['seconds'] * 1e3, base['rss_mb']))
+    failed = False
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        extra_ms = (result['seconds'] - base['seconds']) * 1e3
+        extra_mb = result['rss_mb'] - base['rss_mb']
+        print('%-12s %10.1f %10.1f  %s' % (module, extra_ms, extra_mb, ', '.join(result['loaded']) or '-'))
+        if module == 'sort_core':
+            if result['loaded']:
+                print('sort_core loads %s' % ', '.join(result['loaded']))
+                failed = True
+            if extra_ms > args.budget_ms:
+                print('sort_core import takes %.1f ms over numpy, budget is %.1f ms' % (extra_ms, args.budget_ms))
+                failed = True
+            if extra_mb > args.budget_mb:
+                print('sort_core import adds %.1f MB RSS over numpy, budget is %.1f MB' % (extra_mb, args.budget_mb))
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
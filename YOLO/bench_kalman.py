@@ -0,0 +1,58 @@
+"""
+Compares the per-track filterpy Kalman path (Sort) with the batched
+KalmanBank path (BatchSort) at different numbers of live tracks.
+
+Usage: python bench_kalman.py [--tracks 10 100 1000] [--frames 200]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from sort_core import Sort, BatchSort
+
+
+def make_sequence(n_tracks, n_frames, seed=0):
+    """Non-overlapping boxes on a grid, each moving with a small constant velocity."""
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_tracks)))
+    grid = np.stack(np.meshgrid(np.arange(side), np.arange(side)), -1).reshape(-1, 2)[:n_tracks]
+    start = grid * 100.0
+    velocity = rng.uniform(-1, 1, (n_tracks, 2))
+    frames = []
+    for f in range(n_frames):
+        centre = start + velocity * f
+        dets = np.empty((n_tracks, 5))
+        dets[:, :2] = centre - 15
+        dets[:, 2:4] = centre + 15
+        dets[:, 4] = 0.9
+        frames.append(dets)
+    return frames
+
+
+def run(tracker, frames, warmup):
+    for dets in frames[:warmup]:
+        tracker.update(dets)
+    start = time.perf_counter()
+    for dets in frames[warmup:]:
+        tracker.update(dets)
+    return (time.perf_counter() - start) / (len(frames) - warmup)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kalman backend benchmark')
+    parser.add_argument('--tracks', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    args = parser.parse_args()
+
+    print('%8s %14s %14s %8s' % ('tracks', 'filterpy ms', 'batched ms', 'speedup'))
+    for n in args.tracks:
+        frames = make_sequence(n, args.frames + args.warmup)
+        ref = run(Sort(max_age=40, min_hits=3, iou_threshold=0.25), frames, args.warmup)
+        batched = run(BatchSort(max_age=40, min_hits=3, iou_threshold=0.25), frames, args.warmup)
+        print('%8d %14.3f %14.3f %7.1fx' % (n, ref * 1e3, batched * 1e3, ref / batched))
+
+
+if __name__ == '__main__':
+    main()
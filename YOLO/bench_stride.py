@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Benchmarks running the detector every k frames and only predicting the
+# tracks in between, on synthetic flights with timestamped frames:
+#   - k=N:      a fixed stride of N frames
+#   - adaptive: StrideScheduler, the stride following the live tracks,
+#               as for a video file, which waits for the detector
+#   - live:     the same with the detector held to --load of the frame
+#               time, as for a camera; a slow detector lengthens the stride
+# Frames can arrive with jitter on their timestamps or be dropped, which
+# the tracker steps over with the time since its last step. Reports
+# tracking quality against the ground truth (MOTA, IDF1, ID switches),
+# the share of frames the detector ran on, and the frame rate one core
+# could hold for a detector taking --detector-ms per run.
+#
+# usage: bench_stride.py [--frames 3000] [--density 3] [--speed 12] [--strides 1 2 3 4 6 8]
+#                        [--max-stride 2] [--detector-ms 90] [--load 0.9] [--jitter 0.002] [--drop-rate 0.02]
+
+import argparse
+import time
+
+import numpy as np
+
+from mot_bench import synthetic_sequence, FrameIndex, mot_to_xyxy, clear_mot
+from sort_core import BatchSort
+from stride_scheduler import StrideScheduler
+
+
+def frame_times(n_frames, fps, jitter, drop_rate, rng):
+    """
+    Returns the numbers of the frames that arrive and their timestamps in
+    seconds, with normal ``jitter`` seconds and ``drop_rate`` of the frames
+    lost.
+    """
+    numbers = np.arange(1, n_frames + 1)
+    numbers = numbers[rng.random(n_frames) >= drop_rate]
+    times = (numbers - 1) / fps + rng.normal(0, jitter, len(numbers))
+    return numbers, np.maximum.accumulate(times)
+
+
+def run(det, numbers, times, scheduler_params, args):
+    """
+    Tracks the arriving frames, detecting on the frames the scheduler picks.
+    Returns the tracker output as MOT rows, the share of frames detected on,
+    the average stride and the tracker seconds per frame.
+    """
+    tracker = BatchSort(max_age=args.max_age, min_hits=args.min_hits, iou_threshold=args.iou_threshold)
+    scheduler = StrideScheduler(tracker, fps=args.fps, **scheduler_params)
+    adaptive = scheduler_params['min_stride'] != scheduler_params['max_stride']
+    out_rows = []
+    seconds = 0.
+    for number, timestamp in zip(numbers, times):
+        start = time.perf_counter()
+        detect, dt = scheduler.next_frame(timestamp)
+        if detect:
+            rows = det[number]
+            boxes = np.empty((len(rows), 5))
+            boxes[:, :4] = mot_to_xyxy(rows)
+            boxes[:, 4] = rows[:, 6]
+            tracks = tracker.update(boxes, dt)
+            scheduler.record(args.detector_ms / 1000. if adaptive else None)
+        else:
+            tracks = tracker.predict(dt)
+        seconds += time.perf_counter() - start
+        if len(tracks):
+            wh = tracks[:, 2:4] - tracks[:, 0:2]
+            out_rows.append(np.column_stack([np.full(len(tracks), number), tracks[:, 4], tracks[:, 0:2], wh]))
+    stats = scheduler.stats()
+    hyp = np.concatenate(out_rows) if out_rows else np.empty((0, 6))
+    return hyp, stats['detect_rate'], stats['avg_stride'], seconds / max(len(numbers), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detector stride benchmark")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--density", type=float, default=3)
+    parser.add_argument("--speed", type=float, default=12, help="Mean hornet speed in pixels per frame.")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--noise", type=float, default=2)
+    parser.add_argument("--miss-rate", type=float, default=0.1)
+    parser.add_argument("--false-positives", type=float, default=0.5)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--jitter", type=float, default=0.002, help="Timestamp jitter in seconds.")
+    parser.add_argument("--drop-rate", type=float, default=0.02, help="Share of frames lost before tracking.")
+    parser.add_argument("--strides", type=int, nargs="+", default=[1, 2, 3, 4, 6, 8])
+    parser.add_argument("--max-stride", type=int, default=2, help="Longest stride of the adaptive scheduler.")
+    parser.add_argument("--max-shift", type=float, default=1.)
+    parser.add_argument("--load", type=float, default=0.9, help="Share of the frame time the detector may take.")
+    parser.add_argument("--burst", type=float, default=2)
+    parser.add_argument("--detector-ms", type=float, default=90, help="Detector time per run, e.g. YOLO on a Pi.")
+    parser.add_argument("--max-age", type=int, default=10)
+    parser.add_argument("--min-hits", type=int, default=3)
+    parser.add_argument("--iou-threshold", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    det, gt = synthetic_sequence(args.frames, args.density, args.width, args.height, miss_rate=args.miss_rate,
+                                 false_positives=args.false_positives, noise=args.noise, seed=args.seed,
+                                 mean_speed=args.speed)
+    numbers, times = frame_times(args.frames, args.fps, args.jitter, args.drop_rate, rng)
+    det = FrameIndex(det)
+    # dropped frames are never tracked, so they are not scored
+    gt = FrameIndex(gt[np.isin(gt[:, 0], numbers)])
+
+    modes = [(f"k={k}", {'min_stride': k, 'max_stride': k}) for k in args.strides]
+    adaptive = {'min_stride': 1, 'max_stride': args.max_stride, 'max_shift': args.max_shift, 'burst': args.burst}
+    modes.append(("adaptive", dict(adaptive, load=None)))
+    modes.append(("live", dict(adaptive, load=args.load)))
+
+    print(f"{len(numbers)} of {args.frames} frames at {args.fps:g} fps, {len(gt.rows)} hornet boxes, "
+          f"speed {args.speed:g} px/frame, detector {args.detector_ms:g} ms")
+    print(f"{'mode':9} {'stride':>6} {'detect %':>9} {'MOTA':>7} {'IDF1':>7} {'ID sw':>6} {'FN':>6} {'FP':>6} "
+          f"{'track ms':>9} {'max fps':>8}")
+    for name, params in modes:
+        hyp, detect_rate, stride, tracker_seconds = run(det, numbers, times, params, args)
+        metrics = clear_mot(gt, FrameIndex(hyp))
+        # one core: detector runs amortised over the frames, plus tracking
+        frame_seconds = detect_rate * args.detector_ms / 1000. + tracker_seconds
+        print(f"{name:9} {stride:6.2f} {detect_rate * 100:9.1f} {metrics['mota']:7.3f} {metrics['idf1']:7.3f} "
+              f"{metrics['id_switches']:6d} {metrics['fn']:6d} {metrics['fp']:6d} {tracker_seconds * 1000:9.3f} "
+              f"{1. / frame_seconds:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# Writes detection events to the database from a background thread, so
+# the frame loop never waits for Azure SQL. One connection is kept open
+# and reused, the KnownHornet ids are cached instead of queried per
+# event, and events are inserted in batches with one commit per batch.
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+INSERT_QUERY = '''
+INSERT INTO dbo.DetectionEvent (
+    Id, Timestamp, HornetDirection, FirstDetection, SecondDetection,
+    IsManual, HornetCount, DeviceId, KnownHornetId
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+KNOWN_HORNET_QUERY = "SELECT Id FROM dbo.KnownHornet"
+
+
+class DetectionWriter:
+    """
+    Queues detection events in memory and inserts them into
+    dbo.DetectionEvent from a background thread, committing every
+    ``batch_size`` events or every ``max_batch_age`` seconds.
+    """
+    def __init__(self, connect, device_id: str, batch_size: int = 100, max_batch_age: float = 1.0,
+                 refresh_interval: float = 300.0, max_pending: int = 10000,
+                 min_backoff: float = 1.0, max_backoff: float = 60.0):
+        """
+        :param connect: Callable returning a new DB-API connection, e.g.
+            ``lambda: pyodbc.connect(DB_CONNECTION_STRING)``. Called again
+            only after the connection failed.
+        :param str device_id: The DeviceId stored with every event.
+        :param int batch_size: Commit once this many events are queued.
+        :param float max_batch_age: Commit once the oldest queued event has
+            waited this many seconds.
+        :param float refresh_interval: Seconds between reloads of the
+            KnownHornet ids.
+        :param int max_pending: The most events queued; when full, the
+            oldest event is dropped.
+        :param float min_backoff: The first retry delay after a database
+            error, in seconds.
+        :param float max_backoff: The longest retry delay, in seconds.
+        """
+        self.connect = connect
+        self.device_id = device_id
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age
+        self.refresh_interval = refresh_interval
+        self.max_pending = max_pending
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.known_hornet_ids = []
+        self._refreshed_at = None
+        self._conn = None
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closing = False
+        self._flush_requested = False
+        self.backoff = 0.0
+        self.inserted = 0
+        self.batches = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name="detection-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, timestamp, first_detection, second_detection, direction: float, hornet_count: int):
+        """
+        Queues a detection event. Only touches memory, never the database.
+        """
+        row = (str(uuid.uuid4()), timestamp, direction, first_detection, second_detection,
+               False, hornet_count, self.device_id)
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("The writer is closed.")
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logging.warning(f"Detection event queue is full, dropped {self.dropped} events so far.")
+            self._pending.append((time.monotonic(), row))
+            # wake the writer to start the age timer, or when a batch is full
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = self.connect()
+        return self._conn
+
+    def _disconnect(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _refresh_known_hornets(self):
+        cursor = self._connection().cursor()
+        cursor.execute(KNOWN_HORNET_QUERY)
+        self.known_hornet_ids = [row[0] for row in cursor.fetchall()]
+        self._refreshed_at = time.monotonic()
+        if not self.known_hornet_ids:
+            logging.error("No KnownHornetId found in the database.")
+        else:
+            logging.info(f"Loaded {len(self.known_hornet_ids)} KnownHornet ids.")
+
+    def _insert(self, rows: list) -> int:
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self._refresh_known_hornets()
+        if not self.known_hornet_ids:
+            return 0
+
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            # pyodbc sends all parameter sets in one round trip
+            cursor.fast_executemany = True
+        except AttributeError:
+            pass
+        # any existing KnownHornet, like the ORDER BY NEWID() query did
+        cursor.executemany(INSERT_QUERY, [row + (random.choice(self.known_hornet_ids),) for row in rows])
+        conn.commit()
+        return len(rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        age = time.monotonic() - self._pending[0][0]
+                        if (len(self._pending) >= self.batch_size or age >= self.max_batch_age
+                                or self._closing or self._flush_requested):
+                            break
+                        self._cond.wait(self.max_batch_age - age)
+                    elif self._closing:
+                        self._disconnect()
+                        return
+                    else:
+                        self._cond.wait()
+                count = min(self.batch_size, len(self._pending))
+                batch = [self._pending.popleft() for _ in range(count)]
+                self._in_flight = count
+
+            try:
+                inserted = self._insert([row for _, row in batch])
+            except Exception as e:
+                self.failures += 1
+                self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+                logging.error(f"Database error, retrying {count} detection events in {self.backoff:.1f} s: {e}")
+                try:
+                    self._conn.rollback()
+                except Exception:
+                    pass
+                # the connection may be broken, open a new one next time
+                self._disconnect()
+                with self._cond:
+                    self._pending.extendleft(reversed(batch))
+                    self._in_flight = 0
+                    self._cond.notify_all()
+                    if self._closing:
+                        # give up on shutdown instead of retrying forever
+                        logging.error(f"Dropping {len(self._pending)} unsaved detection events.")
+                        self.dropped += len(self._pending)
+                        self._pending.clear()
+                    else:
+                        self._cond.wait(self.backoff)
+                continue
+
+            if inserted:
+                self.inserted += inserted
+                self.batches += 1
+                self.backoff = 0.0
+                logging.info(f"Saved {inserted} detection events.")
+            else:
+                self.skipped += count
+                logging.error(f"No valid KnownHornetId found. Skipping {count} detection events.")
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every queued event has been written. Returns False if
+        that did not happen within ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            # write partial batches without waiting for them to age
+            self._flush_requested = True
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flush_requested = False
+        return True
+
+    def close(self, timeout: float = 10):
+        """
+        Writes what is still queued (waiting at most ``timeout`` seconds),
+        stops the background thread and closes the connection.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of events inserted, dropped because the queue
+        was full or the database kept failing, skipped for lack of a
+        KnownHornet, still pending, and the batches and failures.
+        """
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'inserted': self.inserted,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'pending': pending,
+            'batches': self.batches,
+            'failures': self.failures,
+        }
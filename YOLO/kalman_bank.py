@@ -0,0 +1,232 @@
+"""
+Struct-of-arrays Kalman filter bank for SORT.
+
+Every track is a row in a set of stacked NumPy arrays instead of its own
+filterpy KalmanFilter, so one call predicts or updates all tracks at once.
+The motion model, noise matrices and update equations are the same ones
+KalmanBoxTracker sets up, so results match the filterpy path up to floating
+point rounding.
+"""
+import numpy as np
+
+DIM_X = 7
+DIM_Z = 4
+
+
+def convert_bboxes_to_z(bboxes):
+    """
+    Vectorized convert_bbox_to_z: takes an (N,4+) array of [x1,y1,x2,y2]
+    boxes and returns an (N,4) array of [x,y,s,r].
+    """
+    bboxes = np.asarray(bboxes, dtype=float)
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    z = np.empty((len(bboxes), DIM_Z))
+    z[:, 0] = bboxes[:, 0] + w / 2.
+    z[:, 1] = bboxes[:, 1] + h / 2.
+    z[:, 2] = w * h
+    z[:, 3] = w / h
+    return z
+
+
+def convert_xs_to_bboxes(xs):
+    """
+    Vectorized convert_x_to_bbox: takes an (N,4+) array of states in the
+    centre form [x,y,s,r,...] and returns an (N,4) array of [x1,y1,x2,y2].
+    Rows with a negative area come out as NaN, like the scalar version.
+    """
+    with np.errstate(invalid='ignore'):
+        w = np.sqrt(xs[:, 2] * xs[:, 3])
+        h = xs[:, 2] / w
+    out = np.empty((len(xs), 4))
+    out[:, 0] = xs[:, 0] - w / 2.
+    out[:, 1] = xs[:, 1] - h / 2.
+    out[:, 2] = xs[:, 0] + w / 2.
+    out[:, 3] = xs[:, 1] + h / 2.
+    return out
+
+
+def transition_matrix(dt):
+    """
+    The constant velocity model for a step of ``dt`` frames: positions and
+    area move by ``dt`` times their velocities.
+    """
+    F = np.eye(DIM_X)
+    F[0, 4] = F[1, 5] = F[2, 6] = dt
+    return F
+
+
+class KalmanBank(object):
+    """
+    Holds the state of all live tracks in stacked arrays.
+
+    Rows 0..n-1 are live, in creation order; removing tracks compacts the
+    arrays while keeping that order, so row indices line up with the order
+    Sort keeps its tracker list in. The arrays grow by doubling, so adding a
+    track does not reallocate on every frame.
+
+    The predicted boxes since the last update (KalmanBoxTracker.history) are
+    kept in a fixed-size ring buffer per track.
+    """
+
+    # constant velocity model, same as KalmanBoxTracker
+    F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],
+                  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]], dtype=float)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    def __init__(self, capacity=64, history_size=64):
+        """
+        :param int capacity: initial number of track rows to allocate.
+        :param int history_size: length of the per-track history ring buffer.
+        """
+        self.n = 0
+        self.history_size = history_size
+        self._allocate(max(int(capacity), 1))
+
+    def _allocate(self, capacity):
+        old = getattr(self, 'x', None)
+        n = self.n
+        arrays = {
+            'x': np.zeros((capacity, DIM_X)),
+            'P': np.zeros((capacity, DIM_X, DIM_X)),
+            'ids': np.zeros(capacity, dtype=np.int64),
+            'time_since_update': np.zeros(capacity, dtype=np.int64),
+            'hits': np.zeros(capacity, dtype=np.int64),
+            'hit_streak': np.zeros(capacity, dtype=np.int64),
+            'age': np.zeros(capacity, dtype=np.int64),
+            'history_buf': np.zeros((capacity, self.history_size, 4)),
+            'history_len': np.zeros(capacity, dtype=np.int64),
+        }
+        for name, arr in arrays.items():
+            if old is not None:
+                arr[:n] = getattr(self, name)[:n]
+            setattr(self, name, arr)
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.n
+
+    def add(self, bboxes, ids):
+        """
+        Starts new tracks from an (M,4+) array of [x1,y1,x2,y2,...] boxes.
+        """
+        m = len(bboxes)
+        if m == 0:
+            return
+        if self.n + m > self.capacity:
+            capacity = self.capacity
+            while capacity < self.n + m:
+                capacity *= 2
+            self._allocate(capacity)
+        rows = slice(self.n, self.n + m)
+        self.x[rows] = 0.
+        self.x[rows, :DIM_Z] = convert_bboxes_to_z(bboxes)
+        self.P[rows] = self.P0
+        self.ids[rows] = ids
+        self.time_since_update[rows] = 0
+        self.hits[rows] = 0
+        self.hit_streak[rows] = 0
+        self.age[rows] = 0
+        self.history_len[rows] = 0
+        self.n += m
+
+    def _advance(self, dt):
+        x = self.x[:self.n]
+        P = self.P[:self.n]
+        x[(x[:, 6] * dt + x[:, 2]) <= 0, 6] = 0.
+        if dt == 1:
+            F, Q = self.F, self.Q
+        else:
+            # the process noise grows with the time it acts over
+            F, Q = transition_matrix(dt), self.Q * dt
+        x[:] = x @ F.T
+        P[:] = F @ P @ F.T + Q
+
+    def predict(self, dt=1.):
+        """
+        Advances all tracks one step of ``dt`` frames and returns their
+        predicted boxes as an (n,4) array. Rows whose prediction is invalid
+        are NaN.
+        """
+        n = self.n
+        self._advance(dt)
+        self.age[:n] += 1
+        self.hit_streak[:n][self.time_since_update[:n] > 0] = 0
+        self.time_since_update[:n] += 1
+
+        boxes = convert_xs_to_bboxes(self.x[:n])
+        slot = self.history_len[:n] % self.history_size
+        self.history_buf[np.arange(n), slot] = boxes
+        self.history_len[:n] += 1
+        return boxes
+
+    def coast(self, dt):
+        """
+        Moves all tracks ``dt`` frames ahead without counting a step, for
+        frames the detector skipped: ages, hit streaks and the history stay
+        as they are. Returns the boxes like predict().
+        """
+        self._advance(dt)
+        return convert_xs_to_bboxes(self.x[:self.n])
+
+    def update(self, rows, bboxes):
+        """
+        Corrects the tracks at ``rows`` with the matching (M,4+) observed boxes.
+        """
+        if len(rows) == 0:
+            return
+        rows = np.asarray(rows)
+        self.time_since_update[rows] = 0
+        self.history_len[rows] = 0
+        self.hits[rows] += 1
+        self.hit_streak[rows] += 1
+
+        x = self.x[rows]
+        P = self.P[rows]
+        z = convert_bboxes_to_z(bboxes)
+        # H selects the first DIM_Z state entries, so H x, P H' and H P H'
+        # are plain slices.
+        y = z - x[:, :DIM_Z]
+        PHT = P[:, :, :DIM_Z]
+        S = PHT[:, :DIM_Z, :] + self.R
+        K = PHT @ np.linalg.inv(S)
+        x += (K @ y[:, :, None])[:, :, 0]
+        # Joseph form, as used by filterpy
+        I_KH = np.broadcast_to(np.eye(DIM_X), P.shape).copy()
+        I_KH[:, :, :DIM_Z] -= K
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+        self.x[rows] = x
+        self.P[rows] = P
+
+    def get_state(self):
+        """
+        Returns the current box estimate of all tracks as an (n,4) array.
+        """
+        return convert_xs_to_bboxes(self.x[:self.n])
+
+    def history(self, row):
+        """
+        Returns the boxes predicted for track ``row`` since its last update,
+        oldest first, as a list of (1,4) arrays like KalmanBoxTracker.history.
+        At most ``history_size`` entries are kept.
+        """
+        count = self.history_len[row]
+        size = self.history_size
+        slots = np.arange(max(0, count - size), count) % size
+        return [self.history_buf[row, s].reshape((1, 4)) for s in slots]
+
+    def keep(self, mask):
+        """
+        Drops all tracks whose entry in the boolean (n,) ``mask`` is False.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        if mask.all():
+            return
+        k = int(mask.sum())
+        for name in ('x', 'P', 'ids', 'time_since_update', 'hits',
+                     'hit_streak', 'age', 'history_buf', 'history_len'):
+            arr = getattr(self, name)
+            arr[:k] = arr[:self.n][mask]
+        self.n = k
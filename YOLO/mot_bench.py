@@ -0,0 +1,354 @@
+"""
+MOT benchmark harness for the SORT tracker.
+
+Runs the tracker over MOT-format sequences (or synthetic hornet flights),
+one sequence per worker process, and reports throughput, per-frame latency
+percentiles and, where ground truth is available, MOTA and IDF1. Results go
+to a JSON file so runs from different commits can be compared with
+--compare.
+
+Usage:
+    python mot_bench.py --seq_path data --phase train --workers 4 --output bench.json
+    python mot_bench.py --synthetic 8 --density 20 --frames 1000 --compare old.json
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from association import iou_batch, linear_assignment
+from sort_core import Sort, BatchSort
+
+TRACKERS = {'batch': BatchSort, 'filterpy': Sort}
+
+
+def read_mot_file(path, chunk_lines=1 << 16):
+    """
+    Reads a MOT text file (det.txt or gt.txt) in chunks of ``chunk_lines``
+    lines and returns one float array with a row per line.
+    """
+    chunks = []
+    with open(path) as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_lines))
+            if not lines:
+                break
+            chunks.append(np.loadtxt(lines, delimiter=',', ndmin=2))
+    if not chunks:
+        return np.empty((0, 10))
+    return np.concatenate(chunks, axis=0)
+
+
+class FrameIndex(object):
+    """
+    MOT rows grouped by frame number. The rows are sorted once; looking up a
+    frame is a slice, so iterating over a sequence is linear in its size.
+    """
+
+    def __init__(self, rows):
+        rows = np.asarray(rows, dtype=float).reshape(len(rows), -1)
+        frames = rows[:, 0].astype(np.int64)
+        order = np.argsort(frames, kind='stable')
+        self.rows = rows[order]
+        frames = frames[order]
+        self.n_frames = int(frames[-1]) if len(frames) else 0
+        # rows of frame f are rows[bounds[f - 1]:bounds[f]]
+        self.bounds = np.searchsorted(frames, np.arange(1, self.n_frames + 2))
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, frame):
+        if frame < 1 or frame > self.n_frames:
+            return self.rows[:0]
+        return self.rows[self.bounds[frame - 1]:self.bounds[frame]]
+
+
+def mot_to_xyxy(rows):
+    """Converts the [x,y,w,h] columns of MOT rows to [x1,y1,x2,y2]."""
+    boxes = rows[:, 2:6].copy()
+    boxes[:, 2:4] += boxes[:, 0:2]
+    return boxes
+
+
+def synthetic_sequence(n_frames=600, density=5., width=1920, height=1080, miss_rate=0.1,
+                       false_positives=2., noise=2., seed=0, mean_speed=12.):
+    """
+    Generates hornets flying across the frame on smooth, slightly curving
+    paths at ``mean_speed`` pixels per frame on average, with ``density``
+    hornets visible on average. Returns (det, gt) arrays in MOT format.
+    Detections miss a hornet with probability ``miss_rate`` and add on
+    average ``false_positives`` bee-sized false positives per frame.
+    """
+    rng = np.random.default_rng(seed)
+    mean_lifetime = (width + height) / 2. / mean_speed
+    birth_rate = density / mean_lifetime
+
+    pos = np.empty((0, 2))
+    vel = np.empty((0, 2))
+    size = np.empty((0, 2))
+    ids = np.empty(0, dtype=np.int64)
+    next_id = 1
+    gt_rows, det_rows = [], []
+    for frame in range(1, n_frames + 1):
+        born = rng.poisson(birth_rate if frame > 1 else density)
+        if born:
+            # enter on a random edge, heading for a random point inside the frame
+            edge = rng.integers(0, 4, born)
+            t = rng.random(born)
+            start = np.stack([np.where(edge < 2, t * width, np.where(edge == 2, 0., width)),
+                              np.where(edge < 2, np.where(edge == 0, 0., height), t * height)], axis=1)
+            if frame == 1:
+                start = rng.random((born, 2)) * (width, height)
+            target = rng.random((born, 2)) * (width, height)
+            heading = target - start
+            heading /= np.maximum(np.linalg.norm(heading, axis=1, keepdims=True), 1e-6)
+            pos = np.concatenate([pos, start])
+            vel = np.concatenate([vel, heading * rng.uniform(.5, 1.5, (born, 1)) * mean_speed])
+            size = np.concatenate([size, rng.uniform(30, 70, (born, 2))])
+            ids = np.concatenate([ids, np.arange(next_id, next_id + born)])
+            next_id += born
+
+        vel += rng.normal(0, .5, vel.shape)
+        pos += vel
+        inside = ((pos[:, 0] > -size[:, 0]) & (pos[:, 0] < width + size[:, 0])
+                  & (pos[:, 1] > -size[:, 1]) & (pos[:, 1] < height + size[:, 1]))
+        pos, vel, size, ids = pos[inside], vel[inside], size[inside], ids[inside]
+
+        n = len(ids)
+        xywh = np.concatenate([pos - size / 2., size], axis=1)
+        gt_rows.append(np.column_stack([np.full(n, frame), ids, xywh, np.ones((n, 3))]))
+
+        seen = rng.random(n) >= miss_rate
+        noisy = xywh[seen] + rng.normal(0, noise, (seen.sum(), 4))
+        noisy[:, 2:] = np.maximum(noisy[:, 2:], 4.)
+        fp = rng.poisson(false_positives)
+        fp_boxes = np.column_stack([rng.random((fp, 2)) * (width, height), rng.uniform(15, 35, (fp, 2))])
+        boxes = np.concatenate([noisy, fp_boxes])
+        conf = np.concatenate([rng.uniform(.5, 1., len(noisy)), rng.uniform(.25, .6, fp)])
+        m = len(boxes)
+        det_rows.append(np.column_stack([np.full(m, frame), np.full(m, -1), boxes, conf, np.full((m, 3), -1)]))
+
+    return np.concatenate(det_rows), np.concatenate(gt_rows)
+
+
+def clear_mot(gt, hyp, iou_threshold=0.5):
+    """
+    CLEAR MOT and identity metrics for two FrameIndex objects holding MOT
+    rows. Returns a dict with MOTA, IDF1 and the underlying counts.
+    """
+    n_frames = max(len(gt), len(hyp))
+    fn = fp = idsw = n_gt = n_hyp = 0
+    last_match = {}
+    pair_counts = {}
+    for frame in range(1, n_frames + 1):
+        g, h = gt[frame], hyp[frame]
+        n_gt += len(g)
+        n_hyp += len(h)
+        if len(g) == 0 or len(h) == 0:
+            fn += len(g)
+            fp += len(h)
+            continue
+        iou = iou_batch(mot_to_xyxy(g), mot_to_xyxy(h))
+        g_ids, h_ids = g[:, 1].astype(np.int64), h[:, 1].astype(np.int64)
+
+        # identity overlaps for IDF1 are counted over all pairs
+        for gi, hi in zip(*np.nonzero(iou >= iou_threshold)):
+            key = (g_ids[gi], h_ids[hi])
+            pair_counts[key] = pair_counts.get(key, 0) + 1
+
+        # keep last frame's correspondences if still valid, assign the rest
+        cost = np.where(iou >= iou_threshold, -iou, 0.)
+        for gi, gid in enumerate(g_ids):
+            prev = last_match.get(gid)
+            if prev is not None:
+                hi = np.flatnonzero(h_ids == prev)
+                if len(hi) and iou[gi, hi[0]] >= iou_threshold:
+                    cost[gi, hi[0]] = -10.
+        matches = [(gi, hi) for gi, hi in linear_assignment(cost) if iou[gi, hi] >= iou_threshold]
+        for gi, hi in matches:
+            gid, hid = g_ids[gi], h_ids[hi]
+            if gid in last_match and last_match[gid] != hid:
+                idsw += 1
+            last_match[gid] = hid
+        fn += len(g) - len(matches)
+        fp += len(h) - len(matches)
+
+    idtp = 0
+    if pair_counts:
+        g_keys = sorted({k[0] for k in pair_counts})
+        h_keys = sorted({k[1] for k in pair_counts})
+        g_pos = {k: i for i, k in enumerate(g_keys)}
+        h_pos = {k: i for i, k in enumerate(h_keys)}
+        counts = np.zeros((len(g_keys), len(h_keys)))
+        for (gid, hid), c in pair_counts.items():
+            counts[g_pos[gid], h_pos[hid]] = c
+        idtp = int(sum(counts[gi, hi] for gi, hi in linear_assignment(-counts)))
+
+    return {
+        'mota': 1. - (fn + fp + idsw) / float(n_gt) if n_gt else None,
+        'idf1': 2. * idtp / float(n_gt + n_hyp) if n_gt + n_hyp else None,
+        'fn': fn, 'fp': fp, 'id_switches': idsw, 'gt': n_gt,
+    }
+
+
+def run_sequence(job):
+    """
+    Tracks one sequence and returns its results. ``job`` is a dict with the
+    sequence name, detection rows, optional ground-truth rows, tracker name
+    and tracker keyword arguments. Runs in a worker process.
+    """
+    dets = FrameIndex(job['det'])
+    tracker = TRACKERS[job['tracker']](**job['params'])
+    latencies = np.empty(len(dets))
+    out_rows = []
+    for frame in range(1, len(dets) + 1):
+        rows = dets[frame]
+        boxes = np.empty((len(rows), 5))
+        boxes[:, :4] = mot_to_xyxy(rows)
+        boxes[:, 4] = rows[:, 6]
+        start = time.perf_counter()
+        tracks = tracker.update(boxes)
+        latencies[frame - 1] = time.perf_counter() - start
+        if len(tracks):
+            wh = tracks[:, 2:4] - tracks[:, 0:2]
+            out_rows.append(np.column_stack([np.full(len(tracks), frame), tracks[:, 4], tracks[:, 0:2], wh]))
+
+    total = float(latencies.sum())
+    result = {
+        'frames': len(dets),
+        'detections': len(job['det']),
+        'seconds': total,
+        'fps': len(dets) / total if total > 0 else None,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50) * 1e3) if len(latencies) else None,
+            'p90': float(np.percentile(latencies, 90) * 1e3) if len(latencies) else None,
+            'p99': float(np.percentile(latencies, 99) * 1e3) if len(latencies) else None,
+            'max': float(latencies.max() * 1e3) if len(latencies) else None,
+        },
+    }
+    if job.get('gt') is not None:
+        hyp = np.concatenate(out_rows) if out_rows else np.empty((0, 6))
+        result.update(clear_mot(FrameIndex(job['gt']), FrameIndex(hyp)))
+    return job['name'], result
+
+
+def load_jobs(args, params):
+    jobs = []
+    if args.synthetic:
+        for i in range(args.synthetic):
+            det, gt = synthetic_sequence(n_frames=args.frames, density=args.density, seed=args.seed + i)
+            jobs.append({'name': 'synthetic-%02d' % i, 'det': det, 'gt': gt})
+    else:
+        pattern = os.path.join(args.seq_path, args.phase, '*', 'det', 'det.txt')
+        for det_path in sorted(glob.glob(pattern)):
+            seq_dir = os.path.dirname(os.path.dirname(det_path))
+            gt_path = os.path.join(seq_dir, 'gt', 'gt.txt')
+            jobs.append({
+                'name': os.path.basename(seq_dir),
+                'det': read_mot_file(det_path),
+                'gt': read_mot_file(gt_path) if os.path.exists(gt_path) else None,
+            })
+    for job in jobs:
+        job['tracker'] = args.tracker
+        job['params'] = params
+    return jobs
+
+
+def summarise(sequences):
+    frames = sum(r['frames'] for r in sequences.values())
+    seconds = sum(r['seconds'] for r in sequences.values())
+    total = {'frames': frames, 'seconds': seconds, 'fps': frames / seconds if seconds > 0 else None}
+    scored = [r for r in sequences.values() if r.get('mota') is not None]
+    if scored:
+        n_gt = sum(r['gt'] for r in scored)
+        errors = sum(r['fn'] + r['fp'] + r['id_switches'] for r in scored)
+        total['mota'] = 1. - errors / float(n_gt)
+        total['id_switches'] = sum(r['id_switches'] for r in scored)
+        # frame-weighted mean, the per-pair counts are not kept
+        total['idf1'] = sum(r['idf1'] * r['gt'] for r in scored) / float(n_gt)
+    return total
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """Prints the change of the headline numbers between two result files."""
+    print('%-16s %12s %12s %10s' % ('metric', old.get('commit') or 'old', new.get('commit') or 'new', 'change'))
+    for key in ('fps', 'mota', 'idf1', 'id_switches'):
+        a, b = old['total'].get(key), new['total'].get(key)
+        if a is None or b is None:
+            continue
+        change = '%+.1f%%' % ((b - a) / a * 100.) if a else '-'
+        print('%-16s %12.4g %12.4g %10s' % (key, a, b, change))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SORT benchmark')
+    parser.add_argument('--seq_path', help='Path to detections.', type=str, default='data')
+    parser.add_argument('--phase', help='Subdirectory in seq_path.', type=str, default='train')
+    parser.add_argument('--synthetic', help='Run this many synthetic sequences instead.', type=int, default=0)
+    parser.add_argument('--density', help='Mean number of visible hornets in synthetic sequences.',
+                        type=float, default=5.)
+    parser.add_argument('--frames', help='Frames per synthetic sequence.', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracker', choices=sorted(TRACKERS), default='batch')
+    parser.add_argument('--max_age', type=int, default=1)
+    parser.add_argument('--min_hits', type=int, default=3)
+    parser.add_argument('--iou_threshold', type=float, default=0.3)
+    parser.add_argument('--workers', help='Worker processes, one sequence each.', type=int,
+                        default=os.cpu_count())
+    parser.add_argument('--output', help='Write results as JSON to this file.', type=str)
+    parser.add_argument('--compare', help='Earlier JSON results to compare against.', type=str)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    params = {'max_age': args.max_age, 'min_hits': args.min_hits, 'iou_threshold': args.iou_threshold}
+    jobs = load_jobs(args, params)
+    if not jobs:
+        print('No sequences found.')
+        return
+
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as pool:
+        sequences = dict(pool.map(run_sequence, jobs))
+
+    results = {
+        'commit': git_commit(),
+        'tracker': args.tracker,
+        'params': params,
+        'sequences': sequences,
+        'total': summarise(sequences),
+    }
+    for name, r in sorted(sequences.items()):
+        line = '%-16s %6d frames %8.1f FPS  p50 %.3f ms  p99 %.3f ms' % (
+            name, r['frames'], r['fps'] or 0., r['latency_ms']['p50'] or 0., r['latency_ms']['p99'] or 0.)
+        if r.get('mota') is not None:
+            line += '  MOTA %.3f  IDF1 %.3f  IDSW %d' % (r['mota'], r['idf1'], r['id_switches'])
+        print(line)
+    total = results['total']
+    print('Total: %d frames in %.3f s, %.1f FPS' % (total['frames'], total['seconds'], total['fps'] or 0.))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=float)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+#
+# Exports the trained hornet model to ONNX and quantizes it to INT8 with
+# onnxruntime's static quantization, calibrated on frames of our own
+# footage (a directory of images such as raspb_files/output_frames, or a
+# video sampled evenly). Then runs the FP32 and the INT8 model through
+# OnnxDetector on the same frames and prints them side by side:
+# mAP50, mAP50-95, precision and recall, and the CPU latency per frame.
+#
+# Accuracy is measured against YOLO .txt labels when --labels is given,
+# otherwise against the FP32 model's own detections, which shows how much
+# the INT8 model changes the output. OnnxDetector comes from
+# device-code/, put on the path by repo_paths.
+#
+# The box and score decoding at the end of the detect head stays in FP32:
+# it mixes pixel coordinates and probabilities in one tensor, and one
+# INT8 scale for both rounds every score to 0.
+#
+# usage: quantize_model.py WEIGHTS --calibration DIR|VIDEO [--eval DIR|VIDEO] [--labels DIR]
+#                          [--output best_int8.onnx] [--frames 100] [--method minmax] [--threads 0]
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+import repo_paths  # noqa: F401
+from association import iou_batch
+from onnx_detector import OnnxDetector
+
+METHODS = {
+    'minmax': CalibrationMethod.MinMax,
+    'entropy': CalibrationMethod.Entropy,
+    'percentile': CalibrationMethod.Percentile,
+}
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# detections kept for mAP, as ultralytics' val does
+EVAL_CONF = 0.001
+IMAGE_TYPES = ('*.jpg', '*.jpeg', '*.png')
+
+
+def load_frames(source, limit):
+    """
+    Returns up to ``limit`` (name, BGR frame) pairs from a directory of
+    images, or from a video sampled evenly over its whole length.
+    """
+    if os.path.isdir(source):
+        paths = sorted(p for pattern in IMAGE_TYPES for p in glob.glob(os.path.join(source, pattern)))
+        if len(paths) > limit:
+            paths = [paths[int(k)] for k in np.linspace(0, len(paths) - 1, limit)]
+        return [(os.path.splitext(os.path.basename(p))[0], cv2.imread(p)) for p in paths]
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open {source}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = max(1, total // limit) if total > 0 else 1
+    frames = []
+    index = 0
+    while len(frames) < limit:
+        ret = cap.grab()
+        if not ret:
+            break
+        if index % step == 0:
+            _, frame = cap.retrieve()
+            frames.append((f"frame_{index}", frame))
+        index += 1
+    cap.release()
+    return frames
+
+
+def load_labels(labels_dir, frames):
+    """
+    Reads the YOLO label file (class cx cy w h, normalized) of every frame
+    and returns one Nx5 [x1, y1, x2, y2, class] array per frame.
+    """
+    truths = []
+    for name, frame in frames:
+        h, w = frame.shape[:2]
+        path = os.path.join(labels_dir, name + '.txt')
+        rows = np.loadtxt(path, ndmin=2).reshape(-1, 5) if os.path.exists(path) else np.empty((0, 5))
+        cls, cx, cy, bw, bh = rows.T
+        truths.append(np.column_stack([(cx - bw / 2) * w, (cy - bh / 2) * h,
+                                       (cx + bw / 2) * w, (cy + bh / 2) * h, cls]))
+    return truths
+
+
+def export_onnx(weights, imgsz):
+    """
+    Exports .pt weights to ONNX next to them with ultralytics; an .onnx
+    file is returned as is.
+    """
+    if weights.endswith('.onnx'):
+        return weights
+    from ultralytics import YOLO
+    return YOLO(weights).export(format='onnx', imgsz=imgsz, simplify=True)
+
+
+def decode_nodes(model):
+    """
+    Returns the names of the nodes of an ultralytics detect head that turn
+    the box and class convolutions into the output: the DFL, the anchor
+    decoding, the sigmoid and the concatenations. Those are left in FP32.
+    """
+    output = model.graph.output[0].name
+    last = next(node for node in model.graph.node if output in node.output)
+    # e.g. '/model.23/' for the head of YOLO11
+    parts = last.name.split('/')
+    if len(parts) < 3:
+        return []
+    head = '/'.join(parts[:2]) + '/'
+    return [node.name for node in model.graph.node
+            if node.name.startswith(head) and not node.name.startswith(head + 'cv')]
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """
+    Feeds the calibration frames to onnxruntime, letterboxed exactly as
+    OnnxDetector does at inference time.
+    """
+    def __init__(self, detector, frames):
+        self.detector = detector
+        self.frames = frames
+        self.input_name = detector.session.get_inputs()[0].name
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.frames):
+            return None
+        _, frame = self.frames[self.index]
+        self.index += 1
+        return {self.input_name: self.detector.preprocess(frame).copy()}
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize(fp32_path, output, frames, method, per_channel=True, keep_decode=True):
+    """
+    Writes the INT8 (QDQ) model for ``fp32_path`` to ``output``, calibrated
+    on ``frames``.
+    """
+    import onnx
+    prepared = os.path.splitext(output)[0] + '_prep.onnx'
+    quant_pre_process(fp32_path, prepared)
+    try:
+        exclude = decode_nodes(onnx.load(prepared)) if keep_decode else []
+        reader = FrameCalibrationReader(OnnxDetector(fp32_path), frames)
+        quantize_static(prepared, output, reader,
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        per_channel=per_channel,
+                        calibrate_method=METHODS[method],
+                        nodes_to_exclude=exclude)
+    finally:
+        os.remove(prepared)
+    return output
+
+
+def match(detections, truths):
+    """
+    Greedily matches the detections of one frame, highest confidence first,
+    to unmatched truths of the same class. Returns a (detections, IoU
+    thresholds) boolean array of true positives.
+    """
+    tp = np.zeros((len(detections), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(detections) == 0 or len(truths) == 0:
+        return tp
+    iou = iou_batch(detections[:, :4], truths[:, :4])
+    iou[detections[:, 5, None] != truths[None, :, 4]] = 0.
+    order = np.argsort(-detections[:, 4], kind='stable')
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(truths), dtype=bool)
+        for d in order:
+            candidates = np.where(taken, 0., iou[d])
+            best = candidates.argmax()
+            if candidates[best] >= threshold:
+                taken[best] = True
+                tp[d, t] = True
+    return tp
+
+
+def average_precision(tp, conf, n_truth):
+    """
+    COCO style 101 point interpolated AP, for every IoU threshold.
+    """
+    if n_truth == 0 or len(tp) == 0:
+        return np.zeros(tp.shape[1])
+    order = np.argsort(-conf, kind='stable')
+    tpc = np.cumsum(tp[order], axis=0)
+    fpc = np.cumsum(~tp[order], axis=0)
+    recall = tpc / n_truth
+    precision = tpc / (tpc + fpc)
+    points = np.linspace(0, 1, 101)
+    ap = np.zeros(tp.shape[1])
+    for t in range(tp.shape[1]):
+        # the precision envelope: the best precision at this recall or
+        # above, and 0 past the highest recall reached
+        envelope = np.append(np.maximum.accumulate(precision[::-1, t])[::-1], 0.)
+        ap[t] = envelope[np.searchsorted(recall[:, t], points, side='left')].mean()
+    return ap
+
+
+def score(detections, truths, conf):
+    """
+    Returns mAP50, mAP50-95 and the precision and recall at ``conf`` of the
+    detections of all frames against the truths.
+    """
+    tp = [match(d, t) for d, t in zip(detections, truths)]
+    tp_all = np.concatenate(tp) if tp else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool)
+    det_all = np.concatenate(detections) if detections else np.empty((0, 6))
+    truth_all = np.concatenate(truths) if truths else np.empty((0, 5))
+
+    classes = np.unique(truth_all[:, 4])
+    ap = np.array([average_precision(tp_all[det_all[:, 5] == c], det_all[det_all[:, 5] == c, 4],
+                                     int((truth_all[:, 4] == c).sum())) for c in classes]).reshape(-1, len(IOU_THRESHOLDS))
+    kept = det_all[:, 4] >= conf
+    hits = int(tp_all[kept, 0].sum())
+    return {
+        'mAP50': float(ap[:, 0].mean()) if len(ap) else 0.,
+        'mAP50-95': float(ap.mean()) if len(ap) else 0.,
+        'precision': hits / max(int(kept.sum()), 1),
+        'recall': hits / max(len(truth_all), 1),
+    }
+
+
+def run_model(model_path, frames, conf, threads):
+    """
+    Returns the detections of every frame at EVAL_CONF and the latency of
+    each frame at ``conf``, the threshold the device runs with.
+    """
+    detector = OnnxDetector(model_path, conf=conf, intra_op_threads=threads)
+    latencies = []
+    for _, frame in frames:
+        t0 = time.perf_counter()
+        detector.detect(frame)
+        latencies.append(time.perf_counter() - t0)
+    detector.conf = EVAL_CONF
+    detections = [detector.detect(frame) for _, frame in frames]
+    return detections, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 quantization of the hornet model")
+    parser.add_argument("weights", help="The trained best.pt, or an exported .onnx.")
+    parser.add_argument("--calibration", required=True, help="Directory of frames or a video of our footage.")
+    parser.add_argument("--eval", help="Frames to compare the models on; the calibration frames by default.")
+    parser.add_argument("--labels", help="Directory of YOLO .txt labels for the evaluation frames.")
+    parser.add_argument("--output", help="The INT8 model, <model>_int8.onnx by default.")
+    parser.add_argument("--report", help="Where to write the report as JSON, <output>.json by default.")
+    parser.add_argument("--frames", type=int, default=100, help="Calibration and evaluation frames at most.")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--method", default='minmax', choices=METHODS)
+    parser.add_argument("--per-tensor", action='store_true', help="One weight scale per tensor instead of per channel.")
+    parser.add_argument("--quantize-decode", action='store_true', help="Quantize the box decoding of the head too.")
+    parser.add_argument("--conf", type=float, default=0.25, help="The confidence the device runs with.")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads, 0 for all cores.")
+    args = parser.parse_args()
+
+    fp32_path = export_onnx(args.weights, args.imgsz)
+    output = args.output or os.path.splitext(fp32_path)[0] + '_int8.onnx'
+    report_path = args.report or os.path.splitext(output)[0] + '.json'
+
+    calibration = load_frames(args.calibration, args.frames)
+    if not calibration:
+        parser.error(f"no frames found in {args.calibration}")
+    print(f"calibrating on {len(calibration)} frames ({args.method})")
+    t0 = time.perf_counter()
+    quantize(fp32_path, output, calibration, args.method,
+             per_channel=not args.per_tensor, keep_decode=not args.quantize_decode)
+    print(f"wrote {output} in {time.perf_counter() - t0:.1f} s")
+
+    frames = load_frames(args.eval, args.frames) if args.eval else calibration
+    if not args.eval:
+        print("note: evaluating on the calibration frames; pass --eval for held-out footage")
+
+    results = {'fp32': fp32_path, 'int8': output}
+    runs = {}
+    for name in ('fp32', 'int8'):
+        runs[name] = run_model(results[name], frames, args.conf, args.threads)
+    if args.labels:
+        truths = load_labels(args.labels, frames)
+        reference = 'labels'
+    else:
+        truths = [d[d[:, 4] >= args.conf][:, [0, 1, 2, 3, 5]] for d in runs['fp32'][0]]
+        reference = 'fp32 detections'
+
+    report = {'frames': len(frames), 'reference': reference, 'calibration_frames': len(calibration),
+              'method': args.method, 'models': {}}
+    print(f"\n{len(frames)} frames, accuracy against the {reference}")
+    if not any(len(t) for t in truths):
+        print(f"note: the {reference} hold no boxes, so only the latency is meaningful")
+    print(f"{'model':6} {'size MB':>8} {'mAP50':>7} {'mAP50-95':>9} {'P':>6} {'R':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for name in ('fp32', 'int8'):
+        detections, latencies = runs[name]
+        steady = sorted(latencies[1:] or latencies)
+        entry = score(detections, truths, args.conf)
+        entry.update({
+            'path': results[name],
+            'size_mb': os.path.getsize(results[name]) / 2 ** 20,
+            'p50_ms': steady[len(steady) // 2] * 1000,
+            'p99_ms': steady[min(len(steady) - 1, int(0.99 * len(steady)))] * 1000,
+        })
+        report['models'][name] = entry
+        print(f"{name:6} {entry['size_mb']:8.1f} {entry['mAP50']:7.3f} {entry['mAP50-95']:9.3f} "
+              f"{entry['precision']:6.3f} {entry['recall']:6.3f} {entry['p50_ms']:8.1f} {entry['p99_ms']:8.1f}")
+
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
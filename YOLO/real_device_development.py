@@ -1,19 +1,26 @@
 #!/usr/bin/env python3
+import asyncio
 import os
 from dotenv import load_dotenv
-import beesafe
+import repo_paths  # noqa: F401
+from beesafe_async import AsyncBeeSafeClient
+from device_runtime import DeviceRuntime, default_outbox_path
 from random import uniform
-from time import sleep
-from threading import Thread
 import torch
 from ultralytics import YOLO
 import cv2
 import logging
+import time
 import pyodbc
-import uuid
 from datetime import datetime
 import numpy as np
-from sort import Sort  
+from sort_core import BatchSort
+from detection_writer import DetectionWriter
+from track_lifecycle import TrackLifecycle, EXIT
+from bearing import compass_bearing
+from motion_gate import MotionGate
+from color_reid import color_features
+from stride_scheduler import StrideScheduler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -29,8 +36,13 @@ ENVIRONMENT = os.getenv('ENVIRONMENT')
 
 # Production URL
 URL = os.getenv("URL")
+DATA_DIR = './data'
 ID_FILE = './data/id'
 
+# Compass direction (degrees) the top of the camera image faces, also
+# registered as the device direction
+CAMERA_DIRECTION = 25
+
 # Device ID (Only 1 device in use for now)
 DEVICE_ID = os.getenv("DEVICE_ID")
 
@@ -38,138 +50,106 @@ DEVICE_ID = os.getenv("DEVICE_ID")
 model = YOLO("best.pt")
 
 # Initialize SORT tracker
-tracker = Sort(max_age=40, min_hits=3, iou_threshold=0.25)
+tracker = BatchSort(max_age=40, min_hits=3, iou_threshold=0.25)
+
+# Reports each hornet once, when the tracker drops its track
+lifecycle = TrackLifecycle(tracker, bearings=True)
+
+# The hive entrance as (x1, y1, x2, y2) fractions of the frame; the model
+# only runs when something moves there or the tracker has live tracks.
+# None watches the whole frame.
+ENTRANCE_ROI = None
+gate = MotionGate(roi=ENTRANCE_ROI)
 
 # Open video file
 video_path = "test_video.mp4"
 cap = cv2.VideoCapture(video_path)
-frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 
-# Dictionary to track hornet first detections
-first_detections = {}
+# While hornets are tracked the model runs on every frame or every other
+# one and the tracker predicts in between; the motion gate decides while
+# none are. The video file waits for the model, so its run time does not
+# lengthen the stride (load=None): bench_stride.py scores this at MOTA
+# 0.733 with 78% of the model runs, against 0.710 on every frame.
+scheduler = StrideScheduler(tracker, fps=cap.get(cv2.CAP_PROP_FPS) or 30., max_stride=2, idle_stride=1,
+                            load=None)
 
 # Initialize the BeeSafeClient (with device ID if available)
-if os.path.isfile(ID_FILE):
-    with open(ID_FILE) as f:
-        device_id = f.read().strip()
-        print(f"Using device id {device_id}")
-        # pass dummy values, they are not used if device_id is set
-        client = beesafe.BeeSafeClient(URL, 0, 0, 0, device_id=device_id)
-else:
-    client = beesafe.BeeSafeClient(URL, 51.163000 + uniform(-0.01, 0.01), 4.989118 + uniform(-0.02, 0.02), 25)
+async def connect_client():
+    if os.path.isfile(ID_FILE):
+        with open(ID_FILE) as f:
+            device_id = f.read().strip()
+            print(f"Using device id {device_id}")
+            # pass dummy values, they are not used if device_id is set
+            return await AsyncBeeSafeClient.create(URL, 0, 0, 0, device_id=device_id)
+    client = await AsyncBeeSafeClient.create(URL, 51.163000 + uniform(-0.01, 0.01), 4.989118 + uniform(-0.02, 0.02), CAMERA_DIRECTION)
     # write the id to a file, so we can pick it up later
     with open(ID_FILE, "w") as f:
         f.write(client.device_id)
-
-def get_known_hornet_id():
-    """Fetch an existing KnownHornetId from the KnownHornet table."""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-
-        # Fetch an existing KnownHornetId (modify this query if needed)
-        cursor.execute("SELECT TOP 1 Id FROM dbo.KnownHornet ORDER BY NEWID();")
-        row = cursor.fetchone()
-
-        if row:
-            known_hornet_id = row[0]
-            logging.info(f"Retrieved KnownHornetId: {known_hornet_id}")
-            return known_hornet_id  # Return a valid ID
-        else:
-            logging.error("No KnownHornetId found in the database.")
-            return None
-    except Exception as e:
-        logging.error(f"Database error while fetching KnownHornetId: {e}")
-        return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
-
-
-def save_to_database(timestamp, first_detection, second_detection, direction, hornet_count):
-    """Save detection event to database with a valid KnownHornetId."""
-    try:
-        known_hornet_id = get_known_hornet_id()  # Always fetch from KnownHornet table
-
-        if not known_hornet_id:
-            logging.error("No valid KnownHornetId found. Skipping database insert.")
-            return  # Stop execution if no valid ID
-
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-
-        detection_id = str(uuid.uuid4())
-
-        query = '''
-        INSERT INTO dbo.DetectionEvent (
-            Id, Timestamp, HornetDirection, FirstDetection, SecondDetection, 
-            IsManual, HornetCount, DeviceId, KnownHornetId
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        '''
-
-        cursor.execute(query, (
-            detection_id, timestamp, direction, first_detection, second_detection,
-            False, hornet_count, DEVICE_ID, known_hornet_id
-        ))
-        conn.commit()
-
-        logging.info(f"Detection saved: ID={detection_id}, HornetCount={hornet_count}, Direction={direction:.2f}")
-    except Exception as e:
-        logging.error(f"Database error: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'conn' in locals():
-            conn.close()
-
-def track_and_save_detections(detections, frame, timestamp):
-    """Update tracker with new detections and save to database."""
-    # Update SORT tracker with detections
-    tracked_objects = tracker.update(detections)
-    hornet_count = len(tracked_objects)
-
-    for obj in tracked_objects:
-        x1, y1, x2, y2, track_id = map(int, obj)  # Get tracking data
-
-        # Calculate hornet's direction based on x-coordinate (normalized)
-        x_center = (x1 + x2) / 2
-        normalized_x = x_center / frame_width
-        hornet_direction = float(normalized_x * 180.0)
-
-        # Handle first detection and second detection logic
-        if track_id not in first_detections:
-            first_detections[track_id] = timestamp
-            second_detection_time = None
-            logging.info(f"First detection for Hornet ID {track_id}")
+    return client
+
+# Inserts detection events in batches over one connection, from its own
+# thread, so the frame loop never waits for the database
+writer = DetectionWriter(lambda: pyodbc.connect(DB_CONNECTION_STRING), DEVICE_ID)
+
+def save_to_database(event):
+    """
+    Queue one detection event for the database for a hornet that left;
+    returns its (hornet_direction, timestamp) for the server.
+    """
+    summary = event['summary']
+
+    # Compass bearing the hornet flew off in, estimated from its whole track
+    hornet_direction = float(compass_bearing(summary['bearing'], CAMERA_DIRECTION))
+
+    writer.save(summary['last_seen'], summary['first_seen'], summary['last_seen'],
+                hornet_direction, summary['max_count'])
+    logging.info(f"Hornet ID {event['track_id']} left after {summary['frames']} frames, "
+                 f"bearing {hornet_direction:.1f} (confidence {summary['bearing_confidence']:.2f})")
+    return hornet_direction, summary['last_seen']
+
+def track_and_save_detections(detections, frame, timestamp, dt):
+    """
+    Update tracker with new detections and save the hornets that left;
+    returns their detection events for the server.
+    """
+    # Update SORT tracker with detections; the colours of the boxes keep
+    # crossing hornets apart
+    tracked_objects, events = lifecycle.update(detections, timestamp, dt, color_features(frame, detections))
+
+    uploads = []
+    for event in events:
+        if event['type'] == EXIT:
+            uploads.append(save_to_database(event))
         else:
-            second_detection_time = timestamp
-            logging.info(f"Second detection for Hornet ID {track_id}")
-        
-        # Save to database
-        save_to_database(timestamp, first_detections[track_id], second_detection_time, hornet_direction, hornet_count)
-
-def ping_server():
-    while True:
-        # Ping the server
-        client.send_ping()
-        print("Sent ping to server.")
-        sleep(10)
-
-def main():
-    ping_thread = Thread(target=ping_server)
-    ping_thread.start()
-    ping_thread.join()
+            logging.info(f"First detection for Hornet ID {event['track_id']}")
+    return uploads
 
-    # Process video
+def read_frames():
     while cap.isOpened():
         ret, frame = cap.read()
         if not ret:
             break
-
-        timestamp = datetime.now()
+        yield frame, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.
+
+def detect(item):
+    """
+    Run the model on a frame, then track and save its detections; returns
+    the detection events to upload.
+    """
+    frame, frame_time = item
+    timestamp = datetime.now()
+    detections = []
+    run_model, dt = scheduler.next_frame(frame_time)
+
+    # Skipped frames still go to the tracker, so its tracks age normally
+    if gate.should_detect(frame, active=len(tracker.live_ids()) > 0):
+        if not run_model:
+            # between detections: tracks only move along their predictions
+            lifecycle.predict(dt)
+            return []
+        start = time.perf_counter()
         results = model(frame)
-        detections = []
-
+        scheduler.record(time.perf_counter() - start)
         for r in results:
             for box in r.boxes:
                 x1, y1, x2, y2 = box.xyxy[0].tolist()
@@ -177,16 +157,38 @@ def main():
                 if conf > 0.25:
                     detections.append([x1, y1, x2, y2, conf])
 
-        detections = np.array(detections)
-        if detections.shape[0] == 0:
-            detections = np.empty((0, 5))
+    detections = np.array(detections)
+    if detections.shape[0] == 0:
+        detections = np.empty((0, 5))
+
+    # Track and save detections
+    return track_and_save_detections(detections, frame, timestamp, dt)
+
+async def run_device():
+    client = await connect_client()
+    # Detection events wait in DATA_DIR until the server has them
+    runtime = DeviceRuntime(client, outbox_path=default_outbox_path(DATA_DIR))
+
+    async def process_video():
+        # Process video in the runtime's executor while it pings the server
+        # and uploads the detection events
+        await runtime.process_frames(read_frames(), detect)
+
+        # Hornets still in view when the video ends
+        for event in lifecycle.close():
+            runtime.upload(*save_to_database(event))
+
+    await runtime.run(process_video())
 
-        # Track and save detections
-        track_and_save_detections(detections, frame, timestamp)
-    
     cap.release()
+    writer.close()
     cv2.destroyAllWindows()
+    logging.info(f"Motion gate: {gate.stats()}")
+    logging.info(f"Detector stride: {scheduler.stats()}")
     logging.info("Video processing completed.")
 
+def main():
+    asyncio.run(run_device())
+
 if __name__ == '__main__':
     main()
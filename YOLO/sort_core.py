@@ -0,0 +1,335 @@
+"""
+    SORT: A Simple, Online and Realtime Tracker
+    Copyright (C) 2016-2020 Alex Bewley alex@bewley.ai
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Tracker core: needs only NumPy and the assignment solver, so it imports
+    quickly on a headless device. The MOT demo and its plotting live in
+    sort.py.
+"""
+from __future__ import print_function
+
+import numpy as np
+from kalman_bank import KalmanBank, transition_matrix
+from association import linear_assignment, iou_batch, associate_detections_to_trackers
+
+
+def convert_bbox_to_z(bbox):
+  """
+  Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form
+    [x,y,s,r] where x,y is the centre of the box and s is the scale/area and r is
+    the aspect ratio
+  """
+  w = bbox[2] - bbox[0]
+  h = bbox[3] - bbox[1]
+  x = bbox[0] + w/2.
+  y = bbox[1] + h/2.
+  s = w * h    #scale is just area
+  r = w / float(h)
+  return np.array([x, y, s, r]).reshape((4, 1))
+
+
+def convert_x_to_bbox(x,score=None):
+  """
+  Takes a bounding box in the centre form [x,y,s,r] and returns it in the form
+    [x1,y1,x2,y2] where x1,y1 is the top left and x2,y2 is the bottom right
+  """
+  w = np.sqrt(x[2] * x[3])
+  h = x[2] / w
+  if(score==None):
+    return np.array([x[0]-w/2.,x[1]-h/2.,x[0]+w/2.,x[1]+h/2.]).reshape((1,4))
+  else:
+    return np.array([x[0]-w/2.,x[1]-h/2.,x[0]+w/2.,x[1]+h/2.,score]).reshape((1,5))
+
+
+def smooth_features(old, new, smoothing):
+  """
+  Running average of unit-length appearance features: moves each row of old a fraction smoothing
+    towards the same row of new and scales it back to unit length. Rows of old that are all zero,
+    tracks without a feature yet, take the new row as it is.
+  """
+  avg = (1. - smoothing) * old + smoothing * new
+  empty = ~old.any(axis=1)
+  avg[empty] = new[empty]
+  norm = np.linalg.norm(avg, axis=1, keepdims=True)
+  return np.divide(avg, norm, out=np.zeros_like(avg), where=norm > 0)
+
+
+class KalmanBoxTracker(object):
+  """
+  This class represents the internal state of individual tracked objects observed as bbox.
+  """
+  count = 0
+  def __init__(self,bbox):
+    """
+    Initialises a tracker using initial bounding box.
+    """
+    # filterpy pulls in scipy.stats, so only load it once a track is created
+    from filterpy.kalman import KalmanFilter
+    #define constant velocity model
+    self.kf = KalmanFilter(dim_x=7, dim_z=4) 
+    self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
+    self.kf.H = np.array([[1,0,0,0,0,0,0],[0,1,0,0,0,0,0],[0,0,1,0,0,0,0],[0,0,0,1,0,0,0]])
+
+    self.kf.R[2:,2:] *= 10.
+    self.kf.P[4:,4:] *= 1000. #give high uncertainty to the unobservable initial velocities
+    self.kf.P *= 10.
+    self.kf.Q[-1,-1] *= 0.01
+    self.kf.Q[4:,4:] *= 0.01
+
+    self.kf.x[:4] = convert_bbox_to_z(bbox)
+    self.time_since_update = 0
+    self.id = KalmanBoxTracker.count
+    KalmanBoxTracker.count += 1
+    self.history = []
+    self.hits = 0
+    self.hit_streak = 0
+    self.age = 0
+    self.feature = None
+
+  def update(self,bbox):
+    """
+    Updates the state vector with observed bbox.
+    """
+    self.time_since_update = 0
+    self.history = []
+    self.hits += 1
+    self.hit_streak += 1
+    self.kf.update(convert_bbox_to_z(bbox))
+
+  def _advance(self, dt):
+    if((self.kf.x[6]*dt+self.kf.x[2])<=0):
+      self.kf.x[6] *= 0.0
+    if dt == 1:
+      self.kf.predict()
+    else:
+      self.kf.predict(F=transition_matrix(dt), Q=self.kf.Q*dt)
+
+  def predict(self, dt=1.):
+    """
+    Advances the state vector dt frames and returns the predicted bounding box estimate.
+    """
+    self._advance(dt)
+    self.age += 1
+    if(self.time_since_update>0):
+      self.hit_streak = 0
+    self.time_since_update += 1
+    self.history.append(convert_x_to_bbox(self.kf.x))
+    return self.history[-1]
+
+  def coast(self, dt):
+    """
+    Advances the state vector dt frames on a frame the detector skipped, without counting it
+    as a missed frame. Returns the bounding box estimate.
+    """
+    self._advance(dt)
+    return self.get_state()
+
+  def get_state(self):
+    """
+    Returns the current bounding box estimate.
+    """
+    return convert_x_to_bbox(self.kf.x)
+
+
+class Sort(object):
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, appearance_weight=0.5, feature_smoothing=0.1):
+    """
+    Sets key parameters for SORT
+      appearance_weight - the weight of feature similarity against IoU when update is given
+        appearance features; 0 ignores them.
+      feature_smoothing - the weight of a new detection in the running average of a track's feature.
+    """
+    self.max_age = max_age
+    self.min_hits = min_hits
+    self.iou_threshold = iou_threshold
+    self.appearance_weight = appearance_weight
+    self.feature_smoothing = feature_smoothing
+    self.trackers = []
+    self.frame_count = 0
+
+  def update(self, dets=np.empty((0, 5)), dt=1., features=None):
+    """
+    Params:
+      dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+      dt - the time since the last update or predict, in frames; e.g. 2 after a dropped frame.
+      features - (optional) an appearance feature per detection, one unit-length row each, e.g. the
+        colour histograms of color_reid.color_features. Tracks keep a running average of the
+        features of their detections, and ambiguous matches go to the track that looks alike.
+    Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections),
+      or predict for frames the detector skips.
+    Returns the a similar array, where the last column is the object ID.
+
+    NOTE: The number of objects returned may differ from the number of detections provided.
+    """
+    self.frame_count += 1
+    # get predicted locations from existing trackers.
+    trks = np.zeros((len(self.trackers), 5))
+    to_del = []
+    ret = []
+    for t, trk in enumerate(trks):
+      pos = self.trackers[t].predict(dt)[0]
+      trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
+      if np.any(np.isnan(pos)):
+        to_del.append(t)
+    trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
+    for t in reversed(to_del):
+      self.trackers.pop(t)
+    trk_features = None
+    if features is not None:
+      trk_features = np.zeros((len(self.trackers), features.shape[1]))
+      for t, trk in enumerate(self.trackers):
+        if trk.feature is not None:
+          trk_features[t] = trk.feature
+    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold,
+        features, trk_features, self.appearance_weight)
+
+    # update matched trackers with assigned detections
+    for m in matched:
+      self.trackers[m[1]].update(dets[m[0], :])
+    if features is not None and len(matched):
+      smoothed = smooth_features(trk_features[matched[:, 1]], features[matched[:, 0]], self.feature_smoothing)
+      for m, feature in zip(matched, smoothed):
+        self.trackers[m[1]].feature = feature
+
+    # create and initialise new trackers for unmatched detections
+    for i in unmatched_dets:
+        trk = KalmanBoxTracker(dets[i,:])
+        if features is not None:
+          trk.feature = features[i]
+        self.trackers.append(trk)
+    i = len(self.trackers)
+    for trk in reversed(self.trackers):
+        d = trk.get_state()[0]
+        if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
+          ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1)) # +1 as MOT benchmark requires positive
+        i -= 1
+        # remove dead tracklet
+        if(trk.time_since_update > self.max_age):
+          self.trackers.pop(i)
+    if(len(ret)>0):
+      return np.concatenate(ret)
+    return np.empty((0,5))
+
+  def predict(self, dt=1.):
+    """
+    Moves every track dt frames ahead on a frame the detector skipped. Returns the tracks the
+    last update output, at their predicted positions and in the same format and order. Ages,
+    hit streaks and max_age are not affected: they count updates, not frames.
+    """
+    ret = []
+    for trk in reversed(self.trackers):
+      d = trk.coast(dt)[0]
+      if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits) \
+          and not np.any(np.isnan(d)):
+        ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1))
+    if(len(ret)>0):
+      return np.concatenate(ret)
+    return np.empty((0,5))
+
+  def live_ids(self):
+    """
+    Returns the IDs (as in the output of update) of all tracks still kept,
+    including tentative and coasting ones.
+    """
+    return np.array([trk.id+1 for trk in self.trackers], dtype=int)
+
+class BatchSort(object):
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, appearance_weight=0.5, feature_smoothing=0.1):
+    """
+    Drop-in replacement for Sort that keeps all tracks in a single KalmanBank,
+    so every frame runs one batched predict and one batched update instead of
+    a Python loop over KalmanBoxTracker objects.
+    """
+    self.max_age = max_age
+    self.min_hits = min_hits
+    self.iou_threshold = iou_threshold
+    self.appearance_weight = appearance_weight
+    self.feature_smoothing = feature_smoothing
+    self.bank = KalmanBank()
+    # the appearance feature of every bank row, once update was given features
+    self.features = None
+    self.frame_count = 0
+
+  def _keep(self, mask):
+    self.bank.keep(mask)
+    if self.features is not None:
+      self.features = self.features[mask]
+
+  def update(self, dets=np.empty((0, 5)), dt=1., features=None):
+    """
+    Same contract as Sort.update: takes [[x1,y1,x2,y2,score],...] and optional
+    features and returns [[x1,y1,x2,y2,id],...] in the same order Sort would.
+    """
+    self.frame_count += 1
+    bank = self.bank
+    # get predicted locations from existing trackers.
+    trks = bank.predict(dt)
+    valid = ~np.any(np.isnan(trks), axis=1)
+    if not valid.all():
+      self._keep(valid)
+      trks = trks[valid]
+    if features is not None and self.features is None:
+      self.features = np.zeros((len(bank), features.shape[1]))
+    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold,
+        features, self.features, self.appearance_weight)
+
+    # update matched trackers with assigned detections
+    bank.update(matched[:, 1], dets[matched[:, 0], :4])
+    if features is not None and len(matched):
+      self.features[matched[:, 1]] = smooth_features(self.features[matched[:, 1]], features[matched[:, 0]],
+                                                     self.feature_smoothing)
+
+    # create and initialise new trackers for unmatched detections
+    unmatched_dets = np.asarray(unmatched_dets, dtype=int)
+    ids = KalmanBoxTracker.count + np.arange(len(unmatched_dets))
+    KalmanBoxTracker.count += len(unmatched_dets)
+    bank.add(dets[unmatched_dets, :4], ids)
+    if self.features is not None:
+      new = features[unmatched_dets] if features is not None else np.zeros((len(unmatched_dets), self.features.shape[1]))
+      self.features = np.concatenate((self.features, new))
+
+    n = len(bank)
+    state = bank.get_state()
+    time_since_update = bank.time_since_update[:n]
+    emit = (time_since_update < 1) & ((bank.hit_streak[:n] >= self.min_hits) | (self.frame_count <= self.min_hits))
+    rows = np.flatnonzero(emit)[::-1]
+    ret = np.concatenate((state[rows], bank.ids[rows, None] + 1), axis=1) # +1 as MOT benchmark requires positive
+    # remove dead tracklets
+    self._keep(time_since_update <= self.max_age)
+    if(len(ret)>0):
+      return ret
+    return np.empty((0,5))
+
+  def predict(self, dt=1.):
+    """
+    Same as Sort.predict.
+    """
+    bank = self.bank
+    n = len(bank)
+    state = bank.coast(dt)
+    emit = (bank.time_since_update[:n] < 1) & ((bank.hit_streak[:n] >= self.min_hits) | (self.frame_count <= self.min_hits))
+    emit &= ~np.any(np.isnan(state), axis=1)
+    rows = np.flatnonzero(emit)[::-1]
+    ret = np.concatenate((state[rows], bank.ids[rows, None] + 1), axis=1)
+    if(len(ret)>0):
+      return ret
+    return np.empty((0,5))
+
+  def live_ids(self):
+    """
+    Same as Sort.live_ids.
+    """
+    return self.bank.ids[:len(self.bank)] + 1
@@ -0,0 +1,167 @@
+# Decides on which frames the detector runs while hornets are tracked. On
+# the other frames the tracker only predicts (Sort.predict), which costs a
+# few microseconds per track instead of a model run. The stride, the number
+# of frames from one detection to the next, follows the tracks:
+#   - short while a track is tentative or overlaps another one, since those
+#     need detections to be confirmed or told apart
+#   - otherwise as long as the fastest track needs to move about its own
+#     size, so a turn cannot take it far off the predicted path before it
+#     is detected again
+#   - never so short that the detector takes more of the frame time than
+#     the load it is allowed, on average: a few runs can be saved up for
+#     when a new track needs them (only for live frames; a video file waits
+#     for the detector)
+# The tracker is stepped by the time since its last step, in frames, from
+# the frame timestamps, so dropped or irregular frames move tracks by the
+# right amount.
+import math
+
+import numpy as np
+
+from association import iou_batch
+from kalman_bank import convert_xs_to_bboxes
+
+
+def track_states(tracker):
+    """
+    Returns the Kalman states [x,y,s,r,vx,vy,vs] of all live tracks of a
+    Sort or BatchSort as an (n,7) array, with their hit streaks and frames
+    since their last detection as (n,) arrays.
+    """
+    if hasattr(tracker, 'bank'):
+        bank = tracker.bank
+        n = len(bank)
+        return bank.x[:n], bank.hit_streak[:n], bank.time_since_update[:n]
+    trackers = tracker.trackers
+    x = np.array([trk.kf.x[:, 0] for trk in trackers]).reshape(-1, 7)
+    return (x, np.array([trk.hit_streak for trk in trackers], dtype=int),
+            np.array([trk.time_since_update for trk in trackers], dtype=int))
+
+
+class StrideScheduler(object):
+    """
+    Call next_frame() with the timestamp of every frame; it returns whether
+    to run the detector and the step to give the tracker. Then either run
+    the detector, pass its run time to record() and call
+    ``tracker.update(dets, dt)``, or call ``tracker.predict(dt)``. A
+    detection that is due but skipped anyway (e.g. by a motion gate) is
+    not recorded, and stays due on the next frame.
+    """
+    def __init__(self, tracker, fps=30., min_stride=1, max_stride=2, idle_stride=None, max_shift=1.,
+                 load=0.9, burst=2, smoothing=0.2):
+        """
+        :param tracker: The Sort or BatchSort instance being fed.
+        :param float fps: The nominal frame rate; timestamps are converted
+            to frames of 1 / fps seconds.
+        :param int min_stride: The stride for tentative and overlapping
+            tracks; 1 detects on every frame.
+        :param int max_stride: The longest stride while tracks are alive.
+            Longer strides save more detector runs but switch more IDs on
+            turns (bench_stride.py).
+        :param int idle_stride: (optional) the stride without any tracks,
+            which bounds how late a new hornet is found; max_stride by
+            default.
+        :param float max_shift: How far, as a share of its smaller side, a
+            track may move between detections. The prediction follows it
+            meanwhile, so this can be about a whole box; it bounds how far a
+            turn takes a hornet off its predicted path.
+        :param float load: The share of the frame time the detector may
+            take on average; the stride grows when it is slower than that.
+            None does not limit it, for frames that wait for the detector.
+        :param float burst: How many detector runs the unused share may add
+            up to, so a few frames in a row can be detected (e.g. to confirm
+            a new track) at the cost of longer strides after them.
+        :param float smoothing: The weight of a new run time in the moving
+            average of the detector run time.
+        """
+        self.tracker = tracker
+        self.frame_interval = 1. / fps
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.idle_stride = idle_stride or max_stride
+        self.max_shift = max_shift
+        self.load = load
+        self.burst = burst
+        self.smoothing = smoothing
+
+        self.detector_seconds = None
+        self.stride = min_stride
+        self._last_timestamp = None
+        self._since_detect = math.inf
+        self._budget = 0.
+        self.frames = 0
+        self.detections = 0
+
+    def next_frame(self, timestamp):
+        """
+        Returns (detect, dt) for the frame at ``timestamp`` seconds: whether
+        to run the detector on it, and the frames since the tracker's last
+        step, e.g. 2. when one frame was dropped. Call it once per frame and
+        step the tracker after every call.
+        """
+        if self._last_timestamp is None:
+            dt = 1.
+        else:
+            dt = max(timestamp - self._last_timestamp, 0.) / self.frame_interval
+        self._last_timestamp = timestamp
+        self.frames += 1
+
+        self._since_detect += dt
+        self.stride = self._stride()
+        if self.load is not None and self.detector_seconds is not None:
+            self._budget = min(self._budget + dt * self.frame_interval * self.load,
+                               self.burst * self.detector_seconds)
+        # half a frame of slack, for timestamp jitter
+        detect = self._since_detect >= self.stride - .5 and self._budget >= 0.
+        return detect, dt
+
+    def record(self, seconds=None):
+        """
+        Counts a detector run on the last frame, which starts the next
+        stride, and adds its run time in seconds. Without a run time the
+        detector load is not limited.
+        """
+        self._since_detect = 0.
+        self.detections += 1
+        if seconds is None:
+            return
+        if self.detector_seconds is None:
+            self.detector_seconds = seconds
+        else:
+            self.detector_seconds += self.smoothing * (seconds - self.detector_seconds)
+        if self.load is not None:
+            self._budget -= seconds
+
+    def _stride(self):
+        x, hit_streak, time_since_update = track_states(self.tracker)
+        # tracks the last detection missed may have left; the ones it found
+        # decide how soon they need the next one
+        seen = time_since_update == 0
+        x, hit_streak = x[seen], hit_streak[seen]
+        if len(x) == 0:
+            stride = self.idle_stride
+        elif np.any(hit_streak < self.tracker.min_hits):
+            stride = self.min_stride
+        else:
+            boxes = convert_xs_to_bboxes(x)
+            if np.any(np.isnan(boxes)) or (len(boxes) > 1 and np.any(np.triu(iou_batch(boxes, boxes), 1) > 0)):
+                stride = self.min_stride
+            else:
+                side = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+                speed = np.hypot(x[:, 4], x[:, 5])
+                stride = int(np.clip(np.min(self.max_shift * side / np.maximum(speed, 1e-6)),
+                                     self.min_stride, self.max_stride))
+        return stride
+
+    def stats(self):
+        """
+        Returns the frames seen, the share of them the detector ran on, the
+        average number of frames per detection and the average detector run
+        time in milliseconds.
+        """
+        return {
+            'frames': self.frames,
+            'detect_rate': self.detections / self.frames if self.frames else 0.,
+            'avg_stride': self.frames / self.detections if self.detections else 0.,
+            'detector_ms': self.detector_seconds * 1000 if self.detector_seconds is not None else None,
+        }
@@ -0,0 +1,188 @@
+# Turns the per-frame output of Sort/BatchSort into a few events per
+# track: 'enter' when a track is confirmed, optional 'update' events while
+# it is seen, and 'exit' with a summary of the whole visit when the
+# tracker retires its ID. All per-track state is dropped at exit, so
+# memory stays flat however long the device runs.
+import numpy as np
+
+from bearing import BearingEstimator
+
+ENTER = 'enter'
+UPDATE = 'update'
+EXIT = 'exit'
+
+# track phases
+CONFIRMED = 'confirmed'
+COASTING = 'coasting'
+
+
+class TrackState(object):
+    """
+    What is known about one confirmed track. Times are whatever is passed
+    to TrackLifecycle.update (datetime or seconds).
+    """
+    __slots__ = ('track_id', 'phase', 'first_seen', 'last_seen', 'last_reported',
+                 'first_box', 'last_box', 'frames', 'max_count')
+
+    def __init__(self, track_id, timestamp, box, count):
+        self.track_id = track_id
+        self.phase = CONFIRMED
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.last_reported = timestamp
+        self.first_box = box
+        self.last_box = box
+        self.frames = 1
+        self.max_count = count
+
+    def summary(self):
+        """
+        Returns the visit of this track as a dict.
+        """
+        return {
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'duration': self.last_seen - self.first_seen,
+            'frames': self.frames,
+            'first_box': self.first_box,
+            'last_box': self.last_box,
+            'max_count': self.max_count,
+        }
+
+
+class TrackLifecycle(object):
+    """
+    Wraps a Sort or BatchSort tracker. A track is born tentative inside the
+    tracker, becomes confirmed the first frame the tracker outputs it
+    (ENTER), is coasting while the tracker keeps predicting it without
+    detections, and dies when the tracker drops its ID (EXIT). Tentative
+    tracks that die before being confirmed produce no events.
+    """
+    def __init__(self, tracker, update_interval=None, summaries=True, bearings=False):
+        """
+        :param tracker: A Sort or BatchSort instance.
+        :param update_interval: (optional) emit an UPDATE for a visible
+            track at most this often, in the units of the timestamps; None
+            emits no UPDATEs.
+        :param bool summaries: (optional) attach the track summary to EXIT
+            events.
+        :param bool bearings: (optional) estimate the departure bearing of
+            every track and add 'bearing' and 'bearing_confidence' to its
+            summary (see bearing.BearingEstimator).
+        """
+        self.tracker = tracker
+        self.update_interval = update_interval
+        self.summaries = summaries
+        self.bearings = BearingEstimator(tracker) if bearings else None
+        self.tracks = {}
+        self.entered = 0
+        self.exited = 0
+
+    def update(self, dets, timestamp, dt=1., features=None):
+        """
+        Runs the tracker on one frame of detections.
+
+        :param dets: [[x1,y1,x2,y2,score],...] as for Sort.update.
+        :param timestamp: The time of the frame.
+        :param dt: (optional) frames since the last update or predict, as
+            for Sort.update.
+        :param features: (optional) appearance features of the detections,
+            as for Sort.update.
+        :returns: The tracker output [[x1,y1,x2,y2,id],...] and the list of
+            events of this frame, each a dict with 'type', 'track_id',
+            'timestamp', 'box' and, for EXIT, 'summary'.
+        """
+        tracked = self.tracker.update(dets, dt, features)
+        if self.bearings is not None:
+            self.bearings.observe(tracked, dt)
+        events = []
+        count = len(tracked)
+        seen = set()
+
+        for row in tracked:
+            track_id = int(row[4])
+            box = tuple(float(v) for v in row[:4])
+            seen.add(track_id)
+            track = self.tracks.get(track_id)
+            if track is None:
+                track = self.tracks[track_id] = TrackState(track_id, timestamp, box, count)
+                self.entered += 1
+                events.append(self._event(ENTER, track, timestamp))
+                continue
+            track.phase = CONFIRMED
+            track.last_seen = timestamp
+            track.last_box = box
+            track.frames += 1
+            track.max_count = max(track.max_count, count)
+            if self.update_interval is not None and timestamp - track.last_reported >= self.update_interval:
+                track.last_reported = timestamp
+                events.append(self._event(UPDATE, track, timestamp))
+
+        if len(self.tracks) > len(seen):
+            live = self.tracker.live_ids()
+            dead = []
+            for track_id in [i for i in self.tracks if i not in seen]:
+                if np.any(live == track_id):
+                    self.tracks[track_id].phase = COASTING
+                else:
+                    dead.append(track_id)
+            events += self._exit(dead)
+
+        return tracked, events
+
+    def predict(self, dt=1.):
+        """
+        Carries the tracks over a frame the detector skipped (see
+        Sort.predict). No events: tracks are only born, confirmed and
+        ended on frames with detections.
+
+        :returns: The predicted tracker output [[x1,y1,x2,y2,id],...].
+        """
+        if self.bearings is not None:
+            self.bearings.advance(dt)
+        return self.tracker.predict(dt)
+
+    def close(self):
+        """
+        Ends every track that is still alive, e.g. at the end of a video.
+        Returns their EXIT events.
+        """
+        return self._exit(list(self.tracks))
+
+    def _exit(self, track_ids):
+        if not track_ids:
+            return []
+        if self.bearings is not None:
+            # all tracks ending in this frame in one go
+            bearing, confidence = self.bearings.estimate(track_ids)
+            self.bearings.release(track_ids)
+        events = []
+        for k, track_id in enumerate(track_ids):
+            track = self.tracks.pop(track_id)
+            self.exited += 1
+            event = self._event(EXIT, track, track.last_seen)
+            if self.summaries:
+                event['summary'] = track.summary()
+                if self.bearings is not None:
+                    event['summary']['bearing'] = float(bearing[k])
+                    event['summary']['bearing_confidence'] = float(confidence[k])
+            events.append(event)
+        return events
+
+    def _event(self, type, track, timestamp):
+        return {
+            'type': type,
+            'track_id': track.track_id,
+            'timestamp': timestamp,
+            'box': track.last_box,
+        }
+
+    def stats(self):
+        """
+        Returns the number of tracks entered, exited and currently alive.
+        """
+        return {
+            'entered': self.entered,
+            'exited': self.exited,
+            'alive': len(self.tracks),
+        }
@@ -2,12 +2,18 @@ import torch
 from ultralytics import YOLO
 import cv2
 import logging
+import time
 import pyodbc
-import uuid
 from datetime import datetime
 import numpy as np
-from sort import Sort
-import time
+import repo_paths  # noqa: F401
+from sort_core import BatchSort
+from detection_writer import DetectionWriter
+from track_lifecycle import TrackLifecycle, EXIT
+from bearing import compass_bearing
+from motion_gate import MotionGate
+from color_reid import color_features
+from stride_scheduler import StrideScheduler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -26,104 +32,55 @@ DB_CONNECTION_STRING = (
 
 # Device ID (Only 1 device in use for now)
 DEVICE_ID = "4b9a002b-3725-4b74-b034-43e98bb52520"
-#KNOWN_HORNET_ID = "958659d4-bc71-4432-8ba7-fce7a47b0f94"
 
+# Compass direction (degrees) the top of the camera image faces
+CAMERA_DIRECTION = 0.0
+#KNOWN_HORNET_ID = "958659d4-bc71-4432-8ba7-fce7a47b0f94"
 
-# Dictionary to track the last time a detection was saved for each hornet
-last_saved_time = {}  # Format: {track_id: last_saved_timestamp}
-SAVE_DELAY = 3  # Minimum delay in seconds between database inserts per hornet ID
 
 # Load YOLO model
 model = YOLO("best.pt")
 
 # Initialize SORT tracker
-tracker = Sort(max_age=40, min_hits=3, iou_threshold=0.25)
+tracker = BatchSort(max_age=40, min_hits=3, iou_threshold=0.25)
+
+# Reports each hornet once, when the tracker drops its track
+lifecycle = TrackLifecycle(tracker, bearings=True)
+
+# The hive entrance as (x1, y1, x2, y2) fractions of the frame; the model
+# only runs when something moves there or the tracker has live tracks.
+# None watches the whole frame.
+ENTRANCE_ROI = None
+gate = MotionGate(roi=ENTRANCE_ROI)
 
 # Open video file
 video_path = "test_video.mp4"
 cap = cv2.VideoCapture(video_path)
-frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-
-# Dictionary to track hornet first detections
-first_detections = {}
-
-
-def get_known_hornet_id():
-    """Fetch an existing KnownHornetId from the KnownHornet table."""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-
-        # Fetch an existing KnownHornetId (modify this query if needed)
-        cursor.execute("SELECT TOP 1 Id FROM dbo.KnownHornet ORDER BY NEWID();")
-        row = cursor.fetchone()
-
-        if row:
-            known_hornet_id = row[0]
-            logging.info(f"Retrieved KnownHornetId: {known_hornet_id}")
-            return known_hornet_id  # Return a valid ID
-        else:
-            logging.error("No KnownHornetId found in the database.")
-            return None
-    except Exception as e:
-        logging.error(f"Database error while fetching KnownHornetId: {e}")
-        return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
-
 
+# While hornets are tracked the model runs on every frame or every other
+# one and the tracker predicts in between; the motion gate decides while
+# none are. The video file waits for the model, so its run time does not
+# lengthen the stride (load=None): bench_stride.py scores this at MOTA
+# 0.733 with 78% of the model runs, against 0.710 on every frame.
+scheduler = StrideScheduler(tracker, fps=cap.get(cv2.CAP_PROP_FPS) or 30., max_stride=2, idle_stride=1,
+                            load=None)
 
-def save_to_database(timestamp, first_detection, second_detection, direction, hornet_count, track_id):
-    """Save detection event to database with a valid KnownHornetId."""
+# Inserts detection events in batches over one connection, from its own
+# thread, so the frame loop never waits for the database
+writer = DetectionWriter(lambda: pyodbc.connect(DB_CONNECTION_STRING), DEVICE_ID)
 
-    global last_saved_time
 
-    try:
-        known_hornet_id = get_known_hornet_id()  # Always fetch from KnownHornet table
+def save_to_database(event):
+    """Queue one detection event for the database for a hornet that left."""
+    summary = event['summary']
 
-        if not known_hornet_id:
-            logging.error("No valid KnownHornetId found. Skipping database insert.")
-            return  # Stop execution if no valid ID
+    # Compass bearing the hornet flew off in, estimated from its whole track
+    hornet_direction = float(compass_bearing(summary['bearing'], CAMERA_DIRECTION))
 
-
-         # Check if enough time has passed since the last save
-        last_time = last_saved_time.get(track_id, 0)
-        current_time = time.time()
-
-        if current_time - last_time < SAVE_DELAY:
-            logging.info(f"Skipping database insert for Hornet ID {track_id}, delay not met.")
-            return  # Skip this insert
-
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-
-        detection_id = str(uuid.uuid4())
-
-        query = '''
-        INSERT INTO dbo.DetectionEvent (
-            Id, Timestamp, HornetDirection, FirstDetection, SecondDetection, 
-            IsManual, HornetCount, DeviceId, KnownHornetId
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        '''
-
-        cursor.execute(query, (
-            detection_id, timestamp, direction, first_detection, second_detection,
-            False, hornet_count, DEVICE_ID, known_hornet_id
-        ))
-        conn.commit()
-
-        # Update last saved time
-        last_saved_time[track_id] = current_time
-
-        logging.info(f"Detection saved: ID={detection_id}, HornetCount={hornet_count}, Direction={direction:.2f}")
-    except Exception as e:
-        logging.error(f"Database error: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    writer.save(summary['last_seen'], summary['first_seen'], summary['last_seen'],
+                hornet_direction, summary['max_count'])
+    logging.info(f"Hornet ID {event['track_id']} left after {summary['frames']} frames, "
+                 f"bearing {hornet_direction:.1f} (confidence {summary['bearing_confidence']:.2f})")
 
 
 
@@ -134,42 +91,45 @@ while cap.isOpened():
         break
     
     timestamp = datetime.now()
-    results = model(frame)
     detections = []
+    run_model, dt = scheduler.next_frame(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.)
     
-    for r in results:
-        for box in r.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            conf = box.conf[0].item()
-            if conf > 0.25:
-                detections.append([x1, y1, x2, y2, conf])
+    # Skipped frames still go to the tracker, so its tracks age normally
+    if gate.should_detect(frame, active=len(tracker.live_ids()) > 0):
+        if not run_model:
+            # between detections: tracks only move along their predictions
+            lifecycle.predict(dt)
+            continue
+        start = time.perf_counter()
+        results = model(frame)
+        scheduler.record(time.perf_counter() - start)
+        for r in results:
+            for box in r.boxes:
+                x1, y1, x2, y2 = box.xyxy[0].tolist()
+                conf = box.conf[0].item()
+                if conf > 0.25:
+                    detections.append([x1, y1, x2, y2, conf])
     
     detections = np.array(detections)
     if detections.shape[0] == 0:
         detections = np.empty((0, 5))
     
-    # Update SORT tracker
-    tracked_objects = tracker.update(detections)
-    hornet_count = len(tracked_objects)
-    
-    for obj in tracked_objects:
-        x1, y1, x2, y2, track_id = map(int, obj)
-        x_center = (x1 + x2) / 2
-        normalized_x = x_center / frame_width
-        hornet_direction = float(normalized_x * 180.0)
-        
-        # Check if hornet was detected before
-        if track_id not in first_detections:
-            first_detections[track_id] = timestamp
-            second_detection_time = None
-            logging.info(f"First detection for Hornet ID {track_id}")
+    # Update SORT tracker; the colours of the boxes keep crossing hornets apart
+    tracked_objects, events = lifecycle.update(detections, timestamp, dt, color_features(frame, detections))
+
+    for event in events:
+        if event['type'] == EXIT:
+            save_to_database(event)
         else:
-            second_detection_time = timestamp
-            logging.info(f"Second detection for Hornet ID {track_id}")
-        
-        # Save to database
-        save_to_database(timestamp, first_detections[track_id], second_detection_time, hornet_direction, hornet_count)
-    
+            logging.info(f"First detection for Hornet ID {event['track_id']}")
+
+# Hornets still in view when the video ends
+for event in lifecycle.close():
+    save_to_database(event)
+
 cap.release()
+writer.close()
 cv2.destroyAllWindows()
+logging.info(f"Motion gate: {gate.stats()}")
+logging.info(f"Detector stride: {scheduler.stats()}")
 logging.info("Video processing completed.")
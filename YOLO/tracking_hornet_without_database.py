@@ -1,7 +1,7 @@
 import cv2  # OpenCV library for handling video frames and drawing
 import numpy as np  # NumPy for array operations
 from ultralytics import YOLO  # Importing the YOLO object detection model from Ultralytics
-from sort import Sort  # Importing the SORT tracker for tracking objects across frames
+from sort_core import BatchSort  # Importing the SORT tracker for tracking objects across frames
 
 # Load the YOLOv11 model with pre-trained weights
 model = YOLO("best.pt")
@@ -10,7 +10,7 @@ model = YOLO("best.pt")
 # - max_age: Number of frames an object can be missing before being removed
 # - min_hits: Minimum detections before an object is considered valid
 # - iou_threshold: IoU threshold for associating detections with existing tracks
-tracker = Sort(max_age=50, min_hits=3, iou_threshold=0.50)
+tracker = BatchSort(max_age=50, min_hits=3, iou_threshold=0.50)
 
 # Load video from file
 cap = cv2.VideoCapture("test_video.mp4")
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+#
+# Offline analysis of archived videos (e.g. a season of GoPro footage):
+# detects and tracks every frame and writes the tracks of each video to a
+# compact results file. Per video:
+#   - a decoder process reads and letterboxes the frames into a ring of
+#     model-sized slots in shared memory, so decoding runs next to
+#     inference instead of between its calls
+#   - the frames go through the model in batches of --batch (export it
+#     with dynamic=True, or with batch=N)
+#   - a checkpoint is written every --checkpoint-every frames, so a run
+#     that is stopped continues where it left off
+# Videos are spread over --workers processes, each with its own model.
+#
+# Results, in --out, per video:
+#   NAME.tracks  the tracker output as TRACK_DTYPE records (read_tracks())
+#   NAME.json    written when the video is done: counts, timing and the
+#                summary of every track (first/last seen in seconds,
+#                frames, bearing, ...)
+#   NAME.ckpt    the last checkpoint while the video is in progress
+# Videos with a NAME.json are skipped, so a run can simply be restarted.
+# The detector comes from device-code/, put on the path by repo_paths.
+#
+# usage: video_analyzer.py MODEL VIDEO|DIR [...] --out DIR [--batch 8] [--workers 2]
+#                          [--threads 0] [--conf 0.25] [--checkpoint-every 1800]
+
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import repo_paths  # noqa: F401
+from onnx_detector import OnnxDetector, decode, to_frame, PAD_VALUE
+from sort_core import BatchSort, KalmanBoxTracker
+from track_lifecycle import TrackLifecycle, EXIT
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+# One row of tracker output: the frame number (from 1), the track ID and
+# its box in frame pixels
+TRACK_DTYPE = np.dtype([('frame', '<u4'), ('track_id', '<u4'),
+                        ('x1', '<f4'), ('y1', '<f4'), ('x2', '<f4'), ('y2', '<f4')])
+
+# Seconds to wait for the decoder before deciding it died
+DECODER_TIMEOUT = 60.
+
+_detector = None
+
+
+def read_tracks(path):
+    """
+    Returns the records of a .tracks file as a TRACK_DTYPE array.
+    """
+    return np.fromfile(path, dtype=TRACK_DTYPE)
+
+
+def find_videos(paths):
+    """
+    Returns the video files among ``paths``, and inside the directories
+    among them, sorted.
+    """
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos += [p for p in glob.glob(os.path.join(path, '*')) if p.lower().endswith(VIDEO_EXTENSIONS)]
+        else:
+            videos.append(path)
+    return sorted(videos)
+
+
+def letterbox_layout(frame_size, input_size):
+    """
+    Returns (gain, width, height, top, left) of a frame of ``frame_size``
+    (h, w) letterboxed into ``input_size`` (h, w), as OnnxDetector does.
+    """
+    (h, w), (height, width) = frame_size, input_size
+    gain = min(height / h, width / w)
+    nw, nh = int(round(w * gain)), int(round(h * gain))
+    top = int(round((height - nh) / 2 - 0.1))
+    left = int(round((width - nw) / 2 - 0.1))
+    return gain, nw, nh, top, left
+
+
+def decode_video(path, start, shm_name, ring_shape, layout, free, filled):
+    """
+    The decoder process: reads ``path`` from frame ``start`` (0-based),
+    letterboxes every frame into a free slot of the shared ring and queues
+    (slot, frame number) on ``filled``, then None at the end.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray(ring_shape, dtype=np.uint8, buffer=shm.buf)
+    _, nw, nh, top, left = layout
+    cap = cv2.VideoCapture(path)
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        number = start
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            number += 1
+            slot = free.get()
+            cv2.resize(frame, (nw, nh), dst=ring[slot, top:top + nh, left:left + nw],
+                       interpolation=cv2.INTER_LINEAR)
+            filled.put((slot, number))
+    finally:
+        cap.release()
+        filled.put(None)
+        del ring
+        shm.close()
+
+
+class BatchRunner:
+    """
+    Runs an OnnxDetector's session on batches of letterboxed uint8 frames.
+    A model with a fixed batch runs in chunks of that size.
+    """
+    def __init__(self, detector, batch):
+        """
+        :param detector: The OnnxDetector whose session, input size and
+            thresholds are used.
+        :param int batch: The most frames per run.
+        """
+        self.detector = detector
+        model_input = detector.session.get_inputs()[0]
+        self._input_name = model_input.name
+        fixed = model_input.shape[0]
+        self._chunk = fixed if isinstance(fixed, int) else batch
+        rows = -(-batch // self._chunk) * self._chunk
+        self._input = np.empty((rows, 3) + detector.input_size, dtype=np.float32)
+
+    def run(self, frames):
+        """
+        Returns the decoded detections of every frame in ``frames`` (letterboxed
+        HWC BGR uint8 arrays), in model input pixels.
+        """
+        n = len(frames)
+        for k, frame in enumerate(frames):
+            # BGR to RGB, HWC to CHW and scaled to [0, 1], as OnnxDetector does
+            np.multiply(frame.transpose(2, 0, 1)[::-1], np.float32(1 / 255.), out=self._input[k])
+        outputs = []
+        for start in range(0, n, self._chunk):
+            chunk = self._input[start:start + self._chunk]
+            outputs.append(self.detector.session.run(None, {self._input_name: chunk})[0])
+        detector = self.detector
+        return [decode(prediction, detector.conf, detector.iou, detector.max_det)
+                for prediction in np.concatenate(outputs)[:n]]
+
+
+def _init_worker(model, conf, iou, imgsz, threads):
+    global _detector
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    _detector = OnnxDetector(model, conf=conf, iou=iou, imgsz=imgsz, intra_op_threads=threads)
+
+
+def _write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def analyze_video(path, out_dir, batch=8, checkpoint_every=1800, slots=None, tracker_params=None):
+    """
+    Detects and tracks one video in the current worker, resuming from its
+    checkpoint if there is one. Returns the summary also written to
+    NAME.json.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(out_dir, name)
+    tracks_path, ckpt_path = base + '.tracks', base + '.ckpt'
+    stat = os.stat(path)
+    source = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if min(frame_size) <= 0:
+        raise ValueError(f"Cannot read {path}")
+
+    state = None
+    if os.path.exists(ckpt_path):
+        with open(ckpt_path, 'rb') as f:
+            state = pickle.load(f)
+        if state['source'] != source:
+            logging.warning(f"{name}: the video changed since its checkpoint, starting over")
+            state = None
+    if state is None:
+        tracker = BatchSort(**(tracker_params or {'max_age': 40, 'min_hits': 3, 'iou_threshold': 0.25}))
+        state = {'source': source, 'frames': 0, 'rows': 0, 'next_id': 0, 'seconds': 0.,
+                 'lifecycle': TrackLifecycle(tracker, bearings=True), 'tracks': []}
+    else:
+        logging.info(f"{name}: resuming at frame {state['frames']}")
+    lifecycle = state['lifecycle']
+    tracker = lifecycle.tracker
+    KalmanBoxTracker.count = state['next_id']
+
+    detector = _detector
+    runner = BatchRunner(detector, batch)
+    layout = letterbox_layout(frame_size, detector.input_size)
+    gain, _, _, top, left = layout
+    h, w = frame_size
+
+    slots = slots or 3 * batch
+    ring_shape = (slots,) + detector.input_size + (3,)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(ring_shape)))
+    ring = np.ndarray(ring_shape, dtype=np.uint8, buffer=shm.buf)
+    # only the letterboxed area is written, the borders stay padding
+    ring[:] = PAD_VALUE
+    context = multiprocessing.get_context('spawn')
+    free, filled = context.Queue(), context.Queue()
+    for slot in range(slots):
+        free.put(slot)
+    decoder = context.Process(target=decode_video, daemon=True,
+                              args=(path, state['frames'], shm.name, ring_shape, layout, free, filled))
+    decoder.start()
+
+    # the rows written after the checkpoint are redone
+    tracks_file = open(tracks_path, 'r+b' if state['rows'] and os.path.exists(tracks_path) else 'wb')
+    tracks_file.truncate(state['rows'] * TRACK_DTYPE.itemsize)
+    tracks_file.seek(0, os.SEEK_END)
+
+    def record(number, tracked, events):
+        if len(tracked):
+            rows = np.empty(len(tracked), dtype=TRACK_DTYPE)
+            rows['frame'] = number
+            rows['track_id'] = tracked[:, 4]
+            for k, column in enumerate(('x1', 'y1', 'x2', 'y2')):
+                rows[column] = tracked[:, k]
+            tracks_file.write(rows.tobytes())
+            state['rows'] += len(rows)
+        state['tracks'] += [dict(event['summary'], track_id=event['track_id'])
+                            for event in events if event['type'] == EXIT]
+        state['frames'] = number
+
+    def flush(pending):
+        detections = runner.run([ring[slot] for slot, _ in pending])
+        for slot, _ in pending:
+            free.put(slot)
+        for (_, number), found in zip(pending, detections):
+            # back from the letterboxed input to the frame
+            found = to_frame(found, gain, top, left, w, h)
+            tracked, events = lifecycle.update(found[:, :5], number / fps)
+            record(number, tracked, events)
+
+    start = time.perf_counter()
+    resumed_at = last_checkpoint = state['frames']
+    pending = []
+    try:
+        while True:
+            try:
+                item = filled.get(timeout=DECODER_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError(f"{name}: the decoder stopped at frame {state['frames']}")
+            if item is not None:
+                pending.append(item)
+            if pending and (item is None or len(pending) == batch):
+                flush(pending)
+                pending = []
+            if item is None:
+                break
+            if state['frames'] - last_checkpoint >= checkpoint_every:
+                tracks_file.flush()
+                state['next_id'] = KalmanBoxTracker.count
+                state['seconds'] += time.perf_counter() - start
+                start = time.perf_counter()
+                _checkpoint(ckpt_path, state)
+                last_checkpoint = state['frames']
+    finally:
+        tracks_file.close()
+        decoder.join(timeout=5)
+        if decoder.is_alive():
+            decoder.terminate()
+        del ring
+        shm.close()
+        shm.unlink()
+
+    for event in lifecycle.close():
+        state['tracks'].append(dict(event['summary'], track_id=event['track_id']))
+    seconds = state['seconds'] + time.perf_counter() - start
+    summary = {
+        'video': source['path'],
+        'frames': state['frames'],
+        'frames_expected': total,
+        'fps': fps,
+        'frame_size': [w, h],
+        'rows': state['rows'],
+        'resumed_at': resumed_at,
+        'tracks': state['tracks'],
+        'seconds': seconds,
+        'frames_per_second': state['frames'] / max(seconds, 1e-9),
+    }
+    _write_json(base + '.json', summary)
+    if os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline batch video analyzer")
+    parser.add_argument("model", help="The exported .onnx model, ideally with dynamic=True.")
+    parser.add_argument("videos", nargs="+", help="Video files or directories of them.")
+    parser.add_argument("--out", required=True, help="Directory for the results.")
+    parser.add_argument("--batch", type=int, default=8, help="Frames per model run.")
+    parser.add_argument("--workers", type=int, default=1, help="Videos analysed at the same time.")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="onnxruntime intra-op threads per worker, 0 to share the cores out.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Input size of a model with a dynamic shape.")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold.")
+    parser.add_argument("--checkpoint-every", type=int, default=1800, help="Frames between checkpoints.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    os.makedirs(args.out, exist_ok=True)
+    videos = [v for v in find_videos(args.videos)
+              if not os.path.exists(os.path.join(args.out, os.path.splitext(os.path.basename(v))[0] + '.json'))]
+    if not videos:
+        logging.info("Nothing to do.")
+        return
+    # the decoders take a core each
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers - 1)
+
+    start = time.perf_counter()
+    frames = 0
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                             initargs=(args.model, args.conf, args.iou, args.imgsz, threads)) as pool:
+        futures = {pool.submit(analyze_video, video, args.out, args.batch, args.checkpoint_every): video
+                   for video in videos}
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                summary = future.result()
+            except Exception:
+                logging.exception(f"{video} failed, its checkpoint is kept")
+                continue
+            frames += summary['frames'] - summary['resumed_at']
+            logging.info(f"{os.path.basename(video)}: {summary['frames']} frames, {len(summary['tracks'])} tracks, "
+                         f"{summary['frames_per_second']:.1f} frames/s")
+    seconds = time.perf_counter() - start
+    logging.info(f"{len(videos)} videos, {frames} frames in {seconds:.0f} s ({frames / max(seconds, 1e-9):.1f} frames/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# Drives the deterrent relay from its own thread, so the detection loop
+# never sleeps while the relay is pulsed.
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+
+class FakeGPIO:
+    """
+    Stand-in for RPi.GPIO on machines without GPIO pins. Implements the
+    part of the API the device code uses and records every output change
+    as (time, pin, value), so the relay can be tested and benchmarked on a
+    plain Linux box.
+    """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    PUD_UP = 22
+    PUD_DOWN = 21
+    LOW = 0
+    HIGH = 1
+    FALLING = 32
+    RISING = 31
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}
+        self.callbacks = {}
+        self.changes = []
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.pins[pin] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+        if initial is not None:
+            self.pins[pin] = initial
+
+    def output(self, pin, value):
+        if self.pins.get(pin) != value:
+            self.changes.append((time.monotonic(), pin, value))
+        self.pins[pin] = value
+
+    def input(self, pin):
+        return self.pins.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def press(self, pin):
+        """Simulates a button press on ``pin`` by calling its callback."""
+        if self.callbacks.get(pin):
+            self.callbacks[pin](pin)
+
+    def cleanup(self):
+        self.pins.clear()
+
+
+class Actuator:
+    """
+    Pulses a relay without blocking the caller. trigger() only queues a
+    request; a background thread switches the relay on and keeps it on
+    until ``pulse_seconds`` after the last trigger, so triggers that
+    overlap merge into one pulse instead of queueing up several.
+    """
+    def __init__(self, gpio, pin: int, pulse_seconds: float = 0.5, enabled: bool = True,
+                 history: int = 1000):
+        """
+        :param gpio: The RPi.GPIO module, or a FakeGPIO.
+        :param int pin: The pin the relay is connected to, already set up
+            as output.
+        :param float pulse_seconds: How long the relay stays on after a
+            trigger.
+        :param bool enabled: (optional) whether triggers switch the relay.
+        :param int history: (optional) number of trigger-to-relay latencies
+            kept for stats().
+        """
+        self.gpio = gpio
+        self.pin = pin
+        self.pulse_seconds = pulse_seconds
+        self._enabled = enabled
+        self._requests = queue.Queue()
+        self._on = False
+        self._off_at = 0.0
+        self._stop = False
+        self.latencies = deque(maxlen=history)
+        self.triggers = 0
+        self.pulses = 0
+        self.merged = 0
+        self.ignored = 0
+        self.gpio.output(self.pin, self.gpio.LOW)
+        self._thread = threading.Thread(target=self._run, name="actuator", daemon=True)
+        self._thread.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def set_enabled(self, enabled: bool):
+        """
+        Enables or disables the relay, e.g. from the button callback.
+        Disabling switches a running pulse off.
+        """
+        self._enabled = enabled
+        self._requests.put(None)
+
+    def toggle(self) -> bool:
+        self.set_enabled(not self._enabled)
+        return self._enabled
+
+    def trigger(self):
+        """
+        Requests a pulse. Never blocks.
+        """
+        self.triggers += 1
+        self._requests.put(time.monotonic())
+
+    def close(self):
+        """
+        Stops the background thread and switches the relay off.
+        """
+        self._stop = True
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop:
+            timeout = max(0.0, self._off_at - time.monotonic()) if self._on else None
+            try:
+                requested = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                requested = None
+            now = time.monotonic()
+
+            if requested is not None:
+                if not self._enabled:
+                    self.ignored += 1
+                elif self._on:
+                    self.merged += 1
+                    self._off_at = max(self._off_at, now + self.pulse_seconds)
+                else:
+                    self.gpio.output(self.pin, self.gpio.HIGH)
+                    self._on = True
+                    self._off_at = now + self.pulse_seconds
+                    self.pulses += 1
+                    self.latencies.append(time.monotonic() - requested)
+
+            if self._on and (not self._enabled or now >= self._off_at):
+                self.gpio.output(self.pin, self.gpio.LOW)
+                self._on = False
+
+        if self._on:
+            self.gpio.output(self.pin, self.gpio.LOW)
+            self._on = False
+
+    def stats(self) -> dict:
+        """
+        Returns the number of triggers, pulses, merged and ignored triggers
+        and the trigger-to-relay latency percentiles in milliseconds.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+        return {
+            'triggers': self.triggers,
+            'pulses': self.pulses,
+            'merged': self.merged,
+            'ignored': self.ignored,
+            'latency_p50_ms': percentile(50),
+            'latency_p99_ms': percentile(99),
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        logging.info(f"Actuator: {s['triggers']} triggers, {s['pulses']} pulses, "
+                     f"{s['merged']} merged, {s['ignored']} ignored, "
+                     f"latency p50 {s['latency_p50_ms']} ms p99 {s['latency_p99_ms']} ms")
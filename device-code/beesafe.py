@@ -3,7 +3,13 @@
 import requests
 import logging
 import json
+import threading
+import time
+from collections import deque
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+import outbox
 
 from enum import Enum
 
@@ -21,20 +27,101 @@ class NonExistantDeviceError(Exception):
 class DeviceNotApprovedError(Exception):
     pass
 
+class ServerError(Exception):
+    """
+    Raised when the server answers with a status code other than 200, 401
+    and 403.
+    """
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{message} (status {status_code})")
+        self.status_code = status_code
+
+# (connect, read) timeout in seconds for every request
+DEFAULT_TIMEOUT = (3.05, 10)
+
+def check_status_code(status_code: int, generic_message: str):
+    """
+    Raises the exception matching a status code other than 200.
+    """
+    if status_code != 200:
+        message = generic_message
+        if status_code == 403:
+            raise DeviceNotApprovedError()
+        elif status_code == 401:
+            raise NonExistantDeviceError()
+        raise ServerError(status_code, message)
+
+def is_rejection(status_code: int) -> bool:
+    """
+    Whether a status code means the server refuses the events themselves,
+    so that sending them again will not help.
+    """
+    return 400 <= status_code < 500 and status_code not in (404, 408, 429)
+
 class BeeSafeClient:
     """
     This class allows you to interact with the application via messages.
     """
-    def __init__(self, url, latitude: float, longitude: float, direction: float, device_id:str =""):
+    def __init__(self, url, latitude: float, longitude: float, direction: float, device_id:str ="",
+                 timeout=DEFAULT_TIMEOUT, buffered: bool = False, batch_size: int = 50,
+                 max_batch_age: float = 2.0, max_pending: int = 1000, outbox_path: str = None,
+                 max_outbox_events: int = 100000):
         """
         :param str url: The URL of the application.
         :param str device_id: (optional) the ID of an already registered device.
+        :param timeout: (optional) the (connect, read) timeout of every request.
+        :param bool buffered: (optional) queue detection events and send them
+            in batches from a background thread instead of sending each one
+            while the caller waits.
+        :param int batch_size: (optional) send a batch once this many events
+            are queued.
+        :param float max_batch_age: (optional) send a batch once its oldest
+            event has waited this many seconds.
+        :param int max_pending: (optional) the most events that are queued;
+            when full, the oldest event is dropped.
+        :param str outbox_path: (optional) store detection events in this
+            SQLite file until the server has accepted them, and keep
+            retrying while it cannot be reached. Implies buffered.
+        :param int max_outbox_events: (optional) the most events kept in the
+            outbox; when full, the oldest events are evicted.
         """
         self.url = url
         self.device_id = device_id
+        self.timeout = timeout
+        # One keep-alive session, so every request after the first reuses
+        # the TCP+TLS connection.
+        self.session = requests.Session()
+        self.session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        self.buffered = buffered
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closing = False
+        self._flush_requested = False
+        self._batch_endpoint = True
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._sender = None
+
         if device_id == "":
             self.device_id = self.__register_device(latitude, longitude, direction)
 
+        self.outbox = None
+        self._forwarder = None
+        if outbox_path is not None:
+            self.buffered = True
+            self.outbox = outbox.Outbox(outbox_path, max_events=max_outbox_events)
+            self._forwarder = outbox.Forwarder(self.outbox, self._send_outbox_batch, batch_size=batch_size)
+        elif buffered:
+            self._sender = threading.Thread(target=self._send_loop, name="beesafe-sender", daemon=True)
+            self._sender.start()
+
     def __register_device(self, latitude: float, longitude: float, direction: float) -> str:
         data = {
             'latitude': latitude,
@@ -42,7 +129,7 @@ class BeeSafeClient:
             'direction': direction
         }
 
-        r = requests.post(self.url + "/Device/Register", json=data)
+        r = self._post("/Device/Register", data)
 
         if r.status_code != 200:
             raise RegistrationDeviceError()
@@ -56,13 +143,11 @@ class BeeSafeClient:
 
         return id
 
+    def _post(self, path: str, data: dict) -> requests.Response:
+        return self.session.post(self.url + path, json=data, timeout=self.timeout)
+
     def _check_status_code(self, status_code: int, generic_message: str):
-        if status_code != 200:
-            message = generic_message
-            if status_code == 403:
-                raise DeviceNotApprovedError()
-            elif status_code == 401:
-                raise NonExistantDeviceError()
+        check_status_code(status_code, generic_message)
 
 
     def send_detection_event(self, hornet_direction: float, timestamp: datetime):
@@ -70,24 +155,201 @@ class BeeSafeClient:
         Send a detection event message. When a hornet is detected, this
         function is what you use.
 
+        In buffered mode the event is only queued and this never blocks
+        on the network.
+
         :param float hornet_direction: The direction of the hornet detected.
         :param datetime timestamp: The time when the hornet was detected.
         """
+        event = {
+            'hornet_direction': hornet_direction,
+            'timestamp': timestamp.timestamp()
+        }
+
+        if self.outbox is not None:
+            self.outbox.append(event)
+            return
+        if self.buffered:
+            self._enqueue(event)
+            return
+
         data = {
             'device': self.device_id,
             'message_type': MessageType.DETECTION_EVENT,
-            'data': {
-                'hornet_direction': hornet_direction,
-                'timestamp': timestamp.timestamp()
-            }
+            'data': event
         }
 
-        r = requests.post(self.url + "/Device/DetectionEvent", json=data)
+        r = self._post("/Device/DetectionEvent", data)
 
         self._check_status_code(r.status_code, "Failed to send detection event.")
 
         logging.info(f"Successfully sent detection event.")
 
+    def _enqueue(self, event: dict):
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("The client is closed.")
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logging.warning(f"Detection event queue is full, dropped {self.dropped} events so far.")
+            self._pending.append((time.monotonic(), event))
+            # wake the sender to start the age timer, or when a batch is full
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _send_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        age = time.monotonic() - self._pending[0][0]
+                        if (len(self._pending) >= self.batch_size or age >= self.max_batch_age
+                                or self._closing or self._flush_requested):
+                            break
+                        self._cond.wait(self.max_batch_age - age)
+                    elif self._closing:
+                        return
+                    else:
+                        self._cond.wait()
+                count = min(self.batch_size, len(self._pending))
+                batch = [self._pending.popleft()[1] for _ in range(count)]
+                self._in_flight = count
+
+            try:
+                self._send_batch(batch)
+                self.sent += count
+            except outbox.PartialSendError as e:
+                self.sent += len(e.sent)
+                self.failed += count - len(e.sent)
+                logging.error(f"Failed to send {count - len(e.sent)} of {count} detection events: {e.error!r}")
+            except (requests.RequestException, NonExistantDeviceError, DeviceNotApprovedError,
+                    ServerError) as e:
+                self.failed += count
+                logging.error(f"Failed to send {count} detection events: {e!r}")
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _send_batch(self, events: list):
+        self.batches += 1
+        if self._batch_endpoint:
+            data = {
+                'device': self.device_id,
+                'message_type': MessageType.DETECTION_EVENT,
+                'data': {'events': events}
+            }
+            r = self._post("/Device/DetectionEvents", data)
+            # Older servers only know the single event endpoint.
+            if r.status_code in (404, 405):
+                logging.info("Server has no batch endpoint, sending events one by one.")
+                self._batch_endpoint = False
+            else:
+                self._check_status_code(r.status_code, "Failed to send detection events.")
+                return
+
+        sent = []
+        for i, event in enumerate(events):
+            data = {
+                'device': self.device_id,
+                'message_type': MessageType.DETECTION_EVENT,
+                'data': event
+            }
+            try:
+                r = self._post("/Device/DetectionEvent", data)
+                self._check_status_code(r.status_code, "Failed to send detection event.")
+            except (requests.RequestException, NonExistantDeviceError, DeviceNotApprovedError,
+                    ServerError) as e:
+                if not sent:
+                    raise
+                # the server has the events before this one
+                raise outbox.PartialSendError(sent, e) from e
+            sent.append(i)
+
+    def _send_outbox_batch(self, events: list):
+        try:
+            self._send_batch(events)
+        except outbox.PartialSendError as e:
+            if isinstance(e.error, ServerError) and is_rejection(e.error.status_code):
+                raise outbox.PartialSendError(e.sent, outbox.RejectedError(str(e.error)))
+            raise
+        except ServerError as e:
+            if is_rejection(e.status_code):
+                raise outbox.RejectedError(str(e))
+            raise
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every queued detection event has been handed to the
+        server. Returns False if that did not happen within ``timeout``
+        seconds.
+        """
+        if not self.buffered:
+            return True
+        if self.outbox is not None:
+            self.outbox.sync()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.outbox.backlog():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            # send partial batches without waiting for them to age
+            self._flush_requested = True
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flush_requested = False
+        return True
+
+    def close(self, timeout: float = 10):
+        """
+        Sends what is still queued (waiting at most ``timeout`` seconds),
+        stops the background sender and closes the connection. With an
+        outbox, unsent events stay on disk and are sent after the next start.
+        """
+        if self._sender is not None:
+            with self._cond:
+                self._closing = True
+                self._cond.notify_all()
+            self._sender.join(timeout)
+        if self.outbox is not None:
+            # whatever is not sent yet stays on disk for the next start
+            self._forwarder.stop(timeout)
+            if self._forwarder.is_alive():
+                # still sending; it would ack against a closed database
+                logging.warning("Outbox forwarder did not stop in time, leaving the outbox open.")
+            else:
+                self.outbox.close()
+        self.session.close()
+
+    def stats(self) -> dict:
+        """
+        Returns counters of the buffered mode: events sent, dropped because
+        the queue was full, failed, still pending, and batches sent. With an
+        outbox, returns the outbox backlog and forwarding counters instead.
+        """
+        if self._forwarder is not None:
+            return self._forwarder.stats()
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'pending': pending,
+            'batches': self.batches,
+        }
+
     def send_ping(self):
         """
         Send a ping to the server. You should do this regularly to let
@@ -98,7 +360,7 @@ class BeeSafeClient:
             'message_type': MessageType.PING
         }
 
-        r = requests.post(self.url + "/Device/Ping", json=data)
+        r = self._post("/Device/Ping", data)
 
         try:
             self._check_status_code(r.status_code, "Failed to ping server.")
@@ -0,0 +1,188 @@
+# An asyncio version of the BeeSafeClient. It sends the same messages to
+# the same endpoints, but many requests can be in flight at once and none
+# of them blocks the event loop.
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+import aiohttp
+
+import outbox
+from beesafe import (MessageType, RegistrationDeviceError, DeviceNotApprovedError, ServerError,
+                     DEFAULT_TIMEOUT, check_status_code, is_rejection)
+
+
+class AsyncBeeSafeClient:
+    """
+    This class allows you to interact with the application via messages,
+    from a coroutine. Use ``await AsyncBeeSafeClient.create(...)`` to get a
+    registered client and ``await client.close()`` when done.
+    """
+    def __init__(self, url, device_id: str = "", timeout=DEFAULT_TIMEOUT, max_in_flight: int = 4):
+        """
+        :param str url: The URL of the application.
+        :param str device_id: (optional) the ID of an already registered device.
+        :param timeout: (optional) the (connect, read) timeout of every request.
+        :param int max_in_flight: (optional) the most requests sent at the
+            same time; more wait for a free connection.
+        """
+        self.url = url
+        self.device_id = device_id
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.max_in_flight = max_in_flight
+        self._batch_endpoint = True
+        self._session = None
+
+    @classmethod
+    async def create(cls, url, latitude: float, longitude: float, direction: float,
+                     device_id: str = "", **kwargs):
+        """
+        Returns a client, registering the device first if no ``device_id``
+        is given. Takes the same arguments as BeeSafeClient.
+        """
+        client = cls(url, device_id, **kwargs)
+        if device_id == "":
+            try:
+                client.device_id = await client._register_device(latitude, longitude, direction)
+            except BaseException:
+                await client.close()
+                raise
+        return client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # created lazily, a session must be made inside the running loop
+        if self._session is None:
+            # one keep-alive connection per request in flight
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def _post(self, path: str, data: dict):
+        """
+        Returns the status code and the body of the response.
+        """
+        async with self._get_session().post(self.url + path, json=data) as r:
+            return r.status, await r.read()
+
+    async def _register_device(self, latitude: float, longitude: float, direction: float) -> str:
+        data = {
+            'latitude': latitude,
+            'longitude': longitude,
+            'direction': direction
+        }
+
+        status, body = await self._post("/Device/Register", data)
+
+        if status != 200:
+            raise RegistrationDeviceError()
+
+        try:
+            id = json.loads(body)["id"]
+        except KeyError:
+            raise Exception("Expected id in response, not found.")
+
+        logging.info(f"Successfully registered device with id {id}.")
+
+        return id
+
+    async def send_detection_event(self, hornet_direction: float, timestamp: datetime):
+        """
+        Send a detection event message.
+
+        :param float hornet_direction: The direction of the hornet detected.
+        :param datetime timestamp: The time when the hornet was detected.
+        """
+        data = {
+            'device': self.device_id,
+            'message_type': MessageType.DETECTION_EVENT,
+            'data': {
+                'hornet_direction': hornet_direction,
+                'timestamp': timestamp.timestamp()
+            }
+        }
+
+        status, _ = await self._post("/Device/DetectionEvent", data)
+
+        check_status_code(status, "Failed to send detection event.")
+
+        logging.info(f"Successfully sent detection event.")
+
+    async def send_detection_events(self, events: list):
+        """
+        Send several detection events in one request. Falls back to one
+        request per event, sent concurrently, if the server has no batch
+        endpoint; when only some of those fail, raises
+        outbox.PartialSendError with the indices of the events sent.
+
+        :param list events: (hornet_direction, timestamp) pairs.
+        """
+        if self._batch_endpoint:
+            data = {
+                'device': self.device_id,
+                'message_type': MessageType.DETECTION_EVENT,
+                'data': {'events': [{'hornet_direction': direction, 'timestamp': timestamp.timestamp()}
+                                    for direction, timestamp in events]}
+            }
+            status, _ = await self._post("/Device/DetectionEvents", data)
+            # Older servers only know the single event endpoint.
+            if status in (404, 405):
+                logging.info("Server has no batch endpoint, sending events one by one.")
+                self._batch_endpoint = False
+            else:
+                check_status_code(status, "Failed to send detection events.")
+                return
+
+        results = await asyncio.gather(*(self.send_detection_event(direction, timestamp)
+                                         for direction, timestamp in events),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if not errors:
+            return
+        sent = [i for i, result in enumerate(results) if not isinstance(result, BaseException)]
+        # an error worth retrying decides over rejections of single events
+        error = next((e for e in errors if not (isinstance(e, ServerError) and is_rejection(e.status_code))),
+                     errors[0])
+        if not sent:
+            raise error
+        raise outbox.PartialSendError(sent, error) from error
+
+    async def send_ping(self):
+        """
+        Send a ping to the server. You should do this regularly to let
+        the server know that this device is still working as intended.
+        """
+        data = {
+            'device': self.device_id,
+            'message_type': MessageType.PING
+        }
+
+        status, body = await self._post("/Device/Ping", data)
+
+        try:
+            check_status_code(status, "Failed to ping server.")
+        # We can safely ignore that
+        except DeviceNotApprovedError:
+            return
+
+        response = json.loads(body)
+
+        assert response["message_type"] == MessageType.PONG, \
+            f"Ping response must have the message_type field be PONG."
+
+        logging.info(f"Successfully pinged server")
+
+    async def close(self):
+        """
+        Closes the connections. Requests still in flight are aborted, so
+        cancel or await them first.
+        """
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
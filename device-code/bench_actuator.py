@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the relay Actuator against the old blocking pulse on a fake
+# GPIO backend: simulates a detection loop with a random number of hornets
+# per frame and reports how long the loop is blocked, the
+# trigger-to-relay latency and how many pulses the triggers turn into.
+#
+# usage: bench_actuator.py [--frames 300] [--fps 30] [--pulse 0.5] [--hornets 1.5]
+
+import argparse
+import random
+import time
+
+import actuator
+
+RELAY_PIN = 17
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay actuator benchmark")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--pulse", type=float, default=0.5, help="Pulse length in seconds.")
+    parser.add_argument("--hornets", type=float, default=1.5, help="Mean hornets per frame.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # hornets per frame, visits of a few seconds separated by empty stretches
+    counts = []
+    while len(counts) < args.frames:
+        counts += [0] * rng.randint(0, int(args.fps * 2))
+        counts += [max(1, round(rng.expovariate(1 / args.hornets))) for _ in range(rng.randint(1, int(args.fps * 2)))]
+    counts = counts[:args.frames]
+
+    gpio = actuator.FakeGPIO()
+    gpio.setmode(gpio.BCM)
+    gpio.setup(RELAY_PIN, gpio.OUT)
+    relay = actuator.Actuator(gpio, RELAY_PIN, args.pulse)
+
+    frame_time = 1 / args.fps
+    blocked = []
+    start = time.monotonic()
+    for i, count in enumerate(counts):
+        t0 = time.perf_counter()
+        for _ in range(count):
+            relay.trigger()
+        blocked.append(time.perf_counter() - t0)
+        # keep the simulated frame rate
+        time.sleep(max(0.0, start + (i + 1) * frame_time - time.monotonic()))
+    time.sleep(args.pulse * 1.5)
+    relay.close()
+
+    stats = relay.stats()
+    blocked.sort()
+    triggers = sum(counts)
+    print(f"{len(counts)} frames at {args.fps:g} fps, {triggers} triggers")
+    print(f"old blocking loop: {triggers * args.pulse:.1f} s blocked, "
+          f"{triggers * args.pulse * args.fps:.0f} frames missed")
+    print(f"actuator: caller blocked {sum(blocked) * 1000:.2f} ms in total, "
+          f"p99 {blocked[int(0.99 * (len(blocked) - 1))] * 1e6:.1f} us per frame")
+    print(f"actuator: {stats['pulses']} pulses, {stats['merged']} merged triggers, "
+          f"{len(gpio.changes)} relay changes")
+    print(f"trigger-to-relay latency p50 {stats['latency_p50_ms']:.3f} ms, "
+          f"p99 {stats['latency_p99_ms']:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# Compares writing the whole stream with cv2.VideoWriter, as real-device.py
+# did, against ClipRecorder on the same frames of a video:
+#   - stream: every frame written at full resolution
+#   - clips:  frames go to the ring; hornet visits of --visit-seconds, on
+#             average --visits-per-minute, trigger on every frame they last
+# Reports the time the detection loop spends per frame (write, or add and
+# trigger), the total time including the encoder finishing, and the bytes
+# and files written.
+#
+# usage: bench_clip_recorder.py VIDEO [--frames 1500] [--visits-per-minute 2] [--visit-seconds 3]
+#                               [--max-width 960] [--dir /tmp/bench_clips]
+
+import argparse
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from clip_recorder import ClipRecorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clip recorder benchmark")
+    parser.add_argument("video")
+    parser.add_argument("--frames", type=int, default=1500)
+    parser.add_argument("--visits-per-minute", type=float, default=2)
+    parser.add_argument("--visit-seconds", type=float, default=3)
+    parser.add_argument("--pre-roll", type=float, default=2)
+    parser.add_argument("--post-roll", type=float, default=3)
+    parser.add_argument("--max-width", type=int, default=960)
+    parser.add_argument("--dir", default="/tmp/bench_clips", help="Scratch directory, emptied first.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    n = len(frames)
+    h, w = frames[0].shape[:2]
+
+    # frames during a visit
+    rng = np.random.default_rng(args.seed)
+    visiting = np.zeros(n, dtype=bool)
+    visits = rng.poisson(args.visits_per_minute * n / fps / 60.)
+    for start in rng.integers(0, n, visits):
+        visiting[start:start + int(args.visit_seconds * fps)] = True
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    os.makedirs(args.dir)
+    stream_path = os.path.join(args.dir, 'stream.mp4')
+    results = {}
+
+    start = time.perf_counter()
+    loop = 0.
+    out = cv2.VideoWriter(stream_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    for frame in frames:
+        t = time.perf_counter()
+        out.write(frame)
+        loop += time.perf_counter() - t
+    out.release()
+    results['stream'] = (loop, time.perf_counter() - start, os.path.getsize(stream_path), 1)
+
+    clip_dir = os.path.join(args.dir, 'clips')
+    start = time.perf_counter()
+    loop = 0.
+    recorder = ClipRecorder(clip_dir, fps, args.pre_roll, args.post_roll, max_width=args.max_width)
+    for frame, visit in zip(frames, visiting):
+        t = time.perf_counter()
+        recorder.add(frame)
+        if visit:
+            recorder.trigger()
+        loop += time.perf_counter() - t
+    recorder.close()
+    stats = recorder.stats()
+    results['clips'] = (loop, time.perf_counter() - start, stats['bytes_written'], stats['clips'])
+
+    print(f"{n} frames of {w}x{h} at {fps:g} fps, {visits} visits, {visiting.mean() * 100:.1f}% of frames "
+          f"with a hornet; {stats['frames_written']} frames in clips, {stats['lost']} lost")
+    print(f"{'mode':6} {'loop ms':>8} {'total s':>8} {'MB':>8} {'files':>6}")
+    for name, (loop, total, size, files) in results.items():
+        print(f"{name:6} {loop / n * 1000:8.2f} {total:8.2f} {size / 1e6:8.2f} {files:6d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the detector backends on CPU, each in a fresh process:
+#   - ultralytics: YOLO("best.onnx").predict(), as the scripts do today
+#   - onnx:        OnnxDetector, onnxruntime only
+# Reports the startup time (imports and model load), the first and the
+# steady-state latency per frame, how much the peak RSS grows from
+# loading and running the detector, and whether both backends find the
+# same boxes.
+#
+# usage: bench_detector.py MODEL [--video FILE | --images DIR] [--frames 100] [--threads 0]
+
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BACKENDS = ('ultralytics', 'onnx')
+
+
+def load_frames(args):
+    import cv2
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        frames = []
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        return frames
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) + glob.glob(os.path.join(args.images, "*.png")))
+        return [cv2.imread(p) for p in paths[:args.frames]]
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+
+def run_child(args):
+    frames = load_frames(args)
+    # kilobytes on Linux; what the frames take is not the detector's
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if args.child == 'onnx':
+        from onnx_detector import OnnxDetector
+        detector = OnnxDetector(args.model, conf=args.conf, intra_op_threads=args.threads)
+        detect = detector.detect
+    else:
+        from ultralytics import YOLO
+        model = YOLO(args.model, task='detect')
+
+        def detect(frame):
+            return model.predict(frame, imgsz=640, conf=args.conf, verbose=False)[0].boxes.data.cpu().numpy()
+    startup = time.perf_counter() - start
+
+    latencies = []
+    first = None
+    for frame in frames:
+        t0 = time.perf_counter()
+        detections = detect(frame)
+        latencies.append(time.perf_counter() - t0)
+        if first is None:
+            first = detections
+    steady = sorted(latencies[1:] or latencies)
+    print(json.dumps({
+        'startup': startup,
+        'first': latencies[0],
+        'p50': steady[len(steady) // 2],
+        'p99': steady[min(len(steady) - 1, int(0.99 * len(steady)))],
+        'rss_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024,
+        'detections': np.asarray(first).tolist(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detector backend benchmark")
+    parser.add_argument("model", help="The exported .onnx model.")
+    parser.add_argument("--video")
+    parser.add_argument("--images", help="Directory of .jpg/.png frames.")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads, 0 for all cores.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    print(f"{'backend':12} {'startup s':>10} {'first ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'+RSS MB':>8}")
+    results = {}
+    for backend in args.backends:
+        command = [sys.executable, __file__, "--child", backend] + sys.argv[1:]
+        proc = subprocess.run(command, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{backend:12} failed: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        r = results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{backend:12} {r['startup']:10.2f} {r['first'] * 1000:9.1f} {r['p50'] * 1000:8.1f} "
+              f"{r['p99'] * 1000:8.1f} {r['rss_mb']:8.0f}")
+
+    if len(results) == 2:
+        a, b = (np.array(results[k]['detections']).reshape(-1, 6) for k in BACKENDS)
+        if len(a) != len(b):
+            print(f"first frame: {len(a)} vs {len(b)} detections")
+        else:
+            diff = np.abs(a - b).max() if len(a) else 0.
+            print(f"first frame: {len(a)} detections, max difference {diff:.3f}")
+
+
+if __name__ == '__main__':
+    main()
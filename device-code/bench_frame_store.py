@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# Compares a FrameStore with a directory of JPEG files, on the same frames
+# of a video:
+#   - write:  cv2.imwrite per frame, against FrameStoreWriter.add
+#   - random: reading images in random order, e.g. a shuffled training
+#             epoch (the store returns views; the bench touches every pixel
+#             so the page cache is really read)
+#   - batch:  assembling batches of --batch random images
+# Run it twice to see the warm page cache, or drop the caches in between.
+#
+# usage: bench_frame_store.py VIDEO [--frames 500] [--batch 16] [--quality 95] [--dir /tmp/bench_store]
+
+import argparse
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from frame_store import FrameStoreWriter, FrameStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame store benchmark")
+    parser.add_argument("video")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--quality", type=int, default=95)
+    parser.add_argument("--dir", default="/tmp/bench_store", help="Scratch directory, emptied first.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    jpeg_dir, store_dir = os.path.join(args.dir, 'jpeg'), os.path.join(args.dir, 'store')
+    os.makedirs(jpeg_dir)
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    n = len(frames)
+    h, w = frames[0].shape[:2]
+
+    results = {}
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        cv2.imwrite(os.path.join(jpeg_dir, f"{i:06d}.jpg"), frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+    results['jpeg'] = {'write': time.perf_counter() - start}
+    start = time.perf_counter()
+    with FrameStoreWriter(store_dir, (h, w)) as store:
+        for i, frame in enumerate(frames):
+            store.add(frame, timestamp=i, frame=i, source=args.video)
+    results['store'] = {'write': time.perf_counter() - start}
+
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(n)
+    checksum = 0
+    start = time.perf_counter()
+    for i in order:
+        checksum += int(cv2.imread(os.path.join(jpeg_dir, f"{i:06d}.jpg"))[::97, ::97].sum())
+    results['jpeg']['random'] = time.perf_counter() - start
+    store = FrameStore(store_dir)
+    start = time.perf_counter()
+    for i in order:
+        image = store[i]
+        checksum += int(image.sum(dtype=np.uint64) & 1)
+    results['store']['random'] = time.perf_counter() - start
+
+    batches = [order[k:k + args.batch] for k in range(0, n - args.batch + 1, args.batch)]
+    out = np.empty((args.batch, h, w, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    for batch in batches:
+        for k, i in enumerate(batch):
+            out[k] = cv2.imread(os.path.join(jpeg_dir, f"{i:06d}.jpg"))
+    results['jpeg']['batch'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for batch in batches:
+        store.batch(batch, out=out)
+    results['store']['batch'] = time.perf_counter() - start
+
+    sizes = {'jpeg': sum(os.path.getsize(os.path.join(jpeg_dir, f)) for f in os.listdir(jpeg_dir)),
+             'store': sum(os.stat(os.path.join(store_dir, f)).st_blocks * 512 for f in os.listdir(store_dir))}
+    print(f"{n} frames of {w}x{h}, batches of {args.batch}")
+    print(f"{'format':6} {'write ms':>9} {'random ms':>10} {'batch ms':>9} {'MB on disk':>11}")
+    for name, result in results.items():
+        print(f"{name:6} {result['write'] / n * 1000:9.2f} {result['random'] / n * 1000:10.3f} "
+              f"{result['batch'] / max(len(batches), 1) * 1000:9.2f} {sizes[name] / 1e6:11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Measures what the motion gate saves and what it costs, per video. The
+# detector runs on every frame once; its detections and CPU time are then
+# replayed through a gated copy of the tracker for every combination of
+# gate settings, so the settings can be tuned from one pass:
+#   - skip %:    frames the detector did not run on
+#   - CPU saved: detector CPU seconds of the skipped frames, minus the CPU
+#                seconds the gate itself took
+#   - recall:    detections of the ungated run on frames the gate let through
+#   - tracks:    hornets counted (tracks ended) ungated and gated
+# The tracker comes from YOLO/, put on the path by repo_paths.
+#
+# usage: bench_motion_gate.py MODEL VIDEO [VIDEO ...] [--roi X1 Y1 X2 Y2]
+#                             [--thresholds 15 25 40] [--min-areas 0.0005 0.001 0.002] [--max-skip 30]
+
+import argparse
+import itertools
+import os
+import time
+
+import cv2
+import numpy as np
+
+import repo_paths  # noqa: F401
+from motion_gate import MotionGate
+from onnx_detector import OnnxDetector
+from sort_core import BatchSort
+from track_lifecycle import TrackLifecycle, EXIT
+
+
+def make_lifecycle():
+    return TrackLifecycle(BatchSort(max_age=40, min_hits=3, iou_threshold=0.25), summaries=False)
+
+
+def count_exits(events):
+    return sum(1 for event in events if event['type'] == EXIT)
+
+
+def bench_video(path, detector, configs, args):
+    gates = [MotionGate(roi=args.roi, threshold=threshold, min_area=min_area, max_skip=args.max_skip)
+             for threshold, min_area in configs]
+    lifecycles = [make_lifecycle() for _ in configs]
+    runs = [{'detections': 0, 'saved': 0., 'tracks': 0} for _ in configs]
+    baseline = make_lifecycle()
+    detector_cpu = 0.
+    total_detections = 0
+    tracks = 0
+    empty = np.empty((0, 5))
+
+    cap = cv2.VideoCapture(path)
+    frame_number = 0
+    while args.frames == 0 or frame_number < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_number += 1
+        start = time.process_time()
+        detections = detector.detect(frame)[:, :5]
+        cpu = time.process_time() - start
+        detector_cpu += cpu
+        total_detections += len(detections)
+        _, events = baseline.update(detections, frame_number)
+        tracks += count_exits(events)
+
+        for gate, lifecycle, run in zip(gates, lifecycles, runs):
+            start = time.process_time()
+            detect = gate.should_detect(frame, active=len(lifecycle.tracker.live_ids()) > 0)
+            run['saved'] -= time.process_time() - start
+            if detect:
+                run['detections'] += len(detections)
+            else:
+                run['saved'] += cpu
+            _, events = lifecycle.update(detections if detect else empty, frame_number)
+            run['tracks'] += count_exits(events)
+    cap.release()
+
+    tracks += count_exits(baseline.close())
+    print(f"\n{os.path.basename(path)}: {frame_number} frames, detector {detector_cpu:.1f} CPU s, "
+          f"{total_detections} detections, {tracks} tracks")
+    print(f"{'threshold':>9} {'min area':>9} {'skip %':>7} {'CPU saved s':>12} {'saved %':>8} "
+          f"{'recall':>7} {'tracks':>7} {'gate ms':>8}")
+    for (threshold, min_area), gate, lifecycle, run in zip(configs, gates, lifecycles, runs):
+        run['tracks'] += count_exits(lifecycle.close())
+        stats = gate.stats()
+        recall = run['detections'] / total_detections if total_detections else 1.
+        print(f"{threshold:9d} {min_area:9.4f} {stats['skip_rate'] * 100:7.1f} {run['saved']:12.2f} "
+              f"{run['saved'] / max(detector_cpu, 1e-9) * 100:8.1f} {recall:7.3f} {run['tracks']:7d} "
+              f"{stats['avg_ms']:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motion gate benchmark")
+    parser.add_argument("model", help="The exported .onnx model.")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--roi", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                        help="The entrance region as fractions of the frame.")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[15, 25, 40])
+    parser.add_argument("--min-areas", type=float, nargs="+", default=[0.0005, 0.001, 0.002])
+    parser.add_argument("--max-skip", type=int, default=30)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--frames", type=int, default=0, help="Frames per video at most, 0 for all.")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads, 0 for all cores.")
+    args = parser.parse_args()
+
+    detector = OnnxDetector(args.model, conf=args.conf, intra_op_threads=args.threads)
+    configs = list(itertools.product(args.thresholds, args.min_areas))
+    for path in args.videos:
+        bench_video(path, detector, configs, args)
+
+
+if __name__ == '__main__':
+    main()
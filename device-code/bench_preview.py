@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Compares what showing the detections costs the detection loop per frame
+# on the frames of a video with --boxes boxes each:
+#   - draw:     rectangles and labels drawn on every frame, and the frame
+#               converted for display (a JPEG encode at full size stands in
+#               for cv2.imshow, which needs a display)
+#   - idle:     PreviewServer.publish() with nobody watching
+#   - watching: PreviewServer.publish() with one client reading the stream
+# Reports the loop ms per frame and the preview frames encoded and sent.
+#
+# usage: bench_preview.py VIDEO [--frames 600] [--boxes 3] [--max-fps 5] [--max-width 640]
+
+import argparse
+import threading
+import time
+import urllib.request
+
+import cv2
+import numpy as np
+
+from preview_server import PreviewServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview server benchmark")
+    parser.add_argument("video")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--boxes", type=int, default=3)
+    parser.add_argument("--max-fps", type=float, default=5)
+    parser.add_argument("--max-width", type=int, default=640)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    n = len(frames)
+    h, w = frames[0].shape[:2]
+
+    rng = np.random.default_rng(args.seed)
+    corners = rng.random((n, args.boxes, 2)) * (w - 80, h - 80)
+    boxes = np.concatenate([corners, corners + 60], axis=2)
+    labels = [f"Hornet {i}" for i in range(args.boxes)]
+    colors = [(0, 0, 255)] * args.boxes
+    results = {}
+
+    # the loop runs at the video's frame rate, as it would on a camera
+    def run(show):
+        loop = 0.
+        for i, frame in enumerate(frames):
+            t = time.perf_counter()
+            show(frame, boxes[i])
+            loop += time.perf_counter() - t
+            time.sleep(max(0., 1. / fps - (time.perf_counter() - t)))
+        return loop
+
+    def draw(frame, frame_boxes):
+        for (x1, y1, x2, y2), label, color in zip(frame_boxes.astype(int).tolist(), labels, colors):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        cv2.imencode('.jpg', frame)
+
+    results['draw'] = (run(lambda frame, b: draw(frame.copy(), b)), n, 0)
+
+    preview = PreviewServer(0, max_fps=args.max_fps, max_width=args.max_width).start()
+    results['idle'] = (run(lambda frame, b: preview.publish(frame, b, labels, colors)), 0, 0)
+
+    stop = threading.Event()
+
+    def watch():
+        with urllib.request.urlopen(preview.url + '/stream') as stream:
+            while not stop.is_set():
+                stream.read1(1 << 16)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    while not preview.watching:
+        time.sleep(0.01)
+    loop = run(lambda frame, b: preview.publish(frame, b, labels, colors))
+    time.sleep(0.5)
+    stats = preview.stats()
+    results['watching'] = (loop, stats['encoded'], stats['sent'])
+    stop.set()
+    preview.stop()
+
+    print(f"{n} frames of {w}x{h} at {fps:g} fps, {args.boxes} boxes, preview at most {args.max_fps:g} fps "
+          f"and {args.max_width} px wide; render {stats['render_ms']:.2f} ms per preview frame off the loop")
+    print(f"{'mode':9} {'loop ms':>8} {'encoded':>8} {'sent':>6}")
+    for name, (loop, encoded, sent) in results.items():
+        print(f"{name:9} {loop / n * 1000:8.3f} {encoded:8d} {sent:6d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# Compares colour re-identification per frame, for every number of boxes
+# against every number of stored identities:
+#   - loop:  the scripts' old way, a full 180x256 HSV histogram per box and
+#            a scan of the stored colours with scipy's euclidean until one
+#            is near enough
+#   - table: ColorReId, the features of all boxes in one pass and a
+#            nearest-neighbour query over the fixed-capacity table
+# The boxes are cut from a video frame at random places, or from a noise
+# frame without a video. The stored identities are random, so most boxes
+# do not match and both ways search the whole store, as they do for a new
+# hornet; the stores are put back after every frame so they keep their size.
+#
+# usage: bench_reid.py [VIDEO] [--boxes 1 5 20 50] [--identities 10 100 1000 10000] [--frames 50]
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+from scipy.spatial.distance import euclidean
+
+from color_reid import ColorReId, color_features
+
+
+def dominant_color(image, box):
+    # as in yolo_predict_videos.py and real-device.py
+    x1, y1, x2, y2 = map(int, box)
+    if x2 <= x1 or y2 <= y1:
+        return (60, 255)
+    hornet_crop = image[y1:y2, x1:x2]
+    if hornet_crop.size == 0:
+        return (60, 255)
+    hsv_crop = cv2.cvtColor(hornet_crop, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv_crop], [0, 1], None, [180, 256], [0, 180, 0, 256])
+    h, s = np.unravel_index(np.argmax(hist), hist.shape)
+    return (h, s)
+
+
+def loop_frame(frame, boxes, hornet_colors, next_id):
+    ids = []
+    for box in boxes:
+        detected_color = dominant_color(frame, box)
+        matched_id = None
+        for hornet_id, stored_color in hornet_colors.items():
+            if euclidean(detected_color, stored_color) < 20:
+                matched_id = hornet_id
+                break
+        if matched_id is None:
+            matched_id = next_id
+            hornet_colors[matched_id] = detected_color
+            next_id += 1
+        ids.append(matched_id)
+    return ids, next_id
+
+
+def random_boxes(rng, n, w, h):
+    size = rng.uniform(40, 120, (n, 2))
+    xy = rng.uniform(0, 1, (n, 2)) * ([w, h] - size)
+    return np.hstack([xy, xy + size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Colour re-identification benchmark")
+    parser.add_argument("video", nargs="?")
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1, 5, 20, 50])
+    parser.add_argument("--identities", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--frames", type=int, default=50, help="Frames timed per combination.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            raise SystemExit(f"Cannot read {args.video}")
+    else:
+        frame = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    h, w = frame.shape[:2]
+
+    print(f"{'boxes':>5} {'stored':>7} {'loop ms':>9} {'table ms':>9} {'speed-up':>9}")
+    for n_boxes in args.boxes:
+        frame_boxes = [random_boxes(rng, n_boxes, w, h) for _ in range(args.frames)]
+        for n_ids in args.identities:
+            # colours away from anything a box gives, so nothing matches
+            stored = {i: (int(h_), int(s_)) for i, (h_, s_) in
+                      enumerate(zip(rng.integers(0, 180, n_ids), rng.integers(300, 400, n_ids)))}
+            start = time.perf_counter()
+            for boxes in frame_boxes:
+                hornet_colors = dict(stored)
+                loop_frame(frame, boxes, hornet_colors, n_ids)
+            loop_ms = (time.perf_counter() - start) / args.frames * 1000
+
+            reid = ColorReId(capacity=n_ids + n_boxes, max_age=None)
+            dim = color_features(frame, frame_boxes[0][:1]).shape[1]
+            identities = np.sqrt(rng.dirichlet(np.full(dim, 0.05), n_ids)).astype(np.float32)
+            # far from the boxes, so they are stored as new identities; seen
+            # in the future, so evicting the boxes' identities keeps them
+            reid.match(identities, timestamp=1e9)
+            seconds = 0.
+            for k, boxes in enumerate(frame_boxes):
+                start = time.perf_counter()
+                ids, _ = reid.identify(frame, boxes, timestamp=k + 1.)
+                seconds += time.perf_counter() - start
+                reid.evict(1e8)
+            table_ms = seconds / args.frames * 1000
+            print(f"{n_boxes:5d} {n_ids:7d} {loop_ms:9.3f} {table_ms:9.3f} {loop_ms / table_ms:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# Compares saving hornet pictures the old way, cv2.imwrite of the frame for
+# every box as yolo_predict_videos.py did, against SnapshotWriter keeping
+# the best crop per track, on the frames of a video with --tracks hornets
+# in view at a time for --track-seconds each (boxes drift across the frame).
+# Reports the time the detection loop spends per frame, the time until the
+# last snapshot is on disk, and the files and bytes written.
+#
+# usage: bench_snapshot_writer.py VIDEO [--frames 900] [--tracks 2] [--track-seconds 4] [--dir /tmp/bench_snapshots]
+
+import argparse
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from snapshot_writer import SnapshotWriter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot writer benchmark")
+    parser.add_argument("video")
+    parser.add_argument("--frames", type=int, default=900)
+    parser.add_argument("--tracks", type=int, default=2, help="Hornets in view at a time.")
+    parser.add_argument("--track-seconds", type=float, default=4)
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--dir", default="/tmp/bench_snapshots", help="Scratch directory, emptied first.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    n = len(frames)
+    h, w = frames[0].shape[:2]
+
+    # every track slot holds a hornet for track_frames, then the next one
+    rng = np.random.default_rng(args.seed)
+    track_frames = max(1, int(args.track_seconds * fps))
+    starts = rng.random((args.tracks, n // track_frames + 1, 2)) * (w - 80, h - 80)
+    moves = rng.normal(0, 2, (args.tracks, n // track_frames + 1, 2))
+
+    def boxes(i):
+        k, t = divmod(i, track_frames)
+        for slot in range(args.tracks):
+            x, y = np.clip(starts[slot, k] + moves[slot, k] * t, 0, (w - 80, h - 80))
+            yield slot * 100000 + k, (x, y, x + 60, y + 60), 0.5 + 0.5 * rng.random()
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    old_dir, new_dir = os.path.join(args.dir, 'imwrite'), os.path.join(args.dir, 'snapshots')
+    os.makedirs(old_dir)
+    results = {}
+
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        for track_id, box, confidence in boxes(i):
+            cv2.imwrite(os.path.join(old_dir, f"hornet_{track_id}.jpg"), frame,
+                        [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+    loop = time.perf_counter() - start
+    files = os.listdir(old_dir)
+    results['imwrite'] = (loop, loop, n * args.tracks, len(files),
+                          sum(os.path.getsize(os.path.join(old_dir, f)) for f in files))
+
+    start = time.perf_counter()
+    writer = SnapshotWriter(new_dir, quality=args.quality, max_age=0.5)
+    for i, frame in enumerate(frames):
+        for track_id, box, confidence in boxes(i):
+            writer.offer(track_id, frame, box, confidence, timestamp=i / fps)
+        writer.expire(i / fps)
+    loop = time.perf_counter() - start
+    writer.close()
+    stats = writer.stats()
+    results['best'] = (loop, time.perf_counter() - start, stats['written'], stats['written'],
+                       stats['bytes_written'])
+
+    print(f"{n} frames of {w}x{h}, {args.tracks} hornets in view, {args.track_seconds:g} s each")
+    print(f"{'mode':8} {'loop ms':>8} {'total s':>8} {'writes':>7} {'files':>6} {'MB':>7}")
+    for name, (loop, total, writes, files, size) in results.items():
+        print(f"{name:8} {loop / n * 1000:8.3f} {total:8.2f} {writes:7d} {files:6d} {size / 1e6:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+#
+# Compares whole-frame inference with tiled inference on the regions that
+# move, on high-resolution frames with small hornets:
+#   - full:  the whole frame letterboxed into the model input
+#   - tiled: MotionGate blobs and the last tracker boxes covered with tiles
+#            at (close to) native resolution, one batch per frame
+# Reports recall and precision against the ground truth, the model input
+# pixels per frame and the latency per frame.
+#
+# Without --video, hornets are drawn on a still background along the
+# synthetic flights of mot_bench. With --video, --gt is a MOT ground
+# truth file. mot_bench and the tracker come from YOLO/, put on the path
+# by repo_paths.
+#
+# usage: bench_tiled.py TILE_MODEL [--full MODEL] [--tile 640] [--video FILE --gt FILE]
+#                       [--frames 300] [--width 1920 --height 1080] [--conf 0.25 --iou 0.7]
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import repo_paths  # noqa: F401
+from association import iou_batch, linear_assignment
+from motion_gate import MotionGate
+from mot_bench import synthetic_sequence, read_mot_file, FrameIndex, mot_to_xyxy
+from onnx_detector import OnnxDetector
+from sort_core import BatchSort
+from tiled_detector import TiledDetector
+
+BODY = (20, 80, 150)
+STRIPES = (10, 10, 10)
+
+
+def render_frames(gt, width, height, scale, seed):
+    """
+    Draws every ground truth hornet of ``gt`` (MOT rows) as a striped body
+    heading the way it flies, on a still textured background. Yields each
+    frame with the boxes of the hornets drawn in it.
+    """
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(60, 200, (height // 8, width // 8, 3), dtype=np.uint8), (0, 0), 2)
+    background = cv2.resize(background, (width, height))
+    frames = FrameIndex(gt)
+    last = {}
+    for number in range(1, len(frames) + 1):
+        frame = cv2.add(background, rng.normal(0, 4, background.shape).astype(np.int8), dtype=cv2.CV_8U)
+        boxes = []
+        for row in frames[number]:
+            hornet = int(row[1])
+            centre = row[2:4] + row[4:6] / 2.
+            heading = centre - last.get(hornet, centre - (1., 0.))
+            last[hornet] = centre
+            angle = np.degrees(np.arctan2(heading[1], heading[0]))
+            length = max(row[4], row[5]) * scale
+            rect = (tuple(centre), (length, length * .4), angle)
+            cv2.ellipse(frame, rect, BODY, -1)
+            for offset in (-.2, .1):
+                shift = (np.cos(np.radians(angle)) * length * offset, np.sin(np.radians(angle)) * length * offset)
+                cv2.ellipse(frame, ((centre[0] + shift[0], centre[1] + shift[1]), (length / 7, length * .4), angle),
+                            STRIPES, -1)
+            corners = cv2.boxPoints(rect)
+            box = np.concatenate([corners.min(axis=0), corners.max(axis=0)])
+            if box[2] > 0 and box[3] > 0 and box[0] < width and box[1] < height:
+                boxes.append(np.clip(box, 0, [width, height, width, height]))
+        yield frame, np.array(boxes).reshape(-1, 4)
+
+
+def video_frames(path, gt):
+    frames = FrameIndex(gt)
+    cap = cv2.VideoCapture(path)
+    number = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        number += 1
+        yield frame, mot_to_xyxy(frames[number])[:, :4] if number <= len(frames) else np.empty((0, 4))
+    cap.release()
+
+
+def count_matches(detections, truths, iou_threshold=0.5):
+    if len(detections) == 0 or len(truths) == 0:
+        return 0
+    iou = iou_batch(detections[:, :4], truths)
+    pairs = linear_assignment(-iou)
+    return int((iou[pairs[:, 0], pairs[:, 1]] >= iou_threshold).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled inference benchmark")
+    parser.add_argument("model", help="The .onnx model run on the tiles, ideally exported with dynamic=True.")
+    parser.add_argument("--full", help="The .onnx model run on whole frames, the tile model by default.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Input size of models with a dynamic shape.")
+    parser.add_argument("--tile-imgsz", type=int, default=320, help="Input size of a dynamic tile model.")
+    parser.add_argument("--tile", type=int, help="Tile side in frame pixels, the tile model input by default.")
+    parser.add_argument("--max-tiles", type=int, default=4)
+    parser.add_argument("--video")
+    parser.add_argument("--gt", help="MOT ground truth of --video.")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--density", type=float, default=3)
+    parser.add_argument("--hornet-scale", type=float, default=.6, help="Drawn hornet length per box side.")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold.")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads, 0 for all cores.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tile_detector = OnnxDetector(args.model, conf=args.conf, iou=args.iou, imgsz=args.tile_imgsz,
+                                 intra_op_threads=args.threads)
+    full = OnnxDetector(args.full, conf=args.conf, iou=args.iou, imgsz=args.imgsz, intra_op_threads=args.threads) \
+        if args.full else tile_detector
+    tiled = TiledDetector(tile_detector, tile=args.tile, max_tiles=args.max_tiles, fallback=full)
+    gate = MotionGate()
+    tracker = BatchSort(max_age=10, min_hits=1, iou_threshold=0.2)
+
+    if args.video:
+        if not args.gt:
+            parser.error("--video needs --gt")
+        frames = video_frames(args.video, read_mot_file(args.gt))
+    else:
+        _, gt = synthetic_sequence(args.frames, args.density, args.width, args.height,
+                                   miss_rate=0., false_positives=0., noise=0., seed=args.seed)
+        frames = render_frames(gt, args.width, args.height, args.hornet_scale, args.seed)
+
+    totals = {name: {'tp': 0, 'detections': 0, 'seconds': [], 'pixels': 0} for name in ('full', 'tiled')}
+    truths_total = 0
+    tracked = np.empty((0, 5))
+    n = 0
+    for frame, truths in frames:
+        if n == args.frames:
+            break
+        n += 1
+        truths_total += len(truths)
+
+        t0 = time.perf_counter()
+        detections = full.detect(frame)
+        totals['full']['seconds'].append(time.perf_counter() - t0)
+        totals['full']['pixels'] += int(np.prod(full.input_size))
+        totals['full']['tp'] += count_matches(detections, truths)
+        totals['full']['detections'] += len(detections)
+
+        t0 = time.perf_counter()
+        gate.motion(frame)
+        regions = np.concatenate([gate.motion_boxes(), tracked[:, :4]])
+        pixels = tiled.pixels
+        detections = tiled.detect(frame, regions)
+        tracked = tracker.update(detections[:, :5])
+        totals['tiled']['seconds'].append(time.perf_counter() - t0)
+        totals['tiled']['pixels'] += tiled.pixels - pixels
+        totals['tiled']['tp'] += count_matches(detections, truths)
+        totals['tiled']['detections'] += len(detections)
+
+    print(f"{n} frames of {args.width}x{args.height}, {truths_total} hornets, tile {tiled.tile} px "
+          f"into {tile_detector.input_size[1]} px, full frame into {full.input_size[1]} px")
+    print(f"{'mode':6} {'recall':>7} {'precision':>10} {'kpixels/frame':>14} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, total in totals.items():
+        seconds = sorted(total['seconds'][1:] or total['seconds'])
+        print(f"{name:6} {total['tp'] / max(truths_total, 1):7.3f} {total['tp'] / max(total['detections'], 1):10.3f} "
+              f"{total['pixels'] / max(n, 1) / 1000:14.1f} {seconds[len(seconds) // 2] * 1000:8.1f} "
+              f"{seconds[min(len(seconds) - 1, int(.99 * len(seconds)))] * 1000:8.1f}")
+    print(f"tiled: {tiled.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# Benchmarks sending detection events to a local stand-in server:
+#   - per-request: a new requests.post (and connection) per event, as before
+#   - session:     BeeSafeClient with its keep-alive session
+#   - buffered:    BeeSafeClient in buffered mode, sending batches
+#   - async:       AsyncBeeSafeClient uploads scheduled by a DeviceRuntime
+# Reports delivered events per second and the time the caller spends in
+# send_detection_event (p50/p99).
+#
+# usage: bench_uplink.py [--events 500] [--latency-ms 20] [--batch-size 50] [--max-in-flight 4]
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import requests
+
+import beesafe
+from beesafe_async import AsyncBeeSafeClient
+from device_runtime import DeviceRuntime
+from mock_server import MockServer
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run_per_request(server, events):
+    calls = []
+    for i in range(events):
+        data = {
+            'device': 'bench',
+            'message_type': beesafe.MessageType.DETECTION_EVENT,
+            'data': {'hornet_direction': 90.0, 'timestamp': time.time()}
+        }
+        t0 = time.perf_counter()
+        requests.post(server.url + "/Device/DetectionEvent", json=data)
+        calls.append(time.perf_counter() - t0)
+    return calls
+
+
+def run_client(server, events, **kwargs):
+    client = beesafe.BeeSafeClient(server.url, 0, 0, 0, device_id="bench", **kwargs)
+    calls = []
+    for i in range(events):
+        t0 = time.perf_counter()
+        client.send_detection_event(90.0, datetime.now())
+        calls.append(time.perf_counter() - t0)
+    client.close()
+    return calls
+
+
+def run_async(server, events, max_in_flight):
+    calls = []
+
+    async def upload_all():
+        for i in range(events):
+            t0 = time.perf_counter()
+            runtime.upload(90.0, datetime.now())
+            calls.append(time.perf_counter() - t0)
+            # let the uploads run, like a detection loop between frames
+            await asyncio.sleep(0)
+
+    client = AsyncBeeSafeClient(server.url, "bench", max_in_flight=max_in_flight)
+    runtime = DeviceRuntime(client, ping_interval=3600, max_uploads=events)
+    asyncio.run(runtime.run(upload_all()))
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection event uplink benchmark")
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated server round trip.")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--max-batch-age", type=float, default=0.5)
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Concurrent requests in async mode.")
+    args = parser.parse_args()
+
+    modes = {
+        'per-request': lambda server: run_per_request(server, args.events),
+        'session': lambda server: run_client(server, args.events),
+        'buffered': lambda server: run_client(server, args.events, buffered=True,
+                                              batch_size=args.batch_size,
+                                              max_batch_age=args.max_batch_age,
+                                              max_pending=args.events),
+        'async': lambda server: run_async(server, args.events, args.max_in_flight),
+    }
+
+    print(f"{args.events} events, {args.latency_ms:g} ms server latency")
+    print(f"{'mode':12} {'events/s':>10} {'call p50 ms':>12} {'call p99 ms':>12} {'requests':>9} {'connections':>12}")
+    for name, run in modes.items():
+        server = MockServer(latency=args.latency_ms / 1000).start()
+        start = time.perf_counter()
+        calls = run(server)
+        while len(server.events) < args.events and time.perf_counter() - start < 60:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        print(f"{name:12} {len(server.events) / elapsed:10.1f} {percentile(calls, 50) * 1000:12.3f} "
+              f"{percentile(calls, 99) * 1000:12.3f} {server.requests:9d} {len(server.connections):12d}")
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+# Records short clips around detections instead of the whole stream. The
+# last few seconds of frames stay in a ring buffer in memory, allocated
+# once; trigger() opens a clip that starts pre_roll seconds before the
+# trigger and ends post_roll seconds after the last one, and a background
+# thread encodes it from the ring while new frames keep coming. The clips
+# directory is kept under a size quota by deleting the oldest clips.
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from disk_quota import DiskQuota
+
+CLIP_PREFIX = 'clip_'
+CLIP_EXT = '.mp4'
+
+
+class ClipRecorder:
+    """
+    A ring buffer of recent frames and an encoder thread that writes the
+    clips around triggers from it. add() copies a frame into the ring and
+    trigger() only marks times, so neither waits for the disk.
+    """
+    def __init__(self, directory: str, fps: float, pre_roll: float = 2., post_roll: float = 3.,
+                 buffer_seconds: float = None, max_width: int = 960, max_clip_seconds: float = 60.,
+                 max_bytes: int = 2 << 30, fourcc: str = 'mp4v', block: bool = True):
+        """
+        :param str directory: Where the clips go, created if needed.
+        :param float fps: The frame rate of the frames added, and of the clips.
+        :param float pre_roll: Seconds of video kept before a trigger.
+        :param float post_roll: Seconds of video kept after the last trigger.
+        :param float buffer_seconds: (optional) seconds of frames the ring
+            holds; pre_roll plus one second for the encoder to fall behind
+            by default. The ring takes buffer_seconds * fps frames of memory.
+        :param int max_width: Frames wider than this are scaled down before
+            they are stored; None keeps them as they are.
+        :param float max_clip_seconds: A clip that grows longer than this is
+            closed and the next trigger starts a new one.
+        :param int max_bytes: The most bytes of clips kept in ``directory``;
+            the oldest are deleted to stay under it.
+        :param str fourcc: The codec of the clips.
+        :param bool block: Whether add() waits for the encoder rather than
+            overwrite a frame a clip still needs, e.g. for a video file read
+            faster than real time. With a live camera pass False: the loop
+            never stalls and the encoder loses the frames instead.
+        """
+        self.directory = directory
+        self.fps = fps
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.buffer_seconds = pre_roll + 1. if buffer_seconds is None else buffer_seconds
+        self.max_width = max_width
+        self.max_clip_seconds = max_clip_seconds
+        self.max_bytes = max_bytes
+        self.fourcc = fourcc
+        self.block = block
+        os.makedirs(directory, exist_ok=True)
+
+        self.slots = max(1, int(math.ceil(self.buffer_seconds * fps)))
+        self._ring = None
+        self._times = np.zeros(self.slots)
+        self._seq = 0
+        self._next = 0
+        self._clips = []
+        self._closing = False
+        self._cond = threading.Condition()
+
+        self._quota = DiskQuota(directory, max_bytes, CLIP_PREFIX, CLIP_EXT)
+        self.frames = 0
+        self.triggers = 0
+        self.clips = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.lost = 0
+        self.add_seconds = 0.
+        self.wait_seconds = 0.
+        self.encode_seconds = 0.
+        self._thread = threading.Thread(target=self._run, name="clip-recorder", daemon=True)
+        self._thread.start()
+
+    def _allocate(self, frame):
+        h, w = frame.shape[:2]
+        if self.max_width and w > self.max_width:
+            h, w = int(round(h * self.max_width / w)), self.max_width
+        self._ring = np.empty((self.slots, h, w, 3), dtype=np.uint8)
+        self._frame = np.empty((h, w, 3), dtype=np.uint8)
+
+    def add(self, frame, timestamp: float = None):
+        """
+        Puts a BGR frame in the ring.
+
+        :param float timestamp: (optional) the time of the frame in seconds;
+            by default the frame count over fps, so a video file plays at
+            its own pace however fast it is read.
+        """
+        start = time.perf_counter()
+        with self._cond:
+            if self._ring is None:
+                self._allocate(frame)
+            if self.block and self._clips and self._next <= self._seq - self.slots:
+                wait = time.perf_counter()
+                while self._clips and self._next <= self._seq - self.slots:
+                    self._cond.wait()
+                self.wait_seconds += time.perf_counter() - wait
+            slot = self._seq % self.slots
+            if frame.shape[:2] == self._ring.shape[1:3]:
+                self._ring[slot] = frame
+            else:
+                cv2.resize(frame, self._ring.shape[2:0:-1], dst=self._ring[slot], interpolation=cv2.INTER_AREA)
+            self._times[slot] = self._seq / self.fps if timestamp is None else timestamp
+            self._seq += 1
+            if self._clips:
+                self._cond.notify()
+        self.frames += 1
+        self.add_seconds += time.perf_counter() - start
+
+    def trigger(self, timestamp: float = None, label: str = None):
+        """
+        Asks for the video from pre_roll seconds before ``timestamp`` to
+        post_roll seconds after it. Triggers that overlap the open clip
+        extend it.
+
+        :param float timestamp: (optional) the time of the trigger, as for
+            add(); the time of the newest frame by default.
+        :param str label: (optional) added to the name of a new clip.
+        """
+        with self._cond:
+            if timestamp is None:
+                timestamp = self._times[(self._seq - 1) % self.slots] if self._seq else 0.
+            self.triggers += 1
+            last = self._clips[-1] if self._clips else None
+            if last is not None and timestamp - self.pre_roll <= last['end']:
+                end = min(timestamp + self.post_roll, last['start'] + self.max_clip_seconds)
+                if end >= last['end']:
+                    last['end'] = end
+                if timestamp + self.post_roll <= last['end']:
+                    return
+            if last is None:
+                # nothing pending, so the encoder can skip ahead to the ring
+                self._next = max(self._next, self._seq - self.slots)
+            start = timestamp - self.pre_roll
+            if last is not None:
+                start = max(start, last['end'])
+            name = f"{CLIP_PREFIX}{datetime.now():%Y%m%d-%H%M%S-%f}{'_' + label if label else ''}{CLIP_EXT}"
+            self._clips.append({'start': start, 'end': timestamp + self.post_roll,
+                                'path': os.path.join(self.directory, name), 'follows': last is not None})
+            self._cond.notify()
+
+    def close(self):
+        """
+        Writes the clips still open with the frames there are and stops the
+        encoder thread.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        writer = None
+        while True:
+            frame, finished, stop = None, False, False
+            with self._cond:
+                while not self._closing and not (self._clips and self._next < self._seq):
+                    self._cond.wait()
+                if self._clips and self._next < self._seq:
+                    clip = self._clips[0]
+                    if self._next < self._seq - self.slots:
+                        # fell a whole ring behind, those frames are gone
+                        if writer is not None:
+                            self.lost += self._seq - self.slots - self._next
+                        self._next = self._seq - self.slots
+                    slot = self._next % self.slots
+                    t = self._times[slot]
+                    if t > clip['end']:
+                        self._clips.pop(0)
+                        finished = True
+                        if self.block:
+                            self._cond.notify_all()
+                    else:
+                        self._next += 1
+                        if self.block:
+                            self._cond.notify_all()
+                        # a clip that follows another starts right after it
+                        if t > clip['start'] or (t == clip['start'] and not clip['follows']):
+                            # copied, so add() can reuse the slot while this frame is encoded
+                            np.copyto(self._frame, self._ring[slot])
+                            frame = self._frame
+                else:
+                    # closing and every frame is written
+                    del self._clips[:]
+                    finished = stop = True
+
+            start = time.perf_counter()
+            if frame is not None:
+                if writer is None:
+                    path = clip['path']
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                             (frame.shape[1], frame.shape[0]))
+                    self.clips += 1
+                writer.write(frame)
+                self.frames_written += 1
+            if finished and writer is not None:
+                writer.release()
+                writer = None
+                self._finished(path)
+            self.encode_seconds += time.perf_counter() - start
+            if stop:
+                return
+
+    def _finished(self, path):
+        if not os.path.exists(path):
+            logging.warning(f"Clip recorder: could not write {path}")
+            return
+        self.bytes_written += self._quota.add(path)
+
+    def stats(self) -> dict:
+        """
+        Returns the frames added, triggers, clips and frames written, frames
+        lost because the encoder fell a whole ring behind, clips deleted for
+        the quota, bytes written, the average cost of add() (of which
+        waiting for the encoder) and of encoding a frame.
+        """
+        return {
+            'frames': self.frames,
+            'triggers': self.triggers,
+            'clips': self.clips,
+            'frames_written': self.frames_written,
+            'lost': self.lost,
+            'deleted': self._quota.deleted,
+            'bytes_written': self.bytes_written,
+            'add_ms': self.add_seconds / self.frames * 1000 if self.frames else 0.,
+            'wait_ms': self.wait_seconds / self.frames * 1000 if self.frames else 0.,
+            'encode_ms': self.encode_seconds / self.frames_written * 1000 if self.frames_written else 0.,
+        }
@@ -0,0 +1,210 @@
+# Re-identifies hornets by the colour of their boxes. The features of all
+# boxes in a frame are computed in one pass: every crop is scaled down into
+# one stack of small patches, converted to HSV at once and binned into a
+# coarse hue/saturation histogram. The square root of a histogram has unit
+# length, so the nearest stored identities are one matrix product away.
+# Identities live in a table of fixed capacity and are forgotten once they
+# have not been seen for max_age seconds, or, when the table is full, the
+# one seen longest ago makes room.
+import time
+
+import cv2
+import numpy as np
+
+# Hue (0-179 in OpenCV) and saturation bins of the histogram
+HUE_BINS = 12
+SAT_BINS = 4
+# Side of the patch every crop is scaled to
+PATCH = 16
+
+
+def color_features(frame, boxes, patch: int = PATCH, hue_bins: int = HUE_BINS,
+                   sat_bins: int = SAT_BINS) -> np.ndarray:
+    """
+    Returns the colour features of the boxes in a BGR frame, one row of
+    ``hue_bins * sat_bins`` per box: the square root of the normalised
+    hue/saturation histogram of the box. Boxes with no pixels in the frame
+    get a row of zeros.
+
+    :param boxes: Nx4 (or wider) array of x1, y1, x2, y2 in pixels.
+    """
+    n = len(boxes)
+    features = np.zeros((n, hue_bins * sat_bins), dtype=np.float32)
+    if n == 0:
+        return features
+    boxes = np.asarray(boxes, dtype=float).reshape(n, -1)
+    h, w = frame.shape[:2]
+    xy = boxes[:, :4].astype(np.int64)
+    xy[:, 0::2] = np.clip(xy[:, 0::2], 0, w)
+    xy[:, 1::2] = np.clip(xy[:, 1::2], 0, h)
+    valid = (xy[:, 2] > xy[:, 0]) & (xy[:, 3] > xy[:, 1])
+
+    patches = np.zeros((n * patch, patch, 3), dtype=np.uint8)
+    for i in np.flatnonzero(valid):
+        x1, y1, x2, y2 = xy[i]
+        cv2.resize(frame[y1:y2, x1:x2], (patch, patch), dst=patches[i * patch:(i + 1) * patch],
+                   interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(patches, cv2.COLOR_BGR2HSV).reshape(n, patch * patch, 3).astype(np.int64)
+    bins = (hsv[..., 0] * hue_bins // 180) * sat_bins + hsv[..., 1] * sat_bins // 256
+    bins += np.arange(n)[:, None] * (hue_bins * sat_bins)
+    counts = np.bincount(bins.ravel(), minlength=n * hue_bins * sat_bins).reshape(n, -1)
+    features[valid] = np.sqrt(counts[valid] / float(patch * patch))
+    return features
+
+
+def dominant_color(features, hue_bins: int = HUE_BINS, sat_bins: int = SAT_BINS) -> np.ndarray:
+    """
+    Returns the hue and saturation at the centre of the fullest histogram
+    bin of every feature row, as an Nx2 int array.
+    """
+    best = np.argmax(features, axis=1)
+    return np.column_stack([(best // sat_bins * 2 + 1) * 90 // hue_bins,
+                            (best % sat_bins * 2 + 1) * 128 // sat_bins])
+
+
+class ColorReId:
+    """
+    Gives the boxes of each frame the id of the stored identity nearest in
+    colour, or a new id, and keeps a running average of every identity's
+    colour.
+    """
+    def __init__(self, capacity: int = 1024, max_distance: float = 0.5, max_age: float = 600.,
+                 smoothing: float = 0.1, dim: int = HUE_BINS * SAT_BINS):
+        """
+        :param int capacity: The most identities kept.
+        :param float max_distance: The largest distance between the features
+            of a box and an identity for the box to take its id; features
+            are unit vectors, so distances run from 0 to sqrt(2).
+        :param float max_age: Forget identities not seen for this many
+            seconds; None keeps them until the table is full.
+        :param float smoothing: The weight of a new box in the running
+            average of its identity's features.
+        :param int dim: The length of a feature row.
+        """
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.smoothing = smoothing
+
+        # Free slots hold zeros, which are sqrt(2) from any feature, so the
+        # whole table can be searched without a mask
+        self._features = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._last_seen = np.full(capacity, -np.inf)
+        self._free = list(range(capacity - 1, -1, -1))
+        self.next_id = 0
+        self.frames = 0
+        self.matched = 0
+        self.created = 0
+        self.evicted = 0
+        self.seconds = 0.
+
+    def __len__(self):
+        return self.capacity - len(self._free)
+
+    def identify(self, frame, boxes, timestamp: float = None) -> tuple:
+        """
+        Returns the ids of the boxes in a frame and their colour features.
+        See color_features() and match().
+        """
+        start = time.perf_counter()
+        features = color_features(frame, boxes)
+        self.seconds += time.perf_counter() - start
+        return self.match(features, timestamp), features
+
+    def match(self, features, timestamp: float = None) -> np.ndarray:
+        """
+        Returns an id for every feature row: the nearest stored identity
+        within max_distance, each identity taken by at most one row, or a
+        new identity. Rows of zeros (boxes outside the frame) get -1.
+
+        :param float timestamp: (optional) the time of the frame in seconds,
+            time.monotonic() by default.
+        """
+        start = time.perf_counter()
+        now = time.monotonic() if timestamp is None else timestamp
+        features = np.asarray(features, dtype=np.float32)
+        self.frames += 1
+        if self.max_age is not None:
+            self.evict(now - self.max_age)
+
+        n = len(features)
+        ids = np.full(n, -1, dtype=np.int64)
+        slots = np.full(n, -1, dtype=np.int64)
+        valid = features.any(axis=1)
+        if n and len(self._free) < self.capacity:
+            # |a - b|^2 = 2 - 2 a.b for unit vectors
+            similarity = features @ self._features.T
+            min_similarity = 1. - self.max_distance ** 2 / 2.
+            best = np.argmax(similarity, axis=1)
+            best_similarity = similarity[np.arange(n), best]
+            taken = set()
+            for i in np.argsort(-best_similarity):
+                if not valid[i] or best_similarity[i] < min_similarity:
+                    continue
+                slot = best[i]
+                if slot in taken:
+                    row = similarity[i].copy()
+                    row[list(taken)] = -1.
+                    slot = np.argmax(row)
+                    if row[slot] < min_similarity:
+                        continue
+                taken.add(slot)
+                slots[i] = slot
+
+        matched = slots >= 0
+        if matched.any():
+            rows = slots[matched]
+            average = (1. - self.smoothing) * self._features[rows] + self.smoothing * features[matched]
+            self._features[rows] = average / np.linalg.norm(average, axis=1, keepdims=True)
+            self._last_seen[rows] = now
+            ids[matched] = self._ids[rows]
+            self.matched += int(matched.sum())
+
+        for i in np.flatnonzero(valid & ~matched):
+            ids[i] = self._add(features[i], now)
+        self.seconds += time.perf_counter() - start
+        return ids
+
+    def _add(self, feature, now):
+        if not self._free:
+            # Full: the identity seen longest ago makes room
+            self._remove(np.array([np.argmin(self._last_seen)]))
+        slot = self._free.pop()
+        self._features[slot] = feature
+        self._ids[slot] = self.next_id
+        self._last_seen[slot] = now
+        self.next_id += 1
+        self.created += 1
+        return self._ids[slot]
+
+    def _remove(self, slots):
+        self._features[slots] = 0.
+        self._ids[slots] = -1
+        self._last_seen[slots] = -np.inf
+        self._free.extend(slots.tolist())
+        self.evicted += len(slots)
+
+    def evict(self, before: float) -> int:
+        """
+        Forgets the identities last seen before ``before`` seconds and
+        returns how many there were.
+        """
+        old = np.flatnonzero((self._ids >= 0) & (self._last_seen < before))
+        if len(old):
+            self._remove(old)
+        return len(old)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of identities stored, matched, created and
+        evicted, and the average time per frame.
+        """
+        return {
+            'identities': len(self),
+            'capacity': self.capacity,
+            'matched': self.matched,
+            'created': self.created,
+            'evicted': self.evicted,
+            'avg_ms': self.seconds / self.frames * 1000 if self.frames else 0.,
+        }
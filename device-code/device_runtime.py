@@ -0,0 +1,260 @@
+# Runs a device on one asyncio event loop: the heartbeat and the uploads of
+# detection events are tasks on the loop, while the blocking work (reading
+# frames, inference, tracking) runs in a thread pool beside it. Replaces
+# the ping thread every device script used to start by hand.
+import asyncio
+import concurrent.futures
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import outbox
+from beesafe import ServerError, is_rejection
+from beesafe_async import AsyncBeeSafeClient
+
+# seconds between two pings, as the device scripts always did
+PING_INTERVAL = 10
+
+# the outbox of detection events, in a device's data directory
+OUTBOX_FILE = 'outbox.sqlite'
+
+
+def default_outbox_path(data_dir: str) -> str:
+    """
+    Returns the outbox file in ``data_dir`` if that directory exists, so
+    that a device with a data directory keeps its unsent detection events
+    across restarts, or None.
+    """
+    return os.path.join(data_dir, OUTBOX_FILE) if os.path.isdir(data_dir) else None
+
+
+class DeviceRuntime:
+    """
+    Schedules the heartbeat and the detection event uploads of one device
+    next to its detection loop. run() owns the client: when the work ends,
+    fails or is cancelled (e.g. Ctrl+C), the heartbeat is stopped, pending
+    uploads get ``upload_timeout`` seconds to finish and the client is
+    closed.
+
+    With an ``outbox_path`` the events are stored in an outbox.Outbox
+    first and sent in batches by an outbox.Forwarder, through the client
+    on this loop; failed uploads are retried and the events not sent on
+    shutdown stay on disk for the next start.
+    """
+    def __init__(self, client: AsyncBeeSafeClient, ping_interval: float = PING_INTERVAL,
+                 max_workers: int = 1, max_uploads: int = 100, upload_timeout: float = 10.0,
+                 outbox_path: str = None, max_outbox_events: int = 100000, batch_size: int = 50):
+        """
+        :param AsyncBeeSafeClient client: The client to ping and upload with.
+        :param float ping_interval: Seconds between two pings.
+        :param int max_workers: (optional) threads for the blocking work.
+            Keep 1 when frames must be processed in order.
+        :param int max_uploads: (optional) the most uploads in flight; more
+            events are dropped. Not used with an outbox.
+        :param float upload_timeout: (optional) seconds pending uploads get
+            to finish on shutdown before they are cancelled.
+        :param str outbox_path: (optional) store detection events in this
+            SQLite file until the server has accepted them.
+        :param int max_outbox_events: (optional) the most events kept in the
+            outbox; when full, the oldest events are evicted.
+        :param int batch_size: (optional) the most outbox events sent in
+            one request.
+        """
+        self.client = client
+        self.ping_interval = ping_interval
+        self.max_uploads = max_uploads
+        self.upload_timeout = upload_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="device-work")
+        self._loop = None
+        self._uploads = set()
+        self.batch_size = batch_size
+        self.outbox = outbox.Outbox(outbox_path, max_events=max_outbox_events) if outbox_path else None
+        self._forwarder = None
+        self.pings = 0
+        self.ping_failures = 0
+        self.uploaded = 0
+        self.upload_failures = 0
+        self.dropped = 0
+
+    async def run(self, work=None):
+        """
+        Pings the server every ``ping_interval`` seconds until ``work`` (an
+        awaitable, e.g. process_frames() or run_blocking()) is done, or
+        forever without it, then shuts down.
+        """
+        self._loop = asyncio.get_running_loop()
+        if self.outbox is not None:
+            self._forwarder = outbox.Forwarder(self.outbox, self._send_outbox_batch, batch_size=self.batch_size)
+        heartbeat = asyncio.create_task(self._heartbeat(), name="heartbeat")
+        try:
+            if work is None:
+                await heartbeat
+            else:
+                return await work
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            await self._drain_uploads()
+            if self._forwarder is not None:
+                # a batch being sent may finish, the rest stays on disk
+                await asyncio.to_thread(self._forwarder.stop, self.upload_timeout)
+            await self.client.close()
+            if self._forwarder is not None:
+                await self._close_outbox()
+            # a thread stuck in blocking work cannot be interrupted
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.log_stats()
+
+    async def _heartbeat(self):
+        next_ping = time.monotonic()
+        while True:
+            try:
+                await self.client.send_ping()
+                self.pings += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.ping_failures += 1
+                logging.error(f"Failed to ping server: {e!r}")
+            # keep a fixed rate, however long the ping took
+            next_ping += self.ping_interval
+            await asyncio.sleep(max(0.0, next_ping - time.monotonic()))
+
+    def upload(self, hornet_direction: float, timestamp):
+        """
+        Schedules sending a detection event and returns at once. Safe to
+        call from the executor threads as well as from the loop.
+        """
+        if self.outbox is not None:
+            self.outbox.append({'hornet_direction': hornet_direction, 'timestamp': timestamp.timestamp()})
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._start_upload(hornet_direction, timestamp)
+        else:
+            self._loop.call_soon_threadsafe(self._start_upload, hornet_direction, timestamp)
+
+    def _start_upload(self, hornet_direction: float, timestamp):
+        if len(self._uploads) >= self.max_uploads:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logging.warning(f"Too many uploads in flight, dropped {self.dropped} detection events so far.")
+            return
+        task = asyncio.create_task(self._send(hornet_direction, timestamp))
+        self._uploads.add(task)
+        task.add_done_callback(self._uploads.discard)
+
+    async def _send(self, hornet_direction: float, timestamp):
+        try:
+            await self.client.send_detection_event(hornet_direction, timestamp)
+            self.uploaded += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.upload_failures += 1
+            logging.error(f"Failed to send detection event: {e!r}")
+
+    async def _drain_uploads(self):
+        if not self._uploads:
+            return
+        done, pending = await asyncio.wait(set(self._uploads), timeout=self.upload_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            logging.warning(f"Cancelled {len(pending)} detection event uploads on shutdown.")
+
+    def _send_outbox_batch(self, events: list):
+        # called in the forwarder thread; the client belongs to the loop
+        future = asyncio.run_coroutine_threadsafe(self._send_events(events), self._loop)
+        try:
+            future.result()
+        except concurrent.futures.CancelledError:
+            raise ConnectionError("Upload cancelled on shutdown.")
+
+    async def _send_events(self, events: list):
+        try:
+            await self.client.send_detection_events(
+                [(event['hornet_direction'], datetime.fromtimestamp(event['timestamp'])) for event in events])
+        except outbox.PartialSendError as e:
+            self.uploaded += len(e.sent)
+            self.upload_failures += 1
+            if isinstance(e.error, ServerError) and is_rejection(e.error.status_code):
+                raise outbox.PartialSendError(e.sent, outbox.RejectedError(str(e.error)))
+            raise
+        except ServerError as e:
+            self.upload_failures += 1
+            if is_rejection(e.status_code):
+                raise outbox.RejectedError(str(e))
+            raise
+        except Exception:
+            self.upload_failures += 1
+            raise
+        self.uploaded += len(events)
+
+    async def _close_outbox(self):
+        # the client is closed, so a batch still being sent fails at once
+        await asyncio.to_thread(self._forwarder.stop, 1.0)
+        if self._forwarder.is_alive():
+            logging.warning("Outbox forwarder did not stop in time, leaving the outbox open.")
+        else:
+            self.outbox.close()
+
+    def run_blocking(self, fn, *args):
+        """
+        Returns an awaitable running ``fn(*args)`` in the executor.
+        """
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def process_frames(self, frames, infer):
+        """
+        The detection loop: takes frames from the iterator ``frames`` and
+        passes each to ``infer`` in the executor, so the loop stays free for
+        the heartbeat and the uploads. ``infer`` returns the detection
+        events of a frame as (hornet_direction, timestamp) pairs, which are
+        uploaded without waiting for the server.
+        """
+        frames = iter(frames)
+        end = object()
+
+        def step():
+            frame = next(frames, end)
+            if frame is end:
+                return None
+            return infer(frame) or []
+
+        while True:
+            events = await self.run_blocking(step)
+            if events is None:
+                return
+            for hornet_direction, timestamp in events:
+                self.upload(hornet_direction, timestamp)
+
+    def stats(self) -> dict:
+        """
+        Returns the ping and upload counters; with an outbox, also the
+        events still waiting in it.
+        """
+        stats = {
+            'pings': self.pings,
+            'ping_failures': self.ping_failures,
+            'uploaded': self.uploaded,
+            'upload_failures': self.upload_failures,
+            'dropped': self.dropped,
+            'uploads_in_flight': len(self._uploads),
+        }
+        if self.outbox is not None:
+            stats['backlog'] = self.outbox.backlog()
+        return stats
+
+    def log_stats(self):
+        s = self.stats()
+        logging.info(f"Runtime: {s['pings']} pings ({s['ping_failures']} failed), "
+                     f"{s['uploaded']} events uploaded ({s['upload_failures']} failed, "
+                     f"{s['dropped']} dropped)"
+                     + (f", {s['backlog']} waiting in the outbox" if 'backlog' in s else ""))
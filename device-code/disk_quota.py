@@ -0,0 +1,39 @@
+# Keeps the files a recorder writes into a directory under a size limit by
+# deleting the oldest of them.
+import logging
+import os
+
+
+class DiskQuota:
+    """
+    Tracks the files named ``prefix``*``ext`` in a directory, oldest first,
+    and deletes the oldest whenever they add up to more than ``max_bytes``.
+    Files already there when it starts count too.
+    """
+    def __init__(self, directory: str, max_bytes: int, prefix: str = '', ext: str = ''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)
+                 if name.startswith(prefix) and name.endswith(ext)]
+        paths.sort(key=os.path.getmtime)
+        self._files = [(path, os.path.getsize(path)) for path in paths]
+        self.total = sum(size for _, size in self._files)
+        self.deleted = 0
+
+    def add(self, path: str) -> int:
+        """
+        Counts a newly written file, deletes the oldest files while the
+        total is over the limit (never the new one) and returns its size.
+        """
+        size = os.path.getsize(path)
+        self._files.append((path, size))
+        self.total += size
+        while self.total > self.max_bytes and len(self._files) > 1:
+            old, old_size = self._files.pop(0)
+            try:
+                os.remove(old)
+            except OSError as e:
+                logging.warning(f"Could not delete {old}: {e}")
+            self.total -= old_size
+            self.deleted += 1
+        return size
@@ -0,0 +1,360 @@
+# A dataset of same-sized images (whole frames or hornet crops) that is
+# read without decoding or opening a file per image. The images are stored
+# raw, as uint8 arrays of one shape, in chunk files of a fixed number of
+# slots that are memory-mapped, so reading an image is a view into the page
+# cache. Next to the chunks, append-only tables hold per image the source
+# video, frame number and timestamp, and per box its coordinates, score and
+# track ID:
+#
+#   meta.json      the image shape and slots per chunk
+#   sources.txt    the source names, one per line; records refer to a line
+#   records.bin    RECORD_DTYPE rows, one per image, in the order added
+#   boxes.bin      BOX_DTYPE rows, in the order of their records
+#   chunk_NNNNN.u8 (slots, height, width, channels) uint8
+#
+# One process appends (FrameStoreWriter), any number read (FrameStore),
+# also while it is being written: an image is written before its record,
+# so a reader never sees a record without its pixels. Raw pixels take
+# 10-30 times the space of JPEG, which suits crops and downscaled frames;
+# full-resolution footage is better kept as video.
+#
+# usage: frame_store.py import STORE JPEG|DIR [...] [--shape 640 640] [--source NAME]
+#        frame_store.py export STORE DIR [--quality 95] [--boxes]
+#        frame_store.py info STORE
+import argparse
+import glob
+import json
+import os
+
+import cv2
+import numpy as np
+
+RECORD_DTYPE = np.dtype([('chunk', '<u4'), ('slot', '<u4'), ('source', '<i4'), ('frame', '<i8'),
+                         ('timestamp', '<f8'), ('box_start', '<u8'), ('box_count', '<u4')])
+BOX_DTYPE = np.dtype([('record', '<u8'), ('track_id', '<i8'), ('x1', '<f4'), ('y1', '<f4'),
+                      ('x2', '<f4'), ('y2', '<f4'), ('score', '<f4')])
+
+# Chunks hold about this many bytes of images
+CHUNK_BYTES = 256 << 20
+
+
+def _read_table(path, dtype):
+    """Maps the whole records of an append-only table, read-only."""
+    if not os.path.exists(path):
+        return np.empty(0, dtype=dtype)
+    count = os.path.getsize(path) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+class FrameStoreWriter:
+    """
+    Appends images with their metadata to a store, creating it if needed.
+    Not thread-safe; use one writer per store.
+    """
+    def __init__(self, path: str, shape: tuple = None, chunk_slots: int = None):
+        """
+        :param str path: The store directory.
+        :param tuple shape: The image shape (height, width[, channels]);
+            only needed to create the store.
+        :param int chunk_slots: (optional) images per chunk file, about
+            CHUNK_BYTES of them by default.
+        """
+        self.path = path
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if shape is not None and tuple(self.meta['shape'][:len(shape)]) != tuple(shape):
+                raise ValueError(f"{path} holds images of shape {self.meta['shape']}, not {shape}")
+        else:
+            if shape is None:
+                raise ValueError(f"{path} is not a frame store; give a shape to create one")
+            shape = tuple(shape) + (3,) * (len(shape) == 2)
+            slots = chunk_slots or max(1, CHUNK_BYTES // int(np.prod(shape)))
+            self.meta = {'shape': list(shape), 'chunk_slots': slots}
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, 'w') as f:
+                json.dump(self.meta, f)
+        self.shape = tuple(self.meta['shape'])
+        self.chunk_slots = self.meta['chunk_slots']
+
+        sources_path = os.path.join(path, 'sources.txt')
+        self.sources = {}
+        if os.path.exists(sources_path):
+            with open(sources_path) as f:
+                self.sources = {line.rstrip('\n'): k for k, line in enumerate(f)}
+        self._sources_file = open(sources_path, 'a')
+
+        records_path, boxes_path = os.path.join(path, 'records.bin'), os.path.join(path, 'boxes.bin')
+        records = _read_table(records_path, RECORD_DTYPE)
+        self.count = records.shape[0]
+        # boxes are written before their record, so boxes after the last
+        # record's belong to an image a crash left without one
+        self.box_count = int(records[-1]['box_start'] + records[-1]['box_count']) if self.count else 0
+        del records
+        for table_path, dtype, count in ((records_path, RECORD_DTYPE, self.count),
+                                         (boxes_path, BOX_DTYPE, self.box_count)):
+            # drops rows cut short or left over by a crash
+            if os.path.exists(table_path) and os.path.getsize(table_path) != count * dtype.itemsize:
+                os.truncate(table_path, count * dtype.itemsize)
+        self._records = open(records_path, 'ab')
+        self._boxes = open(boxes_path, 'ab')
+        self._chunk = None
+        self._chunk_index = -1
+
+    def _slot(self, record):
+        chunk, slot = divmod(record, self.chunk_slots)
+        if chunk != self._chunk_index:
+            if self._chunk is not None:
+                self._chunk.flush()
+            path = os.path.join(self.path, f"chunk_{chunk:05d}.u8")
+            mode = 'r+' if os.path.exists(path) else 'w+'
+            # the file is sized for all slots up front; unused ones stay sparse
+            self._chunk = np.memmap(path, dtype=np.uint8, mode=mode, shape=(self.chunk_slots,) + self.shape)
+            self._chunk_index = chunk
+        return chunk, slot, self._chunk[slot]
+
+    def source_id(self, source: str) -> int:
+        """
+        Returns the number of a source name, adding it if it is new.
+        """
+        if source is None:
+            return -1
+        if source not in self.sources:
+            self.sources[source] = len(self.sources)
+            self._sources_file.write(source + '\n')
+            self._sources_file.flush()
+        return self.sources[source]
+
+    def add(self, image, timestamp: float = 0., source: str = None, frame: int = -1, boxes=None,
+            track_ids=None) -> int:
+        """
+        Appends an image and returns its record number. An image of another
+        size is resized to the store shape (the boxes are not).
+
+        :param image: The uint8 image.
+        :param float timestamp: The time the image was taken, e.g. seconds
+            since the epoch or into the video.
+        :param str source: (optional) the video or camera it came from.
+        :param int frame: (optional) its frame number in the source.
+        :param boxes: (optional) [[x1,y1,x2,y2,score],...] in it.
+        :param track_ids: (optional) the track ID of every box.
+        """
+        chunk, slot, dst = self._slot(self.count)
+        self._fit(image, dst)
+        return self._append(chunk, slot, timestamp, source, frame, boxes, track_ids)
+
+    def add_crop(self, frame_image, box, timestamp: float = 0., source: str = None, frame: int = -1,
+                 track_id: int = -1, score: float = 0.) -> int:
+        """
+        Cuts ``box`` [x1,y1,x2,y2] out of a frame, scales it to the store
+        shape and appends it, with the box in frame pixels as its metadata.
+        Returns its record number.
+        """
+        h, w = frame_image.shape[:2]
+        x1, y1 = max(int(box[0]), 0), max(int(box[1]), 0)
+        x2, y2 = min(max(int(np.ceil(box[2])), x1 + 1), w), min(max(int(np.ceil(box[3])), y1 + 1), h)
+        chunk, slot, dst = self._slot(self.count)
+        self._fit(frame_image[y1:y2, x1:x2], dst)
+        return self._append(chunk, slot, timestamp, source, frame, [[*box[:4], score]], [track_id])
+
+    def _fit(self, image, dst):
+        if image.shape[:2] != self.shape[:2]:
+            image = cv2.resize(image, self.shape[1::-1], interpolation=cv2.INTER_AREA)
+        dst[...] = image.reshape(self.shape)
+
+    def _append(self, chunk, slot, timestamp, source, frame, boxes, track_ids):
+        rows = np.zeros(0 if boxes is None else len(boxes), dtype=BOX_DTYPE)
+        if len(rows):
+            boxes = np.asarray(boxes, dtype=np.float32).reshape(len(rows), -1)
+            rows['record'] = self.count
+            rows['track_id'] = -1 if track_ids is None else track_ids
+            for k, column in enumerate(('x1', 'y1', 'x2', 'y2')):
+                rows[column] = boxes[:, k]
+            if boxes.shape[1] > 4:
+                rows['score'] = boxes[:, 4]
+            self._boxes.write(rows.tobytes())
+        record = np.zeros(1, dtype=RECORD_DTYPE)
+        record[0] = (chunk, slot, self.source_id(source), frame, timestamp, self.box_count, len(rows))
+        self._records.write(record.tobytes())
+        self.box_count += len(rows)
+        self.count += 1
+        return self.count - 1
+
+    def flush(self):
+        """
+        Makes everything added so far visible to readers.
+        """
+        if self._chunk is not None:
+            self._chunk.flush()
+        self._boxes.flush()
+        self._records.flush()
+
+    def close(self):
+        self.flush()
+        self._chunk = None
+        self._records.close()
+        self._boxes.close()
+        self._sources_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameStore:
+    """
+    Random access to the images and metadata of a store. Images are
+    returned as read-only views into the memory-mapped chunks, so nothing
+    is copied or decoded until they are used.
+    """
+    def __init__(self, path: str):
+        """
+        :param str path: The store directory.
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.shape = tuple(self.meta['shape'])
+        self.chunk_slots = self.meta['chunk_slots']
+        self._chunks = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+        Picks up the images appended since the store was opened.
+        """
+        self.records = _read_table(os.path.join(self.path, 'records.bin'), RECORD_DTYPE)
+        self.boxes = _read_table(os.path.join(self.path, 'boxes.bin'), BOX_DTYPE)
+        sources_path = os.path.join(self.path, 'sources.txt')
+        self.sources = []
+        if os.path.exists(sources_path):
+            with open(sources_path) as f:
+                self.sources = [line.rstrip('\n') for line in f]
+
+    def __len__(self):
+        return len(self.records)
+
+    def _chunk(self, chunk):
+        if chunk not in self._chunks:
+            path = os.path.join(self.path, f"chunk_{chunk:05d}.u8")
+            self._chunks[chunk] = np.memmap(path, dtype=np.uint8, mode='r', shape=(self.chunk_slots,) + self.shape)
+        return self._chunks[chunk]
+
+    def __getitem__(self, i):
+        """
+        Returns image ``i`` as a read-only view.
+        """
+        record = self.records[i]
+        return self._chunk(int(record['chunk']))[int(record['slot'])]
+
+    def batch(self, indices, out=None) -> np.ndarray:
+        """
+        Copies the images at ``indices`` into one (n, h, w, c) array, e.g. a
+        training batch; ``out`` is filled if given.
+        """
+        if out is None:
+            out = np.empty((len(indices),) + self.shape, dtype=np.uint8)
+        for k, i in enumerate(indices):
+            out[k] = self[i]
+        return out
+
+    def boxes_of(self, i) -> np.ndarray:
+        """
+        Returns the BOX_DTYPE rows of image ``i``.
+        """
+        record = self.records[i]
+        start = int(record['box_start'])
+        return self.boxes[start:start + int(record['box_count'])]
+
+    def source(self, i) -> str:
+        """
+        Returns the source name of image ``i``, or None.
+        """
+        number = int(self.records[i]['source'])
+        return self.sources[number] if number >= 0 else None
+
+
+def import_jpegs(store: FrameStoreWriter, paths, source: str = None) -> int:
+    """
+    Appends JPEG (or any image) files to a store, in order, resized to its
+    shape. The file name is the source unless ``source`` is given. Returns
+    the number of images added.
+    """
+    count = 0
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR if store.shape[2] == 3 else cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        store.add(image, timestamp=os.path.getmtime(path), source=source or os.path.basename(path))
+        count += 1
+    return count
+
+
+def export_jpegs(store: FrameStore, directory: str, quality: int = 95, draw_boxes: bool = False) -> int:
+    """
+    Writes every image of a store to ``directory`` as NNNNNN.jpg, with its
+    boxes drawn if ``draw_boxes``. Returns the number written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for i in range(len(store)):
+        image = store[i]
+        if draw_boxes:
+            image = image.copy()
+            for box in store.boxes_of(i):
+                cv2.rectangle(image, (int(box['x1']), int(box['y1'])), (int(box['x2']), int(box['y2'])),
+                              (0, 255, 0), 2)
+        cv2.imwrite(os.path.join(directory, f"{i:06d}.jpg"), image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return len(store)
+
+
+def _image_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(p for p in glob.glob(os.path.join(path, '*'))
+                            if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame and crop store")
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help="Append image files to a store.")
+    importer.add_argument("store")
+    importer.add_argument("images", nargs="+", help="Image files or directories of them.")
+    importer.add_argument("--shape", type=int, nargs=2, metavar=("HEIGHT", "WIDTH"),
+                          help="The image size of a new store, the first image's by default.")
+    importer.add_argument("--source", help="The source name, the file name by default.")
+    exporter = commands.add_parser('export', help="Write the images of a store as JPEG files.")
+    exporter.add_argument("store")
+    exporter.add_argument("directory")
+    exporter.add_argument("--quality", type=int, default=95)
+    exporter.add_argument("--boxes", action="store_true", help="Draw the boxes.")
+    info = commands.add_parser('info', help="Describe a store.")
+    info.add_argument("store")
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        files = _image_files(args.images)
+        shape = args.shape
+        if shape is None and not os.path.exists(os.path.join(args.store, 'meta.json')) and files:
+            shape = cv2.imread(files[0]).shape[:2]
+        with FrameStoreWriter(args.store, shape) as store:
+            print(f"{import_jpegs(store, files, args.source)} images added, {store.count} in {args.store}")
+    elif args.command == 'export':
+        print(f"{export_jpegs(FrameStore(args.store), args.directory, args.quality, args.boxes)} images written")
+    else:
+        store = FrameStore(args.store)
+        print(f"{len(store)} images of {store.shape}, {len(store.boxes)} boxes, "
+              f"{len(set(store.boxes['track_id'].tolist()) - {-1})} tracks, {len(store.sources)} sources")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,38 +3,30 @@
 # This script emulates a real Raspberry Pi that would connect to our
 # server.
 
+import asyncio
 import logging
 import sys
-import beesafe
+from beesafe_async import AsyncBeeSafeClient
+from device_runtime import DeviceRuntime
 from random import uniform
 
-from time import sleep
-from threading import Thread
-
 def usage():
     print(f"usage: {sys.argv[0]} URL")
     sys.exit(1)
 
 URL = "http://localhost:5089"
 
-client = beesafe.BeeSafeClient(URL, 51.163000 + uniform(-0.01, 0.01), 4.989118 + uniform(-0.02, 0.02), 25)
-
-def ping_server():
-    logging.basicConfig(level=logging.INFO)
-    while True:
-        # Ping the server
-        client.send_ping()
-        sleep(10)
-
-def main():
-    logging.basicConfig(level=logging.INFO)
+async def run_device():
+    client = await AsyncBeeSafeClient.create(URL, 51.163000 + uniform(-0.01, 0.01), 4.989118 + uniform(-0.02, 0.02), 25)
 
     input("Please press any key to continue when the device has been approved.")
 
-    ping_thread = Thread(target=ping_server)
+    # Ping the server until interrupted
+    await DeviceRuntime(client).run()
 
-    ping_thread.start()
-    ping_thread.join()
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_device())
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# A local stand-in for the BeeSafe server's device API, for benchmarks and
+# for trying the device code without the real application. Every device is
+# approved, and each request can be delayed to simulate the round trip to
+# the container app.
+#
+# usage: mock_server.py [PORT] [LATENCY_MS]
+
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PING = 0
+PONG = 1
+DETECTION_EVENT = 2
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Serves /Device/Register, /Device/Ping, /Device/DetectionEvent and
+    /Device/DetectionEvents and records what it receives.
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, batch_endpoint: bool = True):
+        """
+        :param int port: The port to listen on, 0 picks a free one.
+        :param float latency: Seconds every request is delayed.
+        :param bool batch_endpoint: Whether /Device/DetectionEvents exists.
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.batch_endpoint = batch_endpoint
+        self.lock = threading.Lock()
+        self.events = []
+        self.requests = 0
+        self.connections = set()
+        self.available = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, like the real server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body=None):
+        payload = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        message = json.loads(self.rfile.read(length) or b"{}")
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+        if server.latency:
+            time.sleep(server.latency)
+        if not server.available:
+            self._reply(503)
+            return
+
+        if self.path == "/Device/Register":
+            self._reply(200, {"id": str(uuid.uuid4())})
+        elif self.path == "/Device/Ping":
+            self._reply(200, {"message_type": PONG})
+        elif self.path == "/Device/DetectionEvent":
+            with server.lock:
+                server.events.append(message["data"])
+            self._reply(200)
+        elif self.path == "/Device/DetectionEvents" and server.batch_endpoint:
+            events = message["data"]["events"]
+            with server.lock:
+                server.events.extend(events)
+            self._reply(200, {"count": len(events)})
+        else:
+            self._reply(404)
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5089
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+    server = MockServer(port, latency)
+    print(f"Listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,157 @@
+# Decides per frame whether the detector has to run. Most frames at the
+# hive entrance are empty, so the entrance region is compared with a
+# running background at low resolution (a fraction of a millisecond) and
+# the model only runs when something moves there, while tracks are alive,
+# or at least every max_skip frames so a hornet that sits still and
+# becomes part of the background is not missed for long.
+import time
+
+import cv2
+import numpy as np
+
+# Reasons the detector ran, counted in stats()
+MOTION = 'motion'
+ACTIVE = 'active'
+FORCED = 'forced'
+
+
+class MotionGate:
+    """
+    Frame differencing against a running-average background, restricted to
+    a region of interest (the entrance) and computed on a small grayscale
+    copy of it.
+    """
+    def __init__(self, roi: tuple = None, width: int = 160, threshold: int = 25, min_area: float = 0.001,
+                 learning_rate: float = 0.05, max_skip: int = 30):
+        """
+        :param tuple roi: (optional) the entrance region as (x1, y1, x2, y2)
+            fractions of the frame, the whole frame by default.
+        :param int width: The width the region is scaled down to.
+        :param int threshold: The gray level difference from the background
+            at which a pixel counts as changed.
+        :param float min_area: The fraction of the region that has to change
+            for the detector to run.
+        :param float learning_rate: How fast the background follows the
+            frames, e.g. for changing light.
+        :param int max_skip: Run the detector at least every this many
+            frames; 0 never forces it.
+        """
+        self.roi = roi or (0., 0., 1., 1.)
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.max_skip = max_skip
+
+        self._shape = None
+        self._background = None
+        self._since_detect = 0
+        self.frames = 0
+        self.skipped = 0
+        self.reasons = {MOTION: 0, ACTIVE: 0, FORCED: 0}
+        self.gate_seconds = 0.
+        self.last_motion = 0.
+
+    def _layout(self, shape):
+        h, w = shape[:2]
+        x1, y1, x2, y2 = self.roi
+        self._slices = (slice(int(y1 * h), max(int(y2 * h), int(y1 * h) + 1)),
+                        slice(int(x1 * w), max(int(x2 * w), int(x1 * w) + 1)))
+        rh = self._slices[0].stop - self._slices[0].start
+        rw = self._slices[1].stop - self._slices[1].start
+        small_w = min(self.width, rw)
+        self._size = (small_w, max(1, int(round(rh * small_w / rw))))
+        self._small = np.empty((self._size[1], self._size[0], 3), dtype=np.uint8)
+        self._gray = np.empty(self._small.shape[:2], dtype=np.uint8)
+        self._diff = np.empty_like(self._gray)
+        self._reference = np.empty_like(self._gray)
+        self._mask = np.empty_like(self._gray)
+        self._blobs = np.empty_like(self._gray)
+        self._scale = np.array([rw / self._size[0], rh / self._size[1]] * 2)
+        self._offset = np.array([self._slices[1].start, self._slices[0].start] * 2)
+        self._background = None
+        self._shape = shape
+
+    def motion(self, frame) -> float:
+        """
+        Returns the fraction of the region that differs from the background
+        and updates the background with the frame. The first frame, or the
+        first after a change of frame size, returns 1.
+        """
+        if self._shape != frame.shape:
+            self._layout(frame.shape)
+        cv2.resize(frame[self._slices], self._size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.GaussianBlur(self._gray, (3, 3), 0, dst=self._gray)
+        if self._background is None:
+            self._background = self._gray.astype(np.float32)
+            self._mask[:] = 255
+            return 1.
+        cv2.convertScaleAbs(self._background, dst=self._reference)
+        cv2.absdiff(self._gray, self._reference, dst=self._diff)
+        cv2.threshold(self._diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self._mask)
+        changed = cv2.countNonZero(self._mask) / self._mask.size
+        cv2.accumulateWeighted(self._gray, self._background, self.learning_rate)
+        return changed
+
+    def motion_boxes(self, min_pixels: int = 2) -> np.ndarray:
+        """
+        Returns the boxes around the areas that changed in the last frame
+        passed to motion() or should_detect(), as an Nx4 [x1, y1, x2, y2]
+        array in frame pixels. The first frame returns the whole region.
+
+        :param int min_pixels: Ignore areas smaller than this many pixels of
+            the scaled down region, e.g. sensor noise.
+        """
+        if self._background is None:
+            return np.empty((0, 4))
+        # joins the pieces of one hornet into one area
+        cv2.dilate(self._mask, None, dst=self._blobs)
+        _, _, blobs, _ = cv2.connectedComponentsWithStats(self._blobs, connectivity=8)
+        blobs = blobs[1:][blobs[1:, cv2.CC_STAT_AREA] >= min_pixels]
+        x, y, w, h = blobs[:, 0], blobs[:, 1], blobs[:, 2], blobs[:, 3]
+        return np.column_stack([x, y, x + w, y + h]) * self._scale + self._offset
+
+    def should_detect(self, frame, active: bool = False) -> bool:
+        """
+        Returns whether the detector has to run on this frame. Call it for
+        every frame, skipped or not, so the background stays current.
+
+        :param frame: The BGR frame.
+        :param bool active: Whether hornets are being followed, e.g. the
+            tracker has live tracks or the last detection found any; the
+            detector then runs whatever the motion.
+        """
+        start = time.perf_counter()
+        self.last_motion = self.motion(frame)
+        self.frames += 1
+        if active:
+            reason = ACTIVE
+        elif self.last_motion >= self.min_area:
+            reason = MOTION
+        elif self.max_skip and self._since_detect >= self.max_skip:
+            reason = FORCED
+        else:
+            reason = None
+        self.gate_seconds += time.perf_counter() - start
+
+        if reason is None:
+            self._since_detect += 1
+            self.skipped += 1
+            return False
+        self._since_detect = 0
+        self.reasons[reason] += 1
+        return True
+
+    def stats(self) -> dict:
+        """
+        Returns the number of frames seen and skipped, why the detector ran
+        on the others, and the average cost of the gate per frame.
+        """
+        return {
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'skip_rate': self.skipped / self.frames if self.frames else 0.,
+            **self.reasons,
+            'avg_ms': self.gate_seconds / self.frames * 1000 if self.frames else 0.,
+        }
@@ -0,0 +1,200 @@
+# Runs the exported hornet model (best.onnx) directly in onnxruntime,
+# without ultralytics and torch. Letterboxing and the input tensor are
+# written into buffers allocated once, the output is bound to a fixed
+# array, and box decoding and NMS are done with NumPy. Returns the same
+# Nx6 [x1, y1, x2, y2, confidence, class] array as
+# ultralytics' results[0].boxes.data.
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+# Same defaults as ultralytics' predict()
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.7
+DEFAULT_MAX_DET = 300
+# boxes considered by NMS at most, and the offset separating classes
+MAX_NMS = 30000
+MAX_WH = 7680
+PAD_VALUE = 114
+
+
+def nms(boxes, scores, iou_threshold, max_output=None):
+    """
+    Greedy non-maximum suppression. Returns the indices of the boxes kept,
+    highest score first; a box is dropped when its IoU with a kept box is
+    above ``iou_threshold``. Stops once ``max_output`` boxes are kept.
+    """
+    order = np.argsort(-scores, kind='stable')
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while order.size and len(keep) != max_output:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0., np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0., np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def class_nms(detections, iou_threshold, max_output=None):
+    """
+    Runs nms() on Nx6 [x1, y1, x2, y2, confidence, class] detections per
+    class and returns the kept rows, highest confidence first.
+    """
+    # offset each class so boxes of different classes never overlap
+    boxes = detections[:, :4] + detections[:, 5:6] * MAX_WH
+    return detections[nms(boxes, detections[:, 4], iou_threshold, max_output)]
+
+
+def decode(prediction, conf, iou, max_det):
+    """
+    Turns a raw (4 + classes, anchors) prediction into an Nx6 float32 array
+    of [x1, y1, x2, y2, confidence, class] in the model's input pixels,
+    after the confidence threshold and NMS.
+    """
+    scores = prediction[4:]
+    if len(scores) == 1:
+        candidates = np.flatnonzero(scores[0] > conf)
+        confidence = scores[0, candidates]
+        cls = np.zeros(len(candidates), dtype=np.float32)
+    else:
+        best = scores.max(axis=0)
+        candidates = np.flatnonzero(best > conf)
+        confidence = best[candidates]
+        cls = scores[:, candidates].argmax(axis=0).astype(np.float32)
+    if len(candidates) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+    if len(candidates) > MAX_NMS:
+        top = np.argsort(-confidence, kind='stable')[:MAX_NMS]
+        candidates, confidence, cls = candidates[top], confidence[top], cls[top]
+
+    cx, cy, bw, bh = prediction[:4, candidates]
+    detections = np.column_stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2,
+                                  confidence, cls]).astype(np.float32)
+    return class_nms(detections, iou, max_det)
+
+
+def to_frame(detections, gain, top, left, width, height):
+    """
+    Maps decoded detections from the letterboxed input back to a frame of
+    ``width`` x ``height``, in place, clips them to it and returns those
+    that are not empty after clipping (boxes in the padding are).
+    """
+    boxes = detections[:, :4]
+    boxes -= (left, top, left, top)
+    boxes /= gain
+    np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+    return detections[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+
+
+class OnnxDetector:
+    """
+    A YOLO detector on onnxruntime for models exported with
+    ``model.export(format="onnx")``: one image input of shape (1, 3, H, W)
+    and one output of shape (1, 4 + classes, anchors).
+    """
+    def __init__(self, model_path: str, conf: float = DEFAULT_CONF, iou: float = DEFAULT_IOU,
+                 max_det: int = DEFAULT_MAX_DET, imgsz: int = 640, intra_op_threads: int = 0,
+                 inter_op_threads: int = 1, providers: list = None):
+        """
+        :param str model_path: The .onnx file.
+        :param float conf: The minimum confidence of a detection.
+        :param float iou: The IoU above which NMS drops the weaker box.
+        :param int max_det: The most detections returned per frame.
+        :param int imgsz: (optional) the input size, only used when the
+            model was exported with a dynamic input shape.
+        :param int intra_op_threads: (optional) threads used inside one
+            operator; 0 lets onnxruntime use all cores.
+        :param int inter_op_threads: (optional) threads running operators
+            in parallel; only used with a parallel execution mode.
+        :param list providers: (optional) onnxruntime execution providers,
+            the CPU provider by default.
+        """
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options,
+                                            providers=providers or ['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        model_output = self.session.get_outputs()[0]
+        height, width = [d if isinstance(d, int) else imgsz for d in model_input.shape[2:]]
+        self.input_size = (height, width)
+        self._canvas = np.full((height, width, 3), PAD_VALUE, dtype=np.uint8)
+        self._input = np.empty((1, 3, height, width), dtype=np.float32)
+        self._layout = None
+
+        # Bind the input and, when its shape is fixed, the output to our
+        # own arrays so no tensor is allocated per frame.
+        self._binding = self.session.io_binding()
+        self._binding.bind_input(model_input.name, 'cpu', 0, np.float32, self._input.shape,
+                                 self._input.ctypes.data)
+        if all(isinstance(d, int) for d in model_output.shape):
+            self._output = np.empty(model_output.shape, dtype=np.float32)
+            self._binding.bind_output(model_output.name, 'cpu', 0, np.float32, self._output.shape,
+                                      self._output.ctypes.data)
+        else:
+            self._output = None
+            self._binding.bind_output(model_output.name, 'cpu')
+
+    def preprocess(self, frame) -> np.ndarray:
+        """
+        Letterboxes a BGR frame into the (1, 3, H, W) float32 model input
+        and returns it. The array is reused by the next call.
+        """
+        h, w = frame.shape[:2]
+        if self._layout is None or self._layout[0] != (h, w):
+            height, width = self.input_size
+            gain = min(height / h, width / w)
+            nw, nh = int(round(w * gain)), int(round(h * gain))
+            top = int(round((height - nh) / 2 - 0.1))
+            left = int(round((width - nw) / 2 - 0.1))
+            self._layout = ((h, w), gain, nw, nh, top, left)
+            # the borders stay the same as long as the frame size does
+            self._canvas[:] = PAD_VALUE
+        _, gain, nw, nh, top, left = self._layout
+        cv2.resize(frame, (nw, nh), dst=self._canvas[top:top + nh, left:left + nw],
+                   interpolation=cv2.INTER_LINEAR)
+        # BGR to RGB, HWC to CHW and scaled to [0, 1], straight into the input
+        np.multiply(self._canvas.transpose(2, 0, 1)[::-1], np.float32(1 / 255.), out=self._input[0])
+        return self._input
+
+    def infer(self, frame) -> np.ndarray:
+        """
+        Runs the model on a BGR frame and returns the raw
+        (4 + classes, anchors) prediction, in the model's input pixels.
+        """
+        self.preprocess(frame)
+        self.session.run_with_iobinding(self._binding)
+        if self._output is not None:
+            return self._output[0]
+        return self._binding.copy_outputs_to_cpu()[0][0]
+
+    def detect(self, frame) -> np.ndarray:
+        """
+        Returns the detections in a BGR frame as an Nx6 float32 array of
+        [x1, y1, x2, y2, confidence, class] in frame pixels, highest
+        confidence first.
+        """
+        return self.postprocess(self.infer(frame))
+
+    def postprocess(self, prediction) -> np.ndarray:
+        """
+        Decodes a raw prediction of the last frame passed to infer().
+        """
+        detections = decode(prediction, self.conf, self.iou, self.max_det)
+
+        # back from the letterboxed input to the frame
+        (h, w), gain, _, _, top, left = self._layout
+        return to_frame(detections, gain, top, left, w, h)
@@ -0,0 +1,285 @@
+# A durable store-and-forward outbox for detection events. Events are
+# written to a SQLite database first and only removed once the server
+# has accepted them, so a network outage delays events instead of losing
+# them.
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class RejectedError(Exception):
+    """
+    Raised by a send function when the server refuses a batch for good
+    (e.g. 400 Bad Request). Rejected events are removed instead of retried.
+    """
+    pass
+
+
+class PartialSendError(Exception):
+    """
+    Raised by a send function when only some events of a batch were sent
+    (e.g. one request per event, and one of them failed). The events at
+    the ``sent`` indices of the batch are removed; the others are handled
+    as ``error`` says: retried, or removed if it is a RejectedError.
+    """
+    def __init__(self, sent: list, error: Exception):
+        super().__init__(f"{len(sent)} events sent, then: {error!r}")
+        self.sent = sent
+        self.error = error
+
+
+class Outbox:
+    """
+    An append-only queue of events in a SQLite database in WAL mode.
+
+    append() only adds the event to an in-memory list; a background thread
+    writes that list to disk in one transaction (one fsync) every
+    ``sync_every`` events or ``sync_interval`` seconds. When the outbox
+    holds more than ``max_events`` events the oldest are evicted.
+    """
+    def __init__(self, path: str, max_events: int = 100000, sync_every: int = 64,
+                 sync_interval: float = 1.0):
+        """
+        :param str path: The database file, created if needed.
+        :param int max_events: The most events kept on disk.
+        :param int sync_every: Write to disk once this many events wait.
+        :param float sync_interval: Write to disk at least this often, in
+            seconds, while events wait.
+        """
+        self.path = path
+        self.max_events = max_events
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp REAL NOT NULL,
+                hornet_direction REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp, id)")
+        self._db_lock = threading.Lock()
+        self._staged = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self.appended = 0
+        self.evicted = 0
+        self.syncs = 0
+        self._count = self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        self._writer = threading.Thread(target=self._write_loop, name="outbox-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, event: dict):
+        """
+        Queues an event with 'timestamp' and 'hornet_direction' keys. Only
+        touches memory. Raises RuntimeError once the outbox is closed.
+        """
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("The outbox is closed.")
+            self._staged.append((event['timestamp'], event['hornet_direction']))
+            self.appended += 1
+            if len(self._staged) == 1 or len(self._staged) >= self.sync_every:
+                self._cond.notify_all()
+
+    def sync(self):
+        """
+        Writes the staged events to disk now.
+        """
+        # _count and the staged events are only changed with _db_lock held
+        # (taken before _cond), so backlog() never misses rows in between
+        with self._db_lock:
+            with self._cond:
+                rows = list(self._staged)
+                self._staged.clear()
+            if not rows:
+                return
+            excess = self._count + len(rows) - self.max_events
+            try:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT INTO events (timestamp, hornet_direction) VALUES (?, ?)", rows)
+                if excess > 0:
+                    # evict the oldest events first
+                    self._db.execute("""
+                        DELETE FROM events WHERE id IN (
+                            SELECT id FROM events ORDER BY timestamp, id LIMIT ?)""", (excess,))
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._db.execute("ROLLBACK")
+                logging.error(f"Failed to write {len(rows)} events to the outbox, keeping them in memory: {e!r}")
+                with self._cond:
+                    self._staged.extendleft(reversed(rows))
+                return
+            self._count += len(rows) - max(excess, 0)
+            self.evicted += max(excess, 0)
+            self.syncs += 1
+        if excess > 0:
+            logging.warning(f"Outbox full, evicted the {excess} oldest events ({self.evicted} so far).")
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._closing:
+                    if self._staged:
+                        self._cond.wait(self.sync_interval)
+                        break
+                    self._cond.wait()
+                closing = self._closing
+            self.sync()
+            if closing:
+                return
+
+    def peek(self, limit: int) -> list:
+        """
+        Returns up to ``limit`` of the oldest events on disk as
+        (id, event) pairs, in chronological order.
+        """
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, timestamp, hornet_direction FROM events ORDER BY timestamp, id LIMIT ?",
+                (limit,)).fetchall()
+        return [(row[0], {'hornet_direction': row[2], 'timestamp': row[1]}) for row in rows]
+
+    def ack(self, ids: list):
+        """
+        Removes the events with the given ids, once they have been sent.
+        """
+        if not ids:
+            return
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            cursor = self._db.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in ids])
+            self._count -= cursor.rowcount
+            self._db.execute("COMMIT")
+
+    def backlog(self) -> int:
+        """
+        Returns the number of events waiting, on disk or staged.
+        """
+        with self._db_lock, self._cond:
+            return self._count + len(self._staged)
+
+    def oldest_age(self) -> float:
+        """
+        Returns how many seconds the oldest waiting event is old, or 0.
+        """
+        with self._db_lock:
+            row = self._db.execute("SELECT MIN(timestamp) FROM events").fetchone()
+        return max(0.0, time.time() - row[0]) if row[0] is not None else 0.0
+
+    def close(self):
+        """
+        Writes what is staged and closes the database.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._writer.join()
+        with self._db_lock:
+            self._db.close()
+
+
+class Forwarder:
+    """
+    Drains an Outbox in chronological batches through ``send_batch`` in a
+    background thread. A failed batch stays in the outbox and is retried
+    with exponential backoff; events are only removed once sent or
+    rejected.
+    """
+    def __init__(self, outbox: Outbox, send_batch, batch_size: int = 50,
+                 idle_interval: float = 1.0, min_backoff: float = 1.0, max_backoff: float = 300.0):
+        """
+        :param Outbox outbox: The outbox to drain.
+        :param send_batch: Callable that sends a list of events and raises
+            on failure, RejectedError if the events must not be retried and
+            PartialSendError if only some of them were sent.
+        :param int batch_size: The most events sent in one batch.
+        :param float idle_interval: Seconds between checks of an empty outbox.
+        :param float min_backoff: The first retry delay, in seconds.
+        :param float max_backoff: The longest retry delay, in seconds.
+        """
+        self.outbox = outbox
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.sent = 0
+        self.rejected = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="outbox-forwarder", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self.outbox.peek(self.batch_size)
+            if not batch:
+                self._stop.wait(self.idle_interval)
+                continue
+
+            ids = [row_id for row_id, _ in batch]
+            try:
+                self.send_batch([event for _, event in batch])
+            except PartialSendError as e:
+                # the events that got through must not be sent again
+                sent = set(e.sent)
+                self.outbox.ack([ids[i] for i in sent])
+                self.sent += len(sent)
+                if sent:
+                    # the server answers, so the backoff starts over
+                    self.backoff = 0.0
+                self._failed([row_id for i, row_id in enumerate(ids) if i not in sent], e.error)
+                continue
+            except Exception as e:
+                self._failed(ids, e)
+                continue
+
+            self.outbox.ack(ids)
+            self.sent += len(batch)
+            self.backoff = 0.0
+
+    def _failed(self, ids: list, error: Exception):
+        if isinstance(error, RejectedError):
+            logging.error(f"Server rejected {len(ids)} detection events, dropping them: {error!r}")
+            self.outbox.ack(ids)
+            self.rejected += len(ids)
+            return
+        self.failures += 1
+        self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+        delay = self.backoff * random.uniform(0.5, 1.0)
+        logging.warning(f"Failed to send detection events ({error!r}), "
+                        f"{self.outbox.backlog()} waiting, retrying in {delay:.1f} s.")
+        self._stop.wait(delay)
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        """
+        Whether the forwarder thread still runs, e.g. in a send that
+        outlasted the timeout of stop().
+        """
+        return self._thread.is_alive()
+
+    def stats(self) -> dict:
+        """
+        Returns the backlog and the forwarding counters.
+        """
+        return {
+            'backlog': self.outbox.backlog(),
+            'oldest_age': self.outbox.oldest_age(),
+            'appended': self.outbox.appended,
+            'evicted': self.outbox.evicted,
+            'sent': self.sent,
+            'rejected': self.rejected,
+            'failures': self.failures,
+            'backoff': self.backoff,
+        }
@@ -0,0 +1,229 @@
+# A small staged pipeline for the device loop: every stage runs in its
+# own thread and hands its output to the next stage through a bounded
+# queue, so reading/decoding, inference and postprocessing of different
+# frames overlap.
+import logging
+import threading
+import time
+from collections import deque
+
+# What a full queue does with a new item.
+BLOCK = "block"              # wait for room, nothing is lost
+DROP_OLDEST = "drop_oldest"  # discard the oldest queued item
+LATEST = "latest"            # discard everything queued, keep only the new item
+POLICIES = (BLOCK, DROP_OLDEST, LATEST)
+
+_END = object()
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class BoundedQueue:
+    """
+    A FIFO queue with a maximum size and a policy for what happens when it
+    is full. Keeps counters so its depth can be monitored.
+    """
+    def __init__(self, maxsize: int, policy: str = BLOCK):
+        """
+        :param int maxsize: The maximum number of queued items.
+        :param str policy: One of BLOCK, DROP_OLDEST or LATEST.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of {POLICIES}.")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, force: bool = False):
+        """
+        Adds an item, applying the queue policy when it is full.
+
+        :param bool force: Add the item even if the queue is full, used for
+            the end-of-stream marker.
+        """
+        with self._cond:
+            if self._closed:
+                raise QueueClosed()
+            if not force and len(self._items) >= self.maxsize:
+                if self.policy == BLOCK:
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        raise QueueClosed()
+                elif self.policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += len(self._items)
+                    self._items.clear()
+            self._items.append(item)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify_all()
+
+    def get(self):
+        """
+        Removes and returns the oldest item, waiting for one if needed.
+        """
+        with self._cond:
+            while not self._items and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise QueueClosed()
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """
+        Wakes up every waiting thread and discards the queue: both put()
+        and get() raise QueueClosed from now on.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class Stage:
+    """
+    One step of the pipeline. ``fn`` gets the output of the previous stage
+    and returns the input of the next one; returning None drops the item.
+    """
+    def __init__(self, name: str, fn, maxsize: int = 2, policy: str = BLOCK):
+        """
+        :param str name: Name used in logs and statistics.
+        :param fn: Callable that processes one item.
+        :param int maxsize: Size of the queue in front of this stage.
+        :param str policy: What to do when that queue is full.
+        """
+        self.name = name
+        self.fn = fn
+        self.queue = BoundedQueue(maxsize, policy)
+        self.processed = 0
+        self.busy_seconds = 0.0
+
+
+class Pipeline:
+    """
+    Runs ``source`` (an iterable) and a list of stages, each in its own
+    thread. The last stage is the sink; whatever it returns is discarded.
+    """
+    def __init__(self, source, stages, log_interval: float = 0):
+        """
+        :param source: Iterable producing the pipeline input, e.g. frames.
+        :param list stages: The Stage objects, in order.
+        :param float log_interval: (optional) log the statistics every this
+            many seconds, 0 disables it.
+        """
+        self.source = source
+        self.stages = stages
+        self.log_interval = log_interval
+        self.produced = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._run_source, name="source", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            following = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            self._threads.append(threading.Thread(target=self._run_stage, args=(stage, following),
+                                                  name=stage.name, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        if self.log_interval > 0:
+            threading.Thread(target=self._log_stats, name="pipeline-stats", daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops the pipeline early, e.g. when the user quits. Items still in
+        the queues are discarded.
+        """
+        self._stop.set()
+        for stage in self.stages:
+            stage.queue.close()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def run(self):
+        """
+        Starts the pipeline and waits until the source is exhausted and every
+        stage has drained, or until stop() is called.
+        """
+        self.start()
+        try:
+            self.join()
+        except KeyboardInterrupt:
+            self.stop()
+            self.join()
+
+    def _run_source(self):
+        first = self.stages[0].queue
+        try:
+            for item in self.source:
+                if self._stop.is_set():
+                    return
+                first.put(item)
+                self.produced += 1
+            first.put(_END, force=True)
+        except QueueClosed:
+            pass
+
+    def _run_stage(self, stage, following):
+        try:
+            while True:
+                item = stage.queue.get()
+                if item is _END:
+                    if following is not None:
+                        following.queue.put(_END, force=True)
+                    return
+                start = time.perf_counter()
+                try:
+                    result = stage.fn(item)
+                except Exception:
+                    logging.exception(f"Pipeline stage {stage.name} failed.")
+                    self.stop()
+                    return
+                stage.busy_seconds += time.perf_counter() - start
+                stage.processed += 1
+                if result is not None and following is not None:
+                    following.queue.put(result)
+        except QueueClosed:
+            pass
+
+    def stats(self) -> dict:
+        """
+        Returns the current statistics of every stage: queue depth, the
+        highest depth seen, dropped items, processed items and the average
+        time spent per item.
+        """
+        return {
+            stage.name: {
+                'depth': len(stage.queue),
+                'max_depth': stage.queue.max_depth,
+                'dropped': stage.queue.dropped,
+                'processed': stage.processed,
+                'avg_ms': stage.busy_seconds / stage.processed * 1000 if stage.processed else 0.0,
+            }
+            for stage in self.stages
+        }
+
+    def _log_stats(self):
+        while not self._stop.wait(self.log_interval):
+            if not any(thread.is_alive() for thread in self._threads):
+                return
+            parts = [f"{name}: depth {s['depth']}/{s['max_depth']} dropped {s['dropped']} {s['avg_ms']:.1f} ms"
+                     for name, s in self.stats().items()]
+            logging.info("Pipeline " + " | ".join(parts))
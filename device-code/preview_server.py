@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+#
+# A headless live preview: the annotated frames as an MJPEG stream over
+# HTTP, to open in a browser instead of a cv2.imshow window (which needs a
+# display and breaks over SSH). The detection loop only hands over frames
+# and boxes with publish(); they are dropped unless a client is watching
+# and the preview is due (at most max_fps), and a render thread scales,
+# annotates and encodes them. Nobody watching costs nothing.
+#
+# It listens on localhost only; from another machine use a tunnel:
+#   ssh -L 8080:localhost:8080 pi   and open http://localhost:8080
+#
+# usage: preview_server.py [VIDEO] [PORT]   (streams a video, for trying it)
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+BOUNDARY = b'frame'
+PAGE = b"""<!DOCTYPE html>
+<html><head><title>BeeSafe preview</title></head>
+<body style="margin:0;background:#000"><img src="/stream" style="max-width:100%"></body></html>
+"""
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """
+    Serves / (a page showing the stream) and /stream (multipart JPEG) from
+    its own threads. The detection loop calls publish() on every frame.
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int = 8080, host: str = '127.0.0.1', max_fps: float = 5., max_width: int = 640,
+                 quality: int = 70):
+        """
+        :param int port: The port to listen on, 0 picks a free one.
+        :param str host: The address to listen on; localhost by default.
+        :param float max_fps: The most preview frames per second.
+        :param int max_width: Frames are scaled down to at most this width.
+        :param int quality: The JPEG quality of the preview.
+        """
+        super().__init__((host, port), _Handler)
+        self.max_fps = max_fps
+        self.max_width = max_width
+        self.quality = quality
+        self._cond = threading.Condition()
+        self._pending = None
+        self._jpeg = None
+        self._jpeg_seq = 0
+        self._last_publish = -float('inf')
+        self._closing = False
+        self.clients = 0
+        self.published = 0
+        self.encoded = 0
+        self.sent = 0
+        self.publish_seconds = 0.
+        self.render_seconds = 0.
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    @property
+    def watching(self) -> bool:
+        """Whether a client is connected to the stream."""
+        return self.clients > 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="preview-server", daemon=True).start()
+        self._renderer = threading.Thread(target=self._render, name="preview-render", daemon=True)
+        self._renderer.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self.shutdown()
+        self.server_close()
+        self._renderer.join()
+
+    def publish(self, frame, boxes=(), labels=None, colors=None) -> bool:
+        """
+        Offers a BGR frame and its detections to the preview. Returns at
+        once, without copying, unless a client is watching and the last
+        preview frame is 1 / max_fps old; then a scaled-down copy goes to
+        the render thread. Returns whether the frame was taken.
+
+        :param boxes: Nx4 (or wider) x1, y1, x2, y2 in frame pixels.
+        :param labels: (optional) a text per box, drawn above it.
+        :param colors: (optional) a BGR color per box, green by default.
+        """
+        if not self.clients:
+            return False
+        now = time.monotonic()
+        if now - self._last_publish < 1. / self.max_fps:
+            return False
+        self._last_publish = now
+        start = time.perf_counter()
+        h, w = frame.shape[:2]
+        scale = min(1., self.max_width / w)
+        if scale < 1.:
+            image = cv2.resize(frame, (self.max_width, max(1, int(round(h * scale)))), interpolation=cv2.INTER_AREA)
+        else:
+            image = frame.copy()
+        boxes = (np.asarray(boxes, dtype=float).reshape(len(boxes), -1)[:, :4] * scale if len(boxes)
+                 else np.empty((0, 4)))
+        with self._cond:
+            self._pending = (image, boxes, labels, colors)
+            self._cond.notify_all()
+        self.published += 1
+        self.publish_seconds += time.perf_counter() - start
+        return True
+
+    def _render(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                if self._closing:
+                    return
+                image, boxes, labels, colors = self._pending
+                self._pending = None
+            start = time.perf_counter()
+            for i, (x1, y1, x2, y2) in enumerate(boxes.astype(int).tolist()):
+                color = tuple(int(c) for c in colors[i]) if colors is not None else (0, 255, 0)
+                cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+                if labels is not None:
+                    cv2.putText(image, labels[i], (x1, y1 - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+            ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            with self._cond:
+                self._jpeg = data.tobytes()
+                self._jpeg_seq += 1
+                self._cond.notify_all()
+            self.encoded += 1
+            self.render_seconds += time.perf_counter() - start
+
+    def next_jpeg(self, seq: int):
+        """
+        Waits for a preview frame newer than ``seq`` and returns it with its
+        number, or (None, seq) once the server stops.
+        """
+        with self._cond:
+            while self._jpeg_seq == seq and not self._closing:
+                self._cond.wait()
+            if self._closing:
+                return None, seq
+            return self._jpeg, self._jpeg_seq
+
+    def stats(self) -> dict:
+        """
+        Returns the clients watching, the frames published, encoded and
+        sent, and the average cost of taking a frame in publish() and of
+        rendering it.
+        """
+        return {
+            'clients': self.clients,
+            'published': self.published,
+            'encoded': self.encoded,
+            'sent': self.sent,
+            'publish_ms': self.publish_seconds / self.published * 1000 if self.published else 0.,
+            'render_ms': self.render_seconds / self.encoded * 1000 if self.encoded else 0.,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/':
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+        elif self.path == '/stream':
+            self._stream()
+        else:
+            self.send_error(404)
+
+    def _stream(self):
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=" + BOUNDARY.decode())
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        with server._cond:
+            server.clients += 1
+            seq = server._jpeg_seq
+        try:
+            while True:
+                jpeg, seq = server.next_jpeg(seq)
+                if jpeg is None:
+                    return
+                self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                                 + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+                server.sent += 1
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server._cond:
+                server.clients -= 1
+
+
+def main():
+    # plays a video into the preview, e.g. to check the tunnel
+    video = sys.argv[1] if len(sys.argv) > 1 else 0
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    preview = PreviewServer(port).start()
+    print(f"Preview on {preview.url}")
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            preview.publish(frame)
+            time.sleep(1. / fps)
+    finally:
+        cap.release()
+        preview.stop()
+        print(f"Preview: {preview.stats()}")
+
+
+if __name__ == '__main__':
+    main()
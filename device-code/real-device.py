@@ -3,167 +3,226 @@
 # This script emulates a real Raspberry Pi that would connect to our
 # server.
 
+import asyncio
+import logging
 import os
-import beesafe
+import pipeline
+from beesafe_async import AsyncBeeSafeClient
+from device_runtime import DeviceRuntime, default_outbox_path
 from random import uniform
-from time import sleep
-from threading import Thread
 import cv2
-import numpy as np
 from ultralytics import YOLO
-from scipy.spatial.distance import euclidean
-import RPi.GPIO as GPIO
 import time
+import actuator
+from motion_gate import MotionGate
+from color_reid import ColorReId, dominant_color
+from clip_recorder import ClipRecorder
+from preview_server import PreviewServer
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # not on a Pi, e.g. testing on a laptop
+    GPIO = actuator.FakeGPIO()
 
 # Constants
 URL = "https://beesafe-app-container.gentlewater-59ffe662.uksouth.azurecontainerapps.io"
+DATA_DIR = './data'
 ID_FILE = './data/id'
 
+# Frames waiting for inference. With a video file nothing may be dropped;
+# with a live camera use pipeline.LATEST so inference always sees the
+# newest frame when it falls behind.
+FRAME_QUEUE_SIZE = 4
+FRAME_POLICY = pipeline.BLOCK
+PIPELINE_LOG_INTERVAL = 10  # seconds between queue depth log lines
+
+# The hive entrance as (x1, y1, x2, y2) fractions of the frame; the model
+# only runs when something moves there. None watches the whole frame.
+ENTRANCE_ROI = None
+
+# Clips of the hornets instead of the whole video: CLIP_PRE_ROLL seconds
+# before a detection to CLIP_POST_ROLL seconds after the last one, in
+# CLIP_DIR, which is kept under CLIP_QUOTA_BYTES by deleting the oldest
+CLIP_DIR = './data/clips'
+CLIP_PRE_ROLL = 2
+CLIP_POST_ROLL = 3
+CLIP_QUOTA_BYTES = 2 << 30
+
+# Live view of the detections on http://localhost:PREVIEW_PORT (through
+# ssh -L from another machine); frames are only drawn while it is open
+PREVIEW_PORT = 8080
+PREVIEW_FPS = 5
+
 # GPIO setup
 RELAY_PIN = 17   # GPIO pin connected to the relay
 BUTTON_PIN = 18  # GPIO pin connected to the button
 GPIO.setmode(GPIO.BCM)  # Use BCM pin numbering
 GPIO.setup(RELAY_PIN, GPIO.OUT)  # Set relay pin as output
 GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)  # Set button pin as input with pull-up resistor
-GPIO.output(RELAY_PIN, GPIO.LOW)  # Ensure relay starts OFF
+RELAY_PULSE_SECONDS = 0.5  # How long the relay stays on after a detection
+
+# Pulses the relay from its own thread; starts with the relay OFF and enabled
+relay = actuator.Actuator(GPIO, RELAY_PIN, RELAY_PULSE_SECONDS)
 
 # Global state variables
-relay_enabled = True  # Controls whether the relay can be activated
-hornet_colors = {}
-next_hornet_id = 0
+hornets_in_view = False
+
+# Hornet ids by colour; an id not seen for REID_MAX_AGE seconds is dropped
+REID_MAX_AGE = 600
+reid = ColorReId(max_age=REID_MAX_AGE)
+
+# Skips the model on frames where nothing moves at the entrance
+gate = MotionGate(roi=ENTRANCE_ROI)
+
+# The running detection pipeline, so Ctrl+C on the event loop can stop it
+detection_pipeline = None
 
 # Load YOLO ONNX model
 model = YOLO("/home/on8ei/BeeSafe/Final_11/weights/best.pt")
 
-# Initialize Beesafe client
-if os.path.isfile(ID_FILE):
-    with open(ID_FILE) as f:
-        device_id = f.read().strip()
-        print(f"Using device id {device_id}")
-        client = beesafe.BeeSafeClient(URL, 0, 0, 0, device_id=device_id)
-else:
-    client = beesafe.BeeSafeClient(URL, 51.163000 + uniform(-0.01, 0.01), 4.989118 + uniform(-0.02, 0.02), 25)
+# Register the device, or reuse the id of an earlier run
+async def connect_client():
+    if os.path.isfile(ID_FILE):
+        with open(ID_FILE) as f:
+            device_id = f.read().strip()
+            print(f"Using device id {device_id}")
+            return await AsyncBeeSafeClient.create(URL, 0, 0, 0, device_id=device_id)
+    client = await AsyncBeeSafeClient.create(URL, 51.163000 + uniform(-0.01, 0.01), 4.989118 + uniform(-0.02, 0.02), 25)
     with open(ID_FILE, "w") as f:
         f.write(client.device_id)
+    return client
 
-# Define the function to send ping to the server
-def ping_server():
-    while True:
-        client.send_ping()
-        print("Sent ping to server.")
-        sleep(10)
+def read_frames(cap):
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+
+def run_inference(frame):
+    global hornets_in_view
+    # Keep running while hornets are in view, even if they sit still
+    if not gate.should_detect(frame, active=hornets_in_view):
+        return frame, None
+    results = model.predict(frame, imgsz=640, conf=0.5)
+    hornets_in_view = bool(results) and len(results[0].boxes) > 0
+    return frame, results
+
+def postprocess(item):
+    """
+    Identifies the hornets; returns the frame, a clip label if a hornet is
+    in it and the boxes, labels and colors for the preview.
+    """
+    frame, results = item
+
+    if results is None:
+        # skipped by the motion gate
+        return frame, None, ()
+
+    if not results or len(results[0].boxes) == 0:
+        print("⚠️ No detections in this frame.")
+        return frame, None, ()
+
+    label = None
+    overlay = ([], [], [])
+
+    for result in results:
+        boxes = result.boxes.cpu().numpy()
+        # All boxes of the frame at once
+        ids, features = reid.identify(frame, boxes.xyxy)
+        colors = dominant_color(features)
+
+        for xyxy, confidence, matched_id, detected_color in zip(boxes.xyxy, boxes.conf.tolist(), ids.tolist(),
+                                                                colors.tolist()):
+            # -1: re-identification could not tell who it is
+            name = f"Hornet {matched_id}" if matched_id >= 0 else "Unidentified hornet"
+            print(f"✅ Detected {name} | Color: {detected_color}")
+            if matched_id >= 0:
+                label = label or f"hornet{matched_id}"
+
+            overlay[0].append(xyxy)
+            overlay[1].append(f"{name}: {confidence:.2f}")
+            overlay[2].append((int(detected_color[0] * 1.4), int(detected_color[1] * 1.4), 255))
+
+            # Does not block; ignored while the relay is disabled
+            relay.trigger()
+
+    # a clip of unidentified hornets only is still recorded
+    return frame, label or "hornet", overlay
 
 # Define the function to process hornet detection
 def hornet_detection():
-    global next_hornet_id
+    global detection_pipeline
     # Open video capture
     video_path = "/home/on8ei/BeeSafe/GP047419 4m40 GOED - Trim (2).MP4"
     cap = cv2.VideoCapture(video_path)
 
-    # Get video properties
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-
-    # Define output video writer
-    output_path = "/home/on8ei/BeeSafe/hornet-177-02 captured.mp4"
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-
-    def extract_dominant_color(image, box):
-        x1, y1, x2, y2 = map(int, box)
-        if x2 <= x1 or y2 <= y1:  
-            return (60, 255)  
-        hornet_crop = image[y1:y2, x1:x2]
-        if hornet_crop.size == 0:
-            return (60, 255)
-        hsv_crop = cv2.cvtColor(hornet_crop, cv2.COLOR_BGR2HSV)
-        hist = cv2.calcHist([hsv_crop], [0, 1], None, [180, 256], [0, 180, 0, 256])
-        h, s = np.unravel_index(np.argmax(hist), hist.shape)
-        return (h, s)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break  
-
-        results = model.predict(frame, imgsz=640, conf=0.5)
-        
-        if not results or len(results[0].boxes) == 0:
-            print("⚠️ No detections in this frame.")
-            if not relay_enabled:
-                GPIO.output(RELAY_PIN, GPIO.LOW)
-            out.write(frame)
-            cv2.imshow("Hornet Detection", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-            continue  
-
-        for result in results:
-            boxes = result.boxes.cpu().numpy()
-
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                confidence = float(box.conf[0])  # Extract confidence score
-                detected_color = extract_dominant_color(frame, (x1, y1, x2, y2))
-
-                matched_id = None
-                for hornet_id, stored_color in hornet_colors.items():
-                    if euclidean(detected_color, stored_color) < 20:
-                        matched_id = hornet_id
-                        break
-
-                if matched_id is None:
-                    matched_id = next_hornet_id
-                    hornet_colors[matched_id] = detected_color
-                    next_hornet_id += 1
-
-                print(f"✅ Detected Hornet {matched_id} | Color: {detected_color}")
-
-                box_color = (int(detected_color[0] * 1.4), int(detected_color[1] * 1.4), 255)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), box_color, 2)
-                label = f"Hornet {matched_id}: {confidence:.2f}"
-                cv2.putText(frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, box_color, 2)
-
-                if relay_enabled:
-                    GPIO.output(RELAY_PIN, GPIO.HIGH)
-                    time.sleep(0.5)
-                    GPIO.output(RELAY_PIN, GPIO.LOW)
-                else:
-                    GPIO.output(RELAY_PIN, GPIO.HIGH)
-
-        out.write(frame)
-        cv2.imshow("Hornet Detection", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cap.release()
-    out.release()
-    cv2.destroyAllWindows()
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+
+    # Keeps the last seconds of frames in memory and writes clips around
+    # the detections from its own thread
+    recorder = ClipRecorder(CLIP_DIR, fps, CLIP_PRE_ROLL, CLIP_POST_ROLL, max_bytes=CLIP_QUOTA_BYTES)
+    # Draws and encodes the detections in its own threads, only while
+    # someone is watching
+    preview = PreviewServer(PREVIEW_PORT, max_fps=PREVIEW_FPS).start()
+    print(f"Preview on {preview.url}")
+
+    def write_output(item):
+        frame, label, overlay = item
+        recorder.add(frame)
+        if label is not None:
+            recorder.trigger(label=label)
+        preview.publish(frame, *overlay)
+
+    # Decoding runs in the source thread, inference, postprocessing and
+    # encoding each in their own stage so they overlap.
+    detection_pipeline = pipeline.Pipeline(read_frames(cap), [
+        pipeline.Stage("inference", run_inference, FRAME_QUEUE_SIZE, FRAME_POLICY),
+        pipeline.Stage("postprocess", postprocess, FRAME_QUEUE_SIZE),
+        pipeline.Stage("output", write_output, FRAME_QUEUE_SIZE),
+    ], log_interval=PIPELINE_LOG_INTERVAL)
+    try:
+        detection_pipeline.run()
+    finally:
+        # also when stopped early, so the clip being written is finished
+        # and the relay is not left on
+        cap.release()
+        recorder.close()
+        preview.stop()
+        relay.close()
+        relay.log_stats()
+        print(f"Motion gate: {gate.stats()}")
+        print(f"Re-identification: {reid.stats()}")
+        print(f"Clip recorder: {recorder.stats()}")
+        print(f"Preview: {preview.stats()}")
 
 # Define button callback for relay control
 def button_callback(channel):
-    global relay_enabled
-    relay_enabled = not relay_enabled
-    if not relay_enabled:
-        GPIO.output(RELAY_PIN, GPIO.LOW)  
+    relay_enabled = relay.toggle()
     print(f"Button pressed! Relay {'ENABLED' if relay_enabled else 'DISABLED'}.")
     time.sleep(0.2)
 
 # Set up event detection for the button
 GPIO.add_event_detect(BUTTON_PIN, GPIO.FALLING, callback=button_callback, bouncetime=300)
 
-def main():
-    ping_thread = Thread(target=ping_server)
-    hornet_thread = Thread(target=hornet_detection)
-
-    print('fgfg')
+async def run_device():
+    client = await connect_client()
+    # Detection events wait in DATA_DIR until the server has them
+    runtime = DeviceRuntime(client, outbox_path=default_outbox_path(DATA_DIR))
+    # The heartbeat runs on the event loop, the detection pipeline in the
+    # runtime's executor.
+    try:
+        await runtime.run(runtime.run_blocking(hornet_detection))
+    finally:
+        # Ctrl+C cancels the wait, not the executor thread: stop the
+        # pipeline so hornet_detection() returns and cleans up
+        if detection_pipeline is not None:
+            detection_pipeline.stop()
 
-    ping_thread.start()
-    hornet_thread.start()
-
-    ping_thread.join()
-    hornet_thread.join()
+def main():
+    # the pipeline, relay and runtime stats are logged at INFO
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    asyncio.run(run_device())
 
 if __name__ == '__main__':
     main()
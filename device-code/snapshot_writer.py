@@ -0,0 +1,190 @@
+# Saves one picture per hornet instead of one per frame. While a track is
+# alive, every detection of it is scored by its confidence and sharpness
+# and only the best crop (or frame) is kept, in memory; when the track ends
+# that one picture is encoded and written by a background thread. The
+# snapshots directory is kept under a size limit by deleting the oldest.
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from disk_quota import DiskQuota
+
+SNAPSHOT_PREFIX = 'hornet_'
+SNAPSHOT_EXT = '.jpg'
+
+
+def sharpness(image, size: int = 64) -> float:
+    """
+    Returns the variance of the Laplacian of a BGR image, scaled down to at
+    most ``size`` pixels on its longest side first so the cost does not
+    depend on the box. Blurred images score low.
+    """
+    h, w = image.shape[:2]
+    if h == 0 or w == 0:
+        return 0.
+    scale = min(1., size / max(h, w))
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if scale < 1.:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+class SnapshotWriter:
+    """
+    Keeps the best picture of every live track and writes it once, off the
+    detection loop, when the track ends. offer() costs a sharpness measure
+    and, for a better picture, a copy of it; nothing touches the disk until
+    end(), expire() or close().
+    """
+    def __init__(self, directory: str, crop: bool = True, margin: float = 0.25, max_width: int = None,
+                 quality: int = 90, max_bytes: int = 500 << 20, max_age: float = 2., half_sharpness: float = 20.):
+        """
+        :param str directory: Where the snapshots go, created if needed.
+        :param bool crop: Keep the box (with ``margin``) rather than the
+            whole frame.
+        :param float margin: The box is widened by this fraction of its
+            size on every side.
+        :param int max_width: (optional) snapshots wider than this are
+            scaled down before they are encoded.
+        :param int quality: The JPEG quality.
+        :param int max_bytes: The most bytes of snapshots kept in
+            ``directory``; the oldest are deleted to stay under it.
+        :param float max_age: expire() ends the tracks not offered for this
+            many seconds.
+        :param float half_sharpness: The sharpness (see sharpness()) that
+            counts half; a picture scores confidence * s / (s + this).
+        """
+        self.directory = directory
+        self.crop = crop
+        self.margin = margin
+        self.max_width = max_width
+        self.quality = quality
+        self.max_age = max_age
+        self.half_sharpness = half_sharpness
+        os.makedirs(directory, exist_ok=True)
+
+        # track id -> {'score', 'confidence', 'image', 'last_seen'}
+        self._best = {}
+        self._quota = DiskQuota(directory, max_bytes, SNAPSHOT_PREFIX, SNAPSHOT_EXT)
+        self._queue = queue.Queue()
+        self.offered = 0
+        self.replaced = 0
+        self.written = 0
+        self.bytes_written = 0
+        self.offer_seconds = 0.
+        self.encode_seconds = 0.
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def offer(self, track_id, frame, box, confidence: float, timestamp: float = None):
+        """
+        Scores a detection of a track and keeps it if it is the track's best
+        so far. Call it before drawing on the frame.
+
+        :param box: x1, y1, x2, y2 of the detection in pixels.
+        :param float timestamp: (optional) the time of the frame in seconds,
+            time.monotonic() by default.
+        """
+        start = time.perf_counter()
+        now = time.monotonic() if timestamp is None else timestamp
+        self.offered += 1
+        best = self._best.get(track_id)
+        if best is None:
+            best = self._best[track_id] = {'score': -1., 'image': None}
+        best['last_seen'] = now
+        # the sharpness term is at most 1, so a lower confidence cannot win
+        if confidence > best['score']:
+            h, w = frame.shape[:2]
+            x1, y1, x2, y2 = (float(v) for v in box[:4])
+            mx, my = (x2 - x1) * self.margin, (y2 - y1) * self.margin
+            region = frame[max(0, int(y1 - my)):min(h, int(y2 + my)), max(0, int(x1 - mx)):min(w, int(x2 + mx))]
+            s = sharpness(frame[max(0, int(y1)):min(h, int(y2)), max(0, int(x1)):min(w, int(x2))])
+            score = confidence * s / (s + self.half_sharpness)
+            if score > best['score'] and region.size:
+                image = region if self.crop else frame
+                if best['image'] is not None and best['image'].shape == image.shape:
+                    np.copyto(best['image'], image)
+                else:
+                    best['image'] = image.copy()
+                if best['score'] >= 0:
+                    self.replaced += 1
+                best['score'] = score
+                best['confidence'] = confidence
+        self.offer_seconds += time.perf_counter() - start
+
+    def end(self, track_id):
+        """
+        Ends a track: its best picture is queued for writing.
+        """
+        best = self._best.pop(track_id, None)
+        if best is not None and best['image'] is not None:
+            self._queue.put((track_id, best))
+
+    def expire(self, timestamp: float = None) -> int:
+        """
+        Ends the tracks not offered for max_age seconds before ``timestamp``
+        (time.monotonic() by default), for callers that do not know when a
+        track ends. Returns how many ended.
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        old = [track_id for track_id, best in self._best.items() if now - best['last_seen'] > self.max_age]
+        for track_id in old:
+            self.end(track_id)
+        return len(old)
+
+    def close(self):
+        """
+        Ends all tracks, writes their pictures and stops the writer thread.
+        """
+        for track_id in list(self._best):
+            self.end(track_id)
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            track_id, best = item
+            start = time.perf_counter()
+            image = best['image']
+            h, w = image.shape[:2]
+            if self.max_width and w > self.max_width:
+                image = cv2.resize(image, (self.max_width, max(1, int(round(h * self.max_width / w)))),
+                                   interpolation=cv2.INTER_AREA)
+            name = (f"{SNAPSHOT_PREFIX}{track_id}_{datetime.now():%Y%m%d-%H%M%S-%f}"
+                    f"_{best['confidence']:.2f}{SNAPSHOT_EXT}")
+            path = os.path.join(self.directory, name)
+            ok, data = cv2.imencode(SNAPSHOT_EXT, image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            try:
+                with open(path, 'wb') as f:
+                    f.write(data.tobytes())
+                self.bytes_written += self._quota.add(path)
+                self.written += 1
+            except OSError as e:
+                logging.warning(f"Snapshot writer: could not write {path}: {e}")
+            self.encode_seconds += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        """
+        Returns the detections offered, pictures replaced by a better one,
+        snapshots written and deleted for the quota, bytes written, live
+        tracks and the average cost of offer() and of writing a snapshot.
+        """
+        return {
+            'offered': self.offered,
+            'replaced': self.replaced,
+            'written': self.written,
+            'deleted': self._quota.deleted,
+            'bytes_written': self.bytes_written,
+            'live': len(self._best),
+            'offer_ms': self.offer_seconds / self.offered * 1000 if self.offered else 0.,
+            'encode_ms': self.encode_seconds / self.written * 1000 if self.written else 0.,
+        }
@@ -0,0 +1,215 @@
+# Runs the detector only on the parts of a high-resolution frame where
+# something is happening (motion blobs, the boxes of live tracks) instead
+# of scaling the whole frame down to the model input. The regions are
+# covered with square tiles cut from the frame at (close to) native
+# resolution, all tiles go through the model in one batch, and the boxes
+# are merged back into frame pixels with NMS across tiles. Small hornets
+# keep their pixels and empty background costs nothing.
+import cv2
+import numpy as np
+
+from onnx_detector import decode, class_nms, PAD_VALUE
+
+# A box this close to a tile edge inside the frame may be cut off
+EDGE_TOLERANCE = 2
+# The share of a cut box that has to lie inside a whole box to drop it
+CUT_OVERLAP = 0.5
+
+
+def plan_tiles(regions, frame_shape, tile, margin=32, overlap=64):
+    """
+    Returns the top-left corners, as an (N, 2) int array, of square tiles of
+    ``tile`` frame pixels that together cover every region grown by
+    ``margin``. Regions that fit in one tile together share it; a region
+    larger than a tile is covered by a grid of tiles overlapping by
+    ``overlap`` pixels.
+    """
+    h, w = frame_shape[:2]
+    tw, th = min(tile, w), min(tile, h)
+    if len(regions) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    boxes = np.asarray(regions, dtype=float)[:, :4] + (-margin, -margin, margin, margin)
+    boxes = np.clip(boxes, 0, [w, h, w, h])
+
+    clusters = []
+    for box in boxes[np.argsort(boxes[:, 0], kind='stable')]:
+        for cluster in clusters:
+            union = np.concatenate([np.minimum(cluster[:2], box[:2]), np.maximum(cluster[2:], box[2:])])
+            if union[2] - union[0] <= tw and union[3] - union[1] <= th:
+                cluster[:] = union
+                break
+        else:
+            clusters.append(box.copy())
+
+    origins = []
+    for x1, y1, x2, y2 in clusters:
+        xs = _starts(x1, x2, tw, w, overlap)
+        ys = _starts(y1, y2, th, h, overlap)
+        origins += [(x, y) for y in ys for x in xs]
+    return np.unique(np.array(origins, dtype=np.int64), axis=0)
+
+
+def _starts(lo, hi, size, limit, overlap):
+    if hi - lo <= size:
+        # centred on the region, shifted back inside the frame
+        return [int(np.clip(round((lo + hi - size) / 2), 0, limit - size))]
+    step = size - overlap
+    starts = list(range(int(lo), int(hi) - size, step)) + [int(hi) - size]
+    return [int(np.clip(s, 0, limit - size)) for s in starts]
+
+
+class TiledDetector:
+    """
+    Tiled inference with an OnnxDetector. Exporting the model with a
+    dynamic batch (``model.export(format="onnx", dynamic=True)``) lets all
+    tiles of a frame run in one call; a model with a fixed batch of 1 runs
+    them one after the other.
+    """
+    def __init__(self, detector, tile: int = None, margin: int = 32, overlap: int = 64, max_tiles: int = 4,
+                 fallback=None):
+        """
+        :param detector: The OnnxDetector run on the tiles.
+        :param int tile: (optional) the tile side in frame pixels, the
+            model input size by default so tiles are not scaled at all. A
+            larger tile is scaled down to the input.
+        :param int margin: Pixels added around every region, so a hornet
+            that moved since its box was taken is still inside the tile.
+        :param int overlap: The overlap of the tiles covering a region
+            larger than one tile.
+        :param int max_tiles: When the regions need more tiles than this,
+            the whole frame is run through ``fallback`` instead.
+        :param fallback: (optional) the detector for the whole frame, e.g.
+            one with a larger input; ``detector`` by default.
+        """
+        self.detector = detector
+        self.fallback = fallback or detector
+        self.input_size = detector.input_size
+        self.tile = tile or min(self.input_size)
+        self.margin = margin
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+
+        model_input = detector.session.get_inputs()[0]
+        self._input_name = model_input.name
+        batch = model_input.shape[0]
+        self._batch = batch if isinstance(batch, int) else None
+        height, width = self.input_size
+        # whole batches, for a model with a fixed batch larger than 1
+        rows = -(-max_tiles // self._batch) * self._batch if self._batch else max_tiles
+        self._input = np.empty((rows, 3, height, width), dtype=np.float32)
+        self._canvas = np.full((height, width, 3), PAD_VALUE, dtype=np.uint8)
+        self._canvas_size = None
+
+        self.frames = 0
+        self.tiles = 0
+        self.full_frames = 0
+        self.pixels = 0
+
+    def detect(self, frame, regions) -> np.ndarray:
+        """
+        Returns the detections inside ``regions`` of a BGR frame as an Nx6
+        float32 array of [x1, y1, x2, y2, confidence, class] in frame
+        pixels, highest confidence first.
+
+        :param frame: The BGR frame.
+        :param regions: [[x1,y1,x2,y2],...] where hornets may be, e.g.
+            MotionGate.motion_boxes() and the boxes of the live tracks.
+            Nothing is detected outside them.
+        """
+        self.frames += 1
+        origins = plan_tiles(regions, frame.shape, self.tile, self.margin, self.overlap)
+        if len(origins) == 0:
+            return np.empty((0, 6), dtype=np.float32)
+        if len(origins) > self.max_tiles:
+            self.full_frames += 1
+            self.pixels += int(np.prod(self.fallback.input_size))
+            return self.fallback.detect(frame)
+
+        h, w = frame.shape[:2]
+        tw, th = min(self.tile, w), min(self.tile, h)
+        scale = min(self.input_size) / self.tile
+        size = (int(round(tw * scale)), int(round(th * scale)))
+        for k, (x, y) in enumerate(origins):
+            crop = frame[y:y + th, x:x + tw]
+            if size == (tw, th) and crop.shape[:2] == self._canvas.shape[:2]:
+                canvas = crop
+            else:
+                canvas = self._canvas
+                if self._canvas_size != size:
+                    # what the last size left outside this one
+                    canvas[:] = PAD_VALUE
+                    self._canvas_size = size
+                cv2.resize(crop, size, dst=canvas[:size[1], :size[0]], interpolation=cv2.INTER_LINEAR)
+            # BGR to RGB, HWC to CHW and scaled to [0, 1], as OnnxDetector does
+            np.multiply(canvas.transpose(2, 0, 1)[::-1], np.float32(1 / 255.), out=self._input[k])
+        predictions = self._run(len(origins))
+        self.tiles += len(origins)
+        self.pixels += len(origins) * int(np.prod(self.input_size))
+
+        detector = self.detector
+        parts, cut = [], []
+        for (x, y), prediction in zip(origins, predictions):
+            detections = decode(prediction, detector.conf, detector.iou, detector.max_det)
+            detections[:, :4] /= scale
+            detections[:, :4] += (x, y, x, y)
+            parts.append(detections)
+            cut.append(self._touches_inner_edge(detections, x, y, tw, th, w, h))
+        # merged before clipping, as OnnxDetector clips after its NMS:
+        # clipped boxes at the frame edge overlap more and would suppress
+        # each other
+        detections = self._merge(np.concatenate(parts), np.concatenate(cut))
+        np.clip(detections[:, 0:4:2], 0, w, out=detections[:, 0:4:2])
+        np.clip(detections[:, 1:4:2], 0, h, out=detections[:, 1:4:2])
+        # boxes in a tile's padding can be empty once clipped to the frame
+        keep = (detections[:, 2] > detections[:, 0]) & (detections[:, 3] > detections[:, 1])
+        return detections[keep]
+
+    def _run(self, n):
+        batch = self._input[:n]
+        if self._batch is None:
+            return self.detector.session.run(None, {self._input_name: batch})[0]
+        outputs = []
+        for start in range(0, n, self._batch):
+            chunk = self._input[start:start + self._batch]
+            outputs.append(self.detector.session.run(None, {self._input_name: chunk})[0])
+        return np.concatenate(outputs)[:n]
+
+    @staticmethod
+    def _touches_inner_edge(detections, x, y, tw, th, w, h):
+        boxes = detections[:, :4]
+        return (((boxes[:, 0] <= x + EDGE_TOLERANCE) & (x > 0))
+                | ((boxes[:, 1] <= y + EDGE_TOLERANCE) & (y > 0))
+                | ((boxes[:, 2] >= x + tw - EDGE_TOLERANCE) & (x + tw < w))
+                | ((boxes[:, 3] >= y + th - EDGE_TOLERANCE) & (y + th < h)))
+
+    def _merge(self, detections, cut):
+        """
+        NMS across tiles. A box cut off by the edge of its tile is dropped
+        when most of it lies inside a whole box from another tile, since
+        the two rarely overlap enough for NMS.
+        """
+        whole, partial = detections[~cut], detections[cut]
+        if len(partial) and len(whole):
+            ix1 = np.maximum(partial[:, None, 0], whole[None, :, 0])
+            iy1 = np.maximum(partial[:, None, 1], whole[None, :, 1])
+            ix2 = np.minimum(partial[:, None, 2], whole[None, :, 2])
+            iy2 = np.minimum(partial[:, None, 3], whole[None, :, 3])
+            inter = np.maximum(0., ix2 - ix1) * np.maximum(0., iy2 - iy1)
+            area = (partial[:, 2] - partial[:, 0]) * (partial[:, 3] - partial[:, 1])
+            same_class = partial[:, None, 5] == whole[None, :, 5]
+            covered = ((inter / np.maximum(area[:, None], 1e-7)) * same_class).max(axis=1) > CUT_OVERLAP
+            partial = partial[~covered]
+        return class_nms(np.concatenate([whole, partial]), self.detector.iou, self.detector.max_det)
+
+    def stats(self) -> dict:
+        """
+        Returns the frames seen, the average number of tiles per frame, how
+        often the whole frame was run instead, and the average number of
+        model input pixels per frame.
+        """
+        return {
+            'frames': self.frames,
+            'tiles_per_frame': self.tiles / self.frames if self.frames else 0.,
+            'full_frames': self.full_frames,
+            'pixels_per_frame': self.pixels / self.frames if self.frames else 0.,
+        }
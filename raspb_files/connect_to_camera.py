@@ -1,5 +1,9 @@
 import cv2
 from ultralytics import YOLO
+# device-code/, where the modules below live, on the import path
+import repo_paths  # noqa: F401
+from snapshot_writer import SnapshotWriter
+from preview_server import PreviewServer
 
 # Load YOLO ONNX model
 model = YOLO("/home/on8ei/BeeSafe/best.onnx")
@@ -11,50 +15,63 @@ if not cap.isOpened():
     print("❌ Error: Could not open camera.")
     exit()
 
-frame_count = 0
+# The best frame of every visit (hornets in view until none is seen for
+# 2 s), scored by confidence and sharpness and written from a background
+# thread when the visit ends, instead of every frame with a hornet
+snapshots = SnapshotWriter("/home/on8ei/BeeSafe", crop=False, max_age=2, quality=90, max_bytes=500 << 20)
+visit = 0
 
+# Instead of cv2.imshow, which does not work over SSH: the detections on
+# http://localhost:8080, through ssh -L 8080:localhost:8080 from another
+# machine. Ctrl+C stops.
+preview = PreviewServer(8080, max_fps=5, max_width=640).start()
+print(f"Preview on {preview.url}")
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("❌ Error: Failed to capture frame.")
-        break
+try:
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            print("❌ Error: Failed to capture frame.")
+            break
 
-    # Run YOLO inference
-    results = model.predict(frame, imgsz=640, conf=0.5)  # Lower confidence to detect more
+        # Run YOLO inference
+        results = model.predict(frame, imgsz=640, conf=0.5)  # Lower confidence to detect more
 
-    hornet_detected = False  # Track if hornet is found in this frame
+        hornets = []  # Hornets found in this frame
 
-    print(f"📢 Raw Model Output: {results}")  # Debugging: Print detection output
+        print(f"📢 Raw Model Output: {results}")  # Debugging: Print detection output
 
-    for result in results:
-        for box in result.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            confidence = float(box.conf[0])
-            class_id = int(box.cls[0])
+        for result in results:
+            for box in result.boxes:
+                x1, y1, x2, y2 = box.xyxy[0].tolist()
+                confidence = float(box.conf[0])
+                class_id = int(box.cls[0])
 
-            print(f"🟢 Detection: x1={x1}, y1={y1}, x2={x2}, y2={y2}, conf={confidence}, class={class_id}")
+                print(f"🟢 Detection: x1={x1}, y1={y1}, x2={x2}, y2={y2}, conf={confidence}, class={class_id}")
 
-            if class_id == 0 and confidence > 0.1:  # Lowered confidence
-                hornet_detected = True
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                label = f"Hornet: {confidence:.2f}"
-                cv2.putText(frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                if class_id == 0 and confidence > 0.1:  # Lowered confidence
+                    hornets.append((x1, y1, x2, y2, confidence))
 
-    if hornet_detected:
-        frame_path = f"/home/on8ei/BeeSafe/detected_frame_{frame_count}.jpg"
-        cv2.imwrite(frame_path, frame)
+        # A visit ends once no hornet was seen for a while; its snapshot is written
+        if snapshots.expire():
+            visit += 1
 
-        print(f"✅ Hornet detected! Frame saved: {frame_path}")
-        frame_count += 1
+        # Keeps the best frame of the visit
+        for x1, y1, x2, y2, confidence in hornets:
+            snapshots.offer(visit, frame, (x1, y1, x2, y2), confidence)
 
-    # **REMOVE `cv2.imshow()` due to SSH issues**
-    cv2.imshow("Hornet Detection", frame)  
+        if hornets:
+            print(f"✅ Hornet detected! Visit {visit}")
 
-    # Press 'q' to exit
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+        # Drawn in the preview's thread, and only while someone is watching
+        if preview.watching:
+            preview.publish(frame, hornets, [f"Hornet: {confidence:.2f}" for *_, confidence in hornets])
+except KeyboardInterrupt:
+    pass
 
 cap.release()
-cv2.destroyAllWindows()
+snapshots.close()
+preview.stop()
 print("📌 Camera stream stopped.")
+print(f"Snapshots: {snapshots.stats()}")
+print(f"Preview: {preview.stats()}")
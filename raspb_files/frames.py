@@ -1,38 +1,256 @@
-import cv2
+#!/usr/bin/env python3
+#
+# Samples frames from long videos, e.g. to build a training set from hours
+# of footage. The frames to keep are given explicitly: every --every-ms
+# milliseconds, every --stride-th frame, or at --times. Frames in between
+# are skipped with grab(), which does not convert or copy them, and long
+# gaps are crossed with a seek instead. The targets are split into time
+# ranges that --workers processes handle in parallel.
+#
+# The frames go to a store in OUT (the default): chunk files of encoded
+# images written back to back, and an index with the frame number, time
+# and location of every image (read it with SampleStore). With --jpeg-dir
+# they are written as OUT/frame_{number}.jpg files instead.
+#
+# usage: frames.py VIDEO OUT [--every-ms 1000 | --stride 30 | --times 1.5 20 ...]
+#                  [--start 0] [--end SECONDS] [--workers 4] [--quality 95] [--jpeg-dir]
+
+import argparse
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# Where every image of a store is: its frame number (from 0) and time in
+# the video, and the chunk, offset and length of its encoded bytes
+INDEX_DTYPE = np.dtype([('frame', '<i8'), ('time_ms', '<f8'), ('chunk', '<u4'),
+                        ('offset', '<u8'), ('length', '<u4')])
+
+CHUNK_BYTES = 64 << 20
+
 
-# Video file path
-video_path = "C:/Users/aykaq/Downloads/Hornet_detection_20-01/videos hornets/GP047420v1 - Trim.MP4"
+def target_frames(fps, n_frames, every_ms=None, stride=None, times=None, start=0., end=None):
+    """
+    Returns the sorted, unique frame numbers (from 0) to keep, between
+    ``start`` and ``end`` seconds: the frames nearest to every ``every_ms``
+    milliseconds, every ``stride``-th frame, or the frames nearest to the
+    ``times`` in seconds.
+    """
+    first = int(round(start * fps))
+    last = n_frames if end is None else min(n_frames, int(round(end * fps)) + 1)
+    if times is not None:
+        frames = np.round(np.asarray(times, dtype=float) * fps).astype(np.int64)
+    elif stride is not None:
+        frames = np.arange(first, last, stride)
+    else:
+        step = every_ms / 1000. * fps
+        frames = np.round(first + np.arange(0, max(last - first, 0) / step) * step).astype(np.int64)
+    frames = np.unique(frames)
+    return frames[(frames >= first) & (frames < last)]
 
-# Output directory for frames
-output_dir = "frames"
-os.makedirs(output_dir, exist_ok=True)
 
-# Load video
-cap = cv2.VideoCapture(video_path)
-fps = cap.get(cv2.CAP_PROP_FPS)  # Get frames per second
-frame_time = 1000 / fps  # Time per frame in milliseconds
+def split_ranges(frames, parts):
+    """
+    Splits sorted frame numbers into at most ``parts`` contiguous groups
+    spanning equal stretches of the video.
+    """
+    if len(frames) == 0:
+        return []
+    bounds = np.linspace(frames[0], frames[-1] + 1, parts + 1)
+    cuts = np.searchsorted(frames, bounds[1:-1])
+    return [group for group in np.split(frames, cuts) if len(group)]
 
-# Set extraction interval (e.g., 1 ms or 5 ms)
-interval_ms = 5  # Change to 1 for every millisecond
 
-# Process frames
-frame_count = 0
-while cap.isOpened():
-    current_time = frame_count * frame_time  # Current time in ms
-    if current_time % interval_ms == 0:
+def read_targets(cap, frames, seek_after):
+    """
+    Yields (frame number, frame) for the sorted ``frames`` of an open
+    capture. Gaps of up to ``seek_after`` frames are skipped with grab(),
+    longer ones with a seek.
+    """
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    for target in frames:
+        if target < position or target - position > seek_after:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(target))
+            position = int(target)
+        while position < target:
+            if not cap.grab():
+                return
+            position += 1
         ret, frame = cap.read()
         if not ret:
-            break
-        frame_filename = os.path.join(output_dir, f"frame_{frame_count}.jpg")
-        cv2.imwrite(frame_filename, frame)
-        
-        # Print progress in the terminal
-        print(f"Processed frame {frame_count} at {current_time:.2f} ms")
+            return
+        position += 1
+        yield int(target), frame
+
+
+class ChunkWriter:
+    """
+    Appends encoded images to chunk files of about ``chunk_bytes`` and
+    keeps their index rows.
+    """
+    def __init__(self, directory, prefix, chunk_bytes=CHUNK_BYTES):
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk_bytes = chunk_bytes
+        self.chunks = []
+        self.rows = []
+        self._file = None
+
+    def add(self, frame_number, time_ms, data):
+        if self._file is None or self._file.tell() + len(data) > self.chunk_bytes:
+            self._next_chunk()
+        self.rows.append((frame_number, time_ms, len(self.chunks) - 1, self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def _next_chunk(self):
+        if self._file is not None:
+            self._file.close()
+        name = f"{self.prefix}-{len(self.chunks):05d}.bin"
+        self.chunks.append(name)
+        self._file = open(os.path.join(self.directory, name), 'wb')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def sample_range(job):
+    """
+    Reads the frames of one time range in a worker process and writes
+    them. Returns the chunk names and index rows it wrote, and the number
+    of frames read.
+    """
+    cap = cv2.VideoCapture(job['video'])
+    fps = job['fps']
+    params = [cv2.IMWRITE_JPEG_QUALITY, job['quality']] if job['ext'] == '.jpg' else []
+    writer = None if job['jpeg_dir'] else ChunkWriter(job['out'], f"part{job['part']:03d}")
+    count = 0
+    try:
+        for number, frame in read_targets(cap, job['frames'], job['seek_after']):
+            time_ms = number * 1000. / fps
+            if writer is None:
+                cv2.imwrite(os.path.join(job['out'], f"frame_{number}{job['ext']}"), frame, params)
+            else:
+                ok, data = cv2.imencode(job['ext'], frame, params)
+                writer.add(number, time_ms, data.tobytes())
+            count += 1
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return [], [], count
+    return writer.chunks, writer.rows, count
+
+
+class SampleStore:
+    """
+    Reads a store written by sample_video(). The chunks are memory-mapped,
+    so an image is read straight from the page cache.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.index = np.load(os.path.join(path, 'index.npy'))
+        self._chunks = [np.memmap(os.path.join(path, name), dtype=np.uint8, mode='r')
+                        for name in self.meta['chunks']]
+
+    def __len__(self):
+        return len(self.index)
+
+    def encoded(self, i):
+        """
+        Returns the encoded bytes of image ``i`` as a uint8 array view.
+        """
+        row = self.index[i]
+        return self._chunks[row['chunk']][row['offset']:row['offset'] + row['length']]
+
+    def __getitem__(self, i):
+        """
+        Returns image ``i`` decoded to a BGR array.
+        """
+        return cv2.imdecode(self.encoded(i), cv2.IMREAD_COLOR)
+
+    def find(self, frame_number):
+        """
+        Returns the position in the store of a frame number, or None.
+        """
+        i = int(np.searchsorted(self.index['frame'], frame_number))
+        if i < len(self.index) and self.index['frame'][i] == frame_number:
+            return i
+        return None
+
+
+def sample_video(video, out, every_ms=None, stride=None, times=None, start=0., end=None, workers=1,
+                 quality=95, ext='.jpg', jpeg_dir=False, seek_after=None):
+    """
+    Samples the frames of ``video`` given by the targets (see
+    target_frames) into ``out`` with ``workers`` processes. Returns the
+    number of frames written.
+
+    :param int seek_after: (optional) the longest gap in frames crossed
+        with grab() rather than a seek; two seconds of video by default.
+    """
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+    if not fps or not n_frames:
+        raise ValueError(f"Cannot read {video}")
+    if every_ms is None and stride is None and times is None:
+        every_ms = 1000.
+    frames = target_frames(fps, n_frames, every_ms, stride, times, start, end)
+    os.makedirs(out, exist_ok=True)
+
+    jobs = [{'video': video, 'fps': fps, 'frames': group, 'part': part, 'out': out, 'quality': quality,
+             'ext': ext, 'jpeg_dir': jpeg_dir, 'seek_after': seek_after or int(2 * fps)}
+            for part, group in enumerate(split_ranges(frames, workers))]
+    with ProcessPoolExecutor(max(1, min(workers, len(jobs)))) as pool:
+        results = list(pool.map(sample_range, jobs))
+
+    count = sum(result[2] for result in results)
+    if not jpeg_dir:
+        chunks, rows = [], []
+        for part_chunks, part_rows, _ in results:
+            rows += [(frame, time_ms, chunk + len(chunks), offset, length)
+                     for frame, time_ms, chunk, offset, length in part_rows]
+            chunks += part_chunks
+        np.save(os.path.join(out, 'index.npy'), np.array(rows, dtype=INDEX_DTYPE))
+        with open(os.path.join(out, 'meta.json'), 'w') as f:
+            json.dump({'video': os.path.abspath(video), 'fps': fps, 'size': size, 'format': ext,
+                       'chunks': chunks, 'frames': count}, f, indent=1)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Video frame sampler")
+    parser.add_argument("video")
+    parser.add_argument("out", help="The store directory, or the directory for the images with --jpeg-dir.")
+    targets = parser.add_mutually_exclusive_group()
+    targets.add_argument("--every-ms", type=float, help="Keep a frame every this many milliseconds (default 1000).")
+    targets.add_argument("--stride", type=int, help="Keep every this many-th frame.")
+    targets.add_argument("--times", type=float, nargs="+", help="Keep the frames at these times in seconds.")
+    parser.add_argument("--start", type=float, default=0., help="Start time in seconds.")
+    parser.add_argument("--end", type=float, help="End time in seconds.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality.")
+    parser.add_argument("--png", action="store_true", help="Store lossless PNG instead of JPEG.")
+    parser.add_argument("--jpeg-dir", action="store_true", help="Write one image file per frame.")
+    parser.add_argument("--seek-after", type=int, help="Longest gap in frames skipped with grab() instead of a seek.")
+    args = parser.parse_args()
 
-    frame_count += 1
+    start = time.perf_counter()
+    count = sample_video(args.video, args.out, args.every_ms, args.stride, args.times, args.start, args.end,
+                         args.workers, args.quality, '.png' if args.png else '.jpg', args.jpeg_dir,
+                         args.seek_after)
+    seconds = time.perf_counter() - start
+    print(f"{count} frames saved in '{args.out}' in {seconds:.1f} s ({count / max(seconds, 1e-9):.1f} frames/s)")
 
-cap.release()
-cv2.destroyAllWindows()
 
-print(f"\nFrames saved in '{output_dir}'")
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
-from ultralytics import YOLO
+# device-code/, where the modules below live, on the import path
+import repo_paths  # noqa: F401
+from onnx_detector import OnnxDetector
 import cv2
 
-# Load the YOLO ONNX model
-model = YOLO("/home/on8ei/BeeSafe/best.onnx")  # Load ONNX model using YOLO
+# Load the YOLO ONNX model in onnxruntime, without torch
+model = OnnxDetector("/home/on8ei/BeeSafe/best.onnx", conf=0.3)
 
 # Open the video
 video_path = "/home/on8ei/BeeSafe/hornet 1 cropped.mp4"
@@ -29,12 +31,10 @@ while cap.isOpened():
     print(f"Processing frame {frame_count}...")
 
     # Run YOLO inference
-    results = model.predict(frame, imgsz=640, conf=0.3)  # Predict on frame
+    detections = model.detect(frame)  # Nx6: x1, y1, x2, y2, confidence, class
 
-    for box in results[0].boxes:  # Loop through detected objects
-        x1, y1, x2, y2 = box.xyxy[0].tolist()  # Get bounding box coordinates
-        confidence = float(box.conf[0])  # Get confidence score
-        class_id = int(box.cls[0])  # Get class ID
+    for x1, y1, x2, y2, confidence, class_id in detections.tolist():  # Loop through detected objects
+        class_id = int(class_id)  # Get class ID
         print(f"Detection: x1={x1}, y1={y1}, x2={x2}, y2={y2}, confidence={confidence}, class_id={class_id}")
 
         # Draw bounding box
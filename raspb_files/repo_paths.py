@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+#
+# Puts the repository's source folders on the import path, so the scripts
+# in device-code/, YOLO/ and raspb_files/ can import each other's modules
+# when run from their own folder (python3 script.py), without PYTHONPATH.
+# Import it before the modules of another folder:
+#   import repo_paths  # noqa: F401
+# The folders are appended, so a script's own folder still comes first.
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FOLDERS = ('device-code', 'YOLO')
+
+for folder in FOLDERS:
+    path = os.path.join(ROOT, folder)
+    if path not in sys.path:
+        sys.path.append(path)
@@ -1,10 +1,27 @@
+import time
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from scipy.spatial.distance import euclidean
-
-# Load YOLO ONNX model
-model = YOLO("/home/on8ei/BeeSafe/best.onnx")  # Load ONNX model
+# device-code/, where the modules below live, on the import path
+import repo_paths  # noqa: F401
+from onnx_detector import OnnxDetector
+from motion_gate import MotionGate
+from tiled_detector import TiledDetector
+from color_reid import ColorReId, dominant_color
+from clip_recorder import ClipRecorder
+from snapshot_writer import SnapshotWriter
+from preview_server import PreviewServer
+
+# Load YOLO ONNX model in onnxruntime, without torch
+model = OnnxDetector("/home/on8ei/BeeSafe/best.onnx", conf=0.1)
+
+# Only look where something moves or a hornet was in the last frame, in a
+# 640x640 tile cut from the frame at full resolution instead of the whole
+# frame scaled down to 640. When the regions do not fit in one tile the
+# whole frame is used as before. Set to False to always use the whole frame.
+TILED = True
+tiles = TiledDetector(model, max_tiles=1)
+gate = MotionGate()
+last_boxes = np.empty((0, 4))
 
 # Open camera (use 0, 1, or 2 depending on your camera index)
 cap = cv2.VideoCapture(0)  # Change to 1 or 2 if needed
@@ -13,95 +30,85 @@ cap = cv2.VideoCapture(0)  # Change to 1 or 2 if needed
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
 
-# Storage for hornet colors & re-identification
-hornet_colors = {}
-next_hornet_id = 0  # ID counter for new hornets
-
-def extract_dominant_color(image, box):
-    """Extracts dominant color from the detected hornet region."""
-    x1, y1, x2, y2 = map(int, box)
-
-    # Ensure the bounding box is valid
-    if x2 <= x1 or y2 <= y1:
-        return None  
-
-    hornet_crop = image[y1:y2, x1:x2]
-
-    # If crop is empty, return a default color
-    if hornet_crop.size == 0:
-        return None  
-
-    # Convert to HSV color space
-    hsv_crop = cv2.cvtColor(hornet_crop, cv2.COLOR_BGR2HSV)
-
-    # Compute **mean HSV** (instead of just histogram max)
-    mean_color = np.mean(hsv_crop, axis=(0, 1))
-
-    return (int(mean_color[0]), int(mean_color[1]))  # Keep Hue & Saturation only
-
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        print("⚠️ Camera not detected. Check connection.")
-        break  
-
-    # Run YOLO inference
-    results = model.predict(frame, imgsz=640, conf=0.1)
-
-    for result in results:
-        boxes = result.boxes.cpu().numpy()
-
-        for box in boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            confidence = float(box.conf[0])
-            class_id = int(box.cls[0])
-
-            # Extract dominant color of the detected hornet
-            detected_color = extract_dominant_color(frame, (x1, y1, x2, y2))
-
-            if detected_color:
-                matched_id = None
-
-                # **Re-identify hornets based on color similarity**
-                for hornet_id, stored_color in hornet_colors.items():
-                    if euclidean(detected_color, stored_color) < 30:  # Looser threshold
-                        matched_id = hornet_id
-                        break
-
-                # If no match, assign a new ID
-                if matched_id is None:
-                    matched_id = next_hornet_id
-                    hornet_colors[matched_id] = detected_color
-                    next_hornet_id += 1
-
-                print(f"✅ Detected Hornet {matched_id} | Color: {detected_color}")
-
-                # Convert HSV to BGR for display
-                box_color = cv2.cvtColor(
-                    np.uint8([[[detected_color[0], detected_color[1], 255]]]),
-                    cv2.COLOR_HSV2BGR)[0][0]
-                box_color = tuple(int(c) for c in box_color)
-
-                # Draw bounding box & label
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), box_color, 2)
-                label = f"Hornet {matched_id}: {confidence:.2f}"
-                cv2.putText(frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, box_color, 2)
-
-                # Save frame when a hornet is detected
-                frame_name = f"/home/on8ei/BeeSafe/detections/hornet_{matched_id}.jpg"
-                cv2.imwrite(frame_name, frame)
-
-      # **Save frame only if a hornet was detected**
-
-    # **Show detections while running**
-    cv2.imshow("Hornet Detection Live", frame)
-
-    # Press 'q' to exit
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+# Re-identification by colour; an id not seen for 10 minutes is dropped.
+# Looser than the default distance, the camera's colours vary more.
+reid = ColorReId(max_distance=0.6, max_age=600)
+
+# Clips from 2 s before a hornet to 3 s after, at about the rate this loop
+# runs with the model. Live: the loop never waits for the encoder.
+CLIP_FPS = 10
+recorder = ClipRecorder("/home/on8ei/BeeSafe/clips", CLIP_FPS, pre_roll=2, post_roll=3, max_bytes=2 << 30,
+                        block=False)
+
+# The sharpest, most confident crop of every hornet, written from a
+# background thread once it has not been seen for 2 s
+snapshots = SnapshotWriter("/home/on8ei/BeeSafe/detections", max_age=2, quality=90, max_bytes=500 << 20)
+
+# Live view on http://localhost:8080 (ssh -L 8080:localhost:8080 from
+# another machine), 5 frames a second at most, drawn and encoded in the
+# preview's own thread and only while someone is watching
+preview = PreviewServer(8080, max_fps=5, max_width=640).start()
+print(f"Preview on {preview.url}, Ctrl+C to stop")
+
+try:
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            print("⚠️ Camera not detected. Check connection.")
+            break  
+
+        # Run YOLO inference
+        if TILED:
+            gate.motion(frame)
+            regions = np.concatenate([gate.motion_boxes(), last_boxes])
+            detections = tiles.detect(frame, regions)  # Nx6: x1, y1, x2, y2, confidence, class
+        else:
+            detections = model.detect(frame)  # Nx6: x1, y1, x2, y2, confidence, class
+        last_boxes = detections[:, :4]
+
+        # Colors and ids of all detected hornets at once
+        now = time.monotonic()
+        ids, features = reid.identify(frame, detections, now)
+        colors = dominant_color(features)
+
+        # Only keeps the best crop
+        for (x1, y1, x2, y2, confidence, class_id), matched_id in zip(detections.tolist(), ids.tolist()):
+            if matched_id >= 0:
+                snapshots.offer(matched_id, frame, (x1, y1, x2, y2), confidence, now)
+        snapshots.expire(now)
+
+        for matched_id, detected_color in zip(ids.tolist(), colors.tolist()):
+            if matched_id >= 0:
+                print(f"✅ Detected Hornet {matched_id} | Color: {tuple(detected_color)}")
+
+        # Keep the frame for the clips; one with a hornet opens or extends a clip
+        recorder.add(frame, now)
+        if (ids >= 0).any():
+            recorder.trigger(now, label=f"hornet{ids[ids >= 0][0]}")
+
+        # The boxes and labels are only made up while the preview is open
+        if preview.watching:
+            found = ids >= 0
+            # HSV to BGR for display
+            box_colors = cv2.cvtColor(np.uint8([[(h, s, 255) for h, s in colors[found].tolist()]]),
+                                      cv2.COLOR_HSV2BGR)[0] if found.any() else []
+            preview.publish(frame, detections[found],
+                            [f"Hornet {matched_id}: {confidence:.2f}"
+                             for matched_id, confidence in zip(ids[found].tolist(), detections[found, 4].tolist())],
+                            box_colors)
+except KeyboardInterrupt:
+    pass
 
 # Release resources
 cap.release()
-cv2.destroyAllWindows()
+recorder.close()
+snapshots.close()
+preview.stop()
 
 print("✅ Live detection stopped. All detected hornet images saved.")
+if TILED:
+    print(f"Tiled inference: {tiles.stats()}")
+print(f"Re-identification: {reid.stats()}")
+print(f"Clip recorder: {recorder.stats()}")
+print(f"Snapshots: {snapshots.stats()}")
+print(f"Preview: {preview.stats()}")